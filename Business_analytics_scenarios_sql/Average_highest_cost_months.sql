@@ -1,14 +1,14 @@
 --Which months produce the average highest cost of sales typically?
+--The month of the rollup is a number, taken from the typed sale_timestamp of dim_date_times, and is null
+--for the sales whose date has no timestamp
 SELECT 
-    dim_date_times.month,
-    SUM(product_price * product_quantity) AS total_sales
+    month,
+    SUM(total_sales) AS total_sales
 FROM 
-    dim_products
-INNER JOIN
-    orders_table ON dim_products.product_code = orders_table.product_code
-INNER JOIN
-    dim_date_times ON orders_table.date_uuid = dim_date_times.date_uuid
+    sales_rollup
+WHERE
+    month IS NOT NULL
 GROUP BY
-    dim_date_times.month
+    month
 ORDER BY
-    total_sales DESC;
\ No newline at end of file
+    total_sales DESC;
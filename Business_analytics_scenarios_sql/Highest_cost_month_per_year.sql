@@ -1,22 +1,15 @@
 --Which month in each year produced the highest cost of sales?
-WITH total_sales_all_months AS (
-    SELECT SUM(product_price * orders_table.product_quantity) AS grand_total_sales
-    FROM dim_products
-    INNER JOIN orders_table ON dim_products.product_code = orders_table.product_code
-)
+--The year and month of the rollup are numbers, taken from the typed sale_timestamp of dim_date_times, and
+--are null for the sales whose date has no timestamp
 SELECT 
- 	SUM(product_price * orders_table.product_quantity) AS total_sales,
-    dim_date_times.year,
-	dim_date_times.month
+ 	SUM(total_sales) AS total_sales,
+    year,
+	month
 FROM 
-    dim_products
-INNER JOIN
-    orders_table ON dim_products.product_code = orders_table.product_code
-INNER JOIN
-    dim_date_times ON dim_date_times.date_uuid = orders_table.date_uuid
-CROSS JOIN
-    total_sales_all_months
+    sales_rollup
+WHERE
+    year IS NOT NULL
 GROUP BY
-    dim_date_times.month, dim_date_times.year, total_sales_all_months.grand_total_sales
+    month, year
 ORDER BY
-    total_sales DESC;
\ No newline at end of file
+    total_sales DESC;
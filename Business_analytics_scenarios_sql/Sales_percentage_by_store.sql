@@ -1,22 +1,20 @@
 --What percentage of sales come through each type of store?
+--The rollup holds every sale with a product, including the sales whose date has no timestamp
 WITH total_sales_all_stores AS (
-    SELECT SUM(product_price * orders_table.product_quantity) AS grand_total_sales
-    FROM dim_products
-    INNER JOIN orders_table ON dim_products.product_code = orders_table.product_code
+    SELECT SUM(total_sales) AS grand_total_sales
+    FROM sales_rollup
 )
 SELECT 
     dim_store_details.store_type,
-    SUM(product_price * orders_table.product_quantity) AS total_sales,
-    (SUM(product_price * orders_table.product_quantity) / total_sales_all_stores.grand_total_sales) * 100.0 AS percentage_total
+    SUM(sales_rollup.total_sales) AS total_sales,
+    (SUM(sales_rollup.total_sales) / total_sales_all_stores.grand_total_sales) * 100.0 AS percentage_total
 FROM 
-    dim_products
+    sales_rollup
 INNER JOIN
-    orders_table ON dim_products.product_code = orders_table.product_code
-INNER JOIN
-    dim_store_details ON dim_store_details.store_code = orders_table.store_code
+    dim_store_details ON dim_store_details.store_code = sales_rollup.store_code
 CROSS JOIN
     total_sales_all_stores
 GROUP BY
     dim_store_details.store_type, total_sales_all_stores.grand_total_sales
 ORDER BY
-    total_sales DESC;
\ No newline at end of file
+    total_sales DESC;
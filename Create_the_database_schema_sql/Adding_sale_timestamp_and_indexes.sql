@@ -0,0 +1,31 @@
+--The time of each sale as a single timestamptz column, so the queries do not have to rebuild it from text.
+--It is uploaded by the cleaning of the dates, the update only fills a table loaded without it
+ALTER TABLE dim_date_times
+ADD COLUMN IF NOT EXISTS sale_timestamp TIMESTAMPTZ;
+
+UPDATE dim_date_times
+SET sale_timestamp = CAST(CONCAT(year, '-', month, '-', day, ' ', timestamp) AS TIMESTAMP) AT TIME ZONE 'UTC'
+WHERE year IS NOT NULL AND sale_timestamp IS NULL;
+
+--Sales_growth_rate.sql reads the sales of each year in time order
+CREATE INDEX IF NOT EXISTS dim_date_times_year_sale_timestamp_idx
+ON dim_date_times (year, sale_timestamp);
+
+--B-tree indexes on the foreign keys of orders_table, used by the joins to the dimension tables
+CREATE INDEX IF NOT EXISTS orders_table_card_number_idx ON orders_table (card_number);
+CREATE INDEX IF NOT EXISTS orders_table_date_uuid_idx ON orders_table (date_uuid);
+CREATE INDEX IF NOT EXISTS orders_table_product_code_idx ON orders_table (product_code);
+CREATE INDEX IF NOT EXISTS orders_table_store_code_idx ON orders_table (store_code);
+CREATE INDEX IF NOT EXISTS orders_table_user_uuid_idx ON orders_table (user_uuid);
+
+--The rows are loaded in the order of "index", so a BRIN index finds the new orders read by the sales rollup
+--with a few pages instead of a full B-tree
+CREATE INDEX IF NOT EXISTS orders_table_index_brin ON orders_table USING BRIN ("index");
+
+--The store type and country of a store are read with its code by the sales scenarios
+CREATE INDEX IF NOT EXISTS dim_store_details_store_code_type_idx
+ON dim_store_details (store_code, store_type, country_code);
+
+ANALYZE dim_date_times;
+ANALYZE orders_table;
+ANALYZE dim_store_details;
@@ -1,5 +0,0 @@
-ALTER TABLE dim_card_details
-ALTER COLUMN card_number VARCHAR(19),
-ALTER COLUMN expiry_date VARCHAR(5),
-ALTER COLUMN date_payment_confirmed DATE;
-
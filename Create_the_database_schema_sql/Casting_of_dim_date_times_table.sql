@@ -1,6 +0,0 @@
-ALTER TABLE dim_date_times
-ALTER COLUMN month VARCHAR(2),
-ALTER COLUMN year VARCHAR(4),
-ALTER COLUMN day VARCHAR(2),
-ALTER COLUMN time_period VARCHAR(10),
-ALTER COLUMN date_uuid UUID;
@@ -1,14 +1,31 @@
-ALTER TABLE dim_ccard_details
-ADD PRIMARY KEY (card_number);
+--The keys are dropped and added again, so the script can run on every load. Dropping a primary key drops the
+--foreign keys of orders_table which reference it (CASCADE), they are added again by Adding_foreign_keys.sql
+ALTER TABLE dim_card_details
+DROP CONSTRAINT IF EXISTS dim_card_details_pkey CASCADE;
+
+ALTER TABLE dim_card_details
+ADD CONSTRAINT dim_card_details_pkey PRIMARY KEY (card_number);
+
+ALTER TABLE dim_date_times
+DROP CONSTRAINT IF EXISTS dim_date_times_pkey CASCADE;
 
 ALTER TABLE dim_date_times
-ADD PRIMARY KEY (date_uuid);
+ADD CONSTRAINT dim_date_times_pkey PRIMARY KEY (date_uuid);
+
+ALTER TABLE dim_products
+DROP CONSTRAINT IF EXISTS dim_products_pkey CASCADE;
 
 ALTER TABLE dim_products
-ADD PRIMARY KEY (product_code);
+ADD CONSTRAINT dim_products_pkey PRIMARY KEY (product_code);
 
 ALTER TABLE dim_store_details
-ADD PRIMARY KEY (store_code);
+DROP CONSTRAINT IF EXISTS dim_store_details_pkey CASCADE;
+
+ALTER TABLE dim_store_details
+ADD CONSTRAINT dim_store_details_pkey PRIMARY KEY (store_code);
+
+ALTER TABLE dim_users
+DROP CONSTRAINT IF EXISTS dim_users_pkey CASCADE;
 
 ALTER TABLE dim_users
-ADD PRIMARY KEY (user_uuid);
+ADD CONSTRAINT dim_users_pkey PRIMARY KEY (user_uuid);
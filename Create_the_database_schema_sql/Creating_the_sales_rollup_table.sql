@@ -0,0 +1,51 @@
+--The sales of each store and product on each day, refreshed by 'DatabaseConnector.refresh_sales_rollup'.
+--The day is taken from the typed 'sale_timestamp' of dim_date_times, so the scenarios group by numbers.
+--The orders whose date has no timestamp have a null year, month and day (and the orders without a store a null
+--store code), so the store scenarios read every sale
+CREATE TABLE IF NOT EXISTS sales_rollup (
+    store_code VARCHAR(12),
+    product_code VARCHAR(11) NOT NULL,
+    year SMALLINT,
+    month SMALLINT,
+    day SMALLINT,
+    product_quantity BIGINT NOT NULL,
+    total_sales FLOAT,
+    number_of_sales BIGINT NOT NULL
+);
+
+--A rollup created with the text year, month and day of dim_date_times is converted in place
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'sales_rollup' AND column_name = 'year')
+        <> 'smallint' THEN
+        ALTER TABLE sales_rollup
+            ALTER COLUMN year TYPE SMALLINT USING CAST(year AS SMALLINT),
+            ALTER COLUMN month TYPE SMALLINT USING CAST(month AS SMALLINT),
+            ALTER COLUMN day TYPE SMALLINT USING CAST(day AS SMALLINT);
+    END IF;
+END $$;
+
+--A rollup created without the undated orders gets nullable stores and days and a new key, and its high-water mark is
+--dropped so the next refresh rebuilds it with every order
+DO $$
+BEGIN
+    IF (SELECT is_nullable FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'sales_rollup' AND column_name = 'year')
+        = 'NO' THEN
+        ALTER TABLE sales_rollup
+            ALTER COLUMN store_code DROP NOT NULL,
+            ALTER COLUMN year DROP NOT NULL,
+            ALTER COLUMN month DROP NOT NULL,
+            ALTER COLUMN day DROP NOT NULL;
+        DROP INDEX IF EXISTS sales_rollup_key;
+        IF to_regclass('etl_state') IS NOT NULL THEN
+            DELETE FROM etl_state WHERE table_name = 'sales_rollup';
+        END IF;
+    END IF;
+END $$;
+
+--The null stores and days of a product are grouped as any other value, so the refresh adds the new undated sales to it
+--(NULLS NOT DISTINCT needs PostgreSQL 15)
+CREATE UNIQUE INDEX IF NOT EXISTS sales_rollup_key
+ON sales_rollup (store_code, product_code, year, month, day) NULLS NOT DISTINCT;
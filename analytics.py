@@ -0,0 +1,456 @@
+from snapshot_store import SnapshotStore
+import argparse
+import json
+import os
+import pandas as pd
+import time
+
+# The directory of the business analytics queries
+SQL_DIR = 'Business_analytics_scenarios_sql'
+
+# Maps the name of each scenario (the name of its SQL file) to the method of 'AnalyticsEngine' answering it
+SCENARIOS = {
+    'Number_of_stores_of_each_country': 'number_of_stores_of_each_country',
+    'Locations_with_more_stores': 'locations_with_more_stores',
+    'Average_highest_cost_months': 'average_highest_cost_months',
+    'Online_sales': 'online_sales',
+    'Sales_percentage_by_store': 'sales_percentage_by_store',
+    'Highest_cost_month_per_year': 'highest_cost_month_per_year',
+    'Staff_headcount': 'staff_headcount',
+    'Top_selling_German_store': 'top_selling_German_store',
+    'Sales_growth_rate': 'sales_growth_rate'
+    }
+
+# The columns each scenario reads from the snapshots, only these columns are loaded
+TABLE_COLUMNS = {
+    'dim_store_details': ['store_code', 'store_type', 'locality', 'country_code', 'staff_numbers'],
+    'dim_products': ['product_code', 'product_price'],
+    'orders_table': ['date_uuid', 'store_code', 'product_code', 'product_quantity'],
+    'dim_date_times': ['date_uuid', 'year', 'sale_timestamp']
+    }
+
+class AnalyticsEngine():
+    '''
+    The class 'AnalyticsEngine' answers the queries of 'Business_analytics_scenarios_sql' in process with
+    vectorized pandas operations over the cleaned tables, so a report does not need a round trip to the
+    'sales_data' database.
+
+    The tables are read from the Parquet snapshots (only the columns in 'TABLE_COLUMNS'), or taken from
+    'tables' when the cleaned dataframes are already in memory. The columns are given the types they have in
+    the database ('TABLE_SCHEMAS' of 'database_utils.py'), so each method returns the same rows and columns
+    as its SQL query.
+
+    Attributes
+    ----------
+    snapshots(SnapshotStore): The snapshots the tables are read from
+    tables(Dictionary): The loaded tables, by name
+    joined(Dictionary): The joins shared by several scenarios, computed once
+
+    Methods
+    -------
+    cast_table(self, table_name, df)
+    table(self, table_name)
+    sales(self)
+    store_sales(self)
+    date_sales(self)
+    run(self, scenario)
+    number_of_stores_of_each_country(self)
+    locations_with_more_stores(self)
+    average_highest_cost_months(self)
+    online_sales(self)
+    sales_percentage_by_store(self)
+    highest_cost_month_per_year(self)
+    staff_headcount(self)
+    top_selling_German_store(self)
+    sales_growth_rate(self)
+    '''
+
+    def __init__(self, snapshots=None, tables=None):
+        self.snapshots = snapshots or SnapshotStore()
+        self.tables = {}
+        self.joined = {}
+        for table_name, df in (tables or {}).items():
+            self.tables[table_name] = self.cast_table(table_name, df)
+
+    def cast_table(self, table_name, df):
+        '''
+        The method 'cast_table' keeps the columns of a table used by the scenarios and casts them to the 
+        types of the database (e.g. prices to float, missing localities to 'N/A'), in case the snapshot was 
+        written before the cleaning produced these types.
+
+            Parameters:
+                    table_name(String): The name of the table
+                    df(Dataframe): The cleaned table
+
+            Returns:
+                    df(Dataframe): The table with the types of the database
+        '''
+        df = df[TABLE_COLUMNS[table_name]].copy()
+        if table_name == 'dim_store_details':
+            df['staff_numbers'] = pd.to_numeric(df['staff_numbers'], errors='coerce')
+            df['locality'] = df['locality'].fillna('N/A')
+        elif table_name == 'dim_products':
+            df['product_price'] = pd.to_numeric(df['product_price'], errors='coerce')
+        elif table_name == 'orders_table':
+            df['product_quantity'] = pd.to_numeric(df['product_quantity'], errors='coerce')
+        elif table_name == 'dim_date_times':
+            df['sale_timestamp'] = pd.to_datetime(df['sale_timestamp'], utc=True)
+        for column in df.columns:
+            if isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = df[column].astype(object)
+        return df
+
+    def table(self, table_name):
+        '''
+        The method 'table' returns a table, reading it from its snapshot the first time it is used.
+
+            Parameters:
+                    table_name(String): The name of the table
+
+            Returns:
+                    df(Dataframe): The table with the types of the database
+        '''
+        if table_name not in self.tables:
+            df = self.snapshots.read(table_name, TABLE_COLUMNS[table_name])
+            self.tables[table_name] = self.cast_table(table_name, df)
+        return self.tables[table_name]
+
+    def sales(self):
+        '''
+        The method 'sales' joins the orders with the products (the 'INNER JOIN' shared by most scenarios)
+        and computes the value of each order.
+
+            Parameters:
+                    None
+
+            Returns:
+                    df(Dataframe): The orders with their 'sales' column
+        '''
+        if 'sales' not in self.joined:
+            df = self.table('orders_table').merge(self.table('dim_products'), on='product_code', how='inner')
+            df['sales'] = df['product_price'] * df['product_quantity']
+            self.joined['sales'] = df
+        return self.joined['sales']
+
+    def store_sales(self):
+        '''
+        The method 'store_sales' joins the sales with the stores they were made in.
+
+            Parameters:
+                    None
+
+            Returns:
+                    df(Dataframe): The sales with the store type and country code of their store
+        '''
+        if 'store_sales' not in self.joined:
+            stores = self.table('dim_store_details')[['store_code', 'store_type', 'country_code']]
+            self.joined['store_sales'] = self.sales().merge(stores, on='store_code', how='inner')
+        return self.joined['store_sales']
+
+    def date_sales(self):
+        '''
+        The method 'date_sales' joins the sales with the dates they were made on. As in the monthly 
+        scenarios on 'sales_rollup', the year and month are the numbers of the typed 'sale_timestamp' (UTC), 
+        and the sales whose date has no timestamp are left out.
+
+            Parameters:
+                    None
+
+            Returns:
+                    df(Dataframe): The sales with their year and month
+        '''
+        if 'date_sales' not in self.joined:
+            dates = self.table('dim_date_times').dropna(subset=['sale_timestamp'])
+            dates = pd.DataFrame({'date_uuid': dates['date_uuid'], 'year': dates['sale_timestamp'].dt.year, 
+                                  'month': dates['sale_timestamp'].dt.month})
+            self.joined['date_sales'] = self.sales().merge(dates, on='date_uuid', how='inner')
+        return self.joined['date_sales']
+
+    def run(self, scenario):
+        '''
+        The method 'run' answers a scenario by the name of its SQL file.
+
+            Parameters:
+                    scenario(String): The name of the scenario, e.g. 'Sales_growth_rate'
+
+            Returns:
+                    df(Dataframe): The result of the scenario
+        '''
+        return getattr(self, SCENARIOS[scenario])()
+
+    # As in SQL, missing values form a group of their own ('dropna=False') and the sum of a group with only
+    # missing values is missing ('min_count=1')
+
+    def number_of_stores_of_each_country(self):
+        '''
+        The method 'number_of_stores_of_each_country' counts the stores of each country.
+
+            Parameters:
+                    None
+
+            Returns:
+                    df(Dataframe): The result of the scenario
+        '''
+        df = self.table('dim_store_details')
+        df = df.groupby('country_code', dropna=False)['store_code'].nunique().reset_index()
+        df.columns = ['country', 'total_no_stores']
+        return df.sort_values('country', kind='stable').reset_index(drop=True)
+
+    def locations_with_more_stores(self):
+        '''
+        The method 'locations_with_more_stores' returns the 7 localities with the most stores.
+
+            Parameters:
+                    None
+
+            Returns:
+                    df(Dataframe): The result of the scenario
+        '''
+        df = self.table('dim_store_details')
+        df = df.groupby('locality', dropna=False)['store_code'].nunique().reset_index(name='total_no_stores')
+        return df.sort_values('total_no_stores', ascending=False, kind='stable').head(7).reset_index(drop=True)
+
+    def average_highest_cost_months(self):
+        '''
+        The method 'average_highest_cost_months' returns the total sales of each month, highest first.
+
+            Parameters:
+                    None
+
+            Returns:
+                    df(Dataframe): The result of the scenario
+        '''
+        df = self.date_sales().groupby('month', dropna=False)['sales'].sum(min_count=1)
+        df = df.reset_index(name='total_sales')
+        return df.sort_values('total_sales', ascending=False, kind='stable').reset_index(drop=True)
+
+    def online_sales(self):
+        '''
+        The method 'online_sales' compares the number of products and sales of the web portal with the
+        stores.
+
+            Parameters:
+                    None
+
+            Returns:
+                    df(Dataframe): The result of the scenario
+        '''
+        df = self.store_sales()
+        location = df['store_type'].eq('Web Portal').map({True: 'Web', False: 'Offline'})
+        df = df.groupby(location, dropna=False).agg(product_quantity_count=('product_quantity', 'sum'),
+                                      number_of_sales=('sales', 'count'))
+        df = df.rename_axis('location').reset_index()
+        return df.sort_values('product_quantity_count', ascending=False, kind='stable').reset_index(drop=True)
+
+    def sales_percentage_by_store(self):
+        '''
+        The method 'sales_percentage_by_store' returns the total sales of each store type and their
+        percentage of all the sales.
+
+            Parameters:
+                    None
+
+            Returns:
+                    df(Dataframe): The result of the scenario
+        '''
+        grand_total_sales = self.sales()['sales'].sum()
+        df = self.store_sales().groupby('store_type', dropna=False)['sales'].sum(min_count=1)
+        df = df.reset_index(name='total_sales')
+        df['percentage_total'] = df['total_sales'] / grand_total_sales * 100.0
+        return df.sort_values('total_sales', ascending=False, kind='stable').reset_index(drop=True)
+
+    def highest_cost_month_per_year(self):
+        '''
+        The method 'highest_cost_month_per_year' returns the total sales of each month of each year, highest
+        first.
+
+            Parameters:
+                    None
+
+            Returns:
+                    df(Dataframe): The result of the scenario
+        '''
+        df = self.date_sales().groupby(['month', 'year'], dropna=False)['sales'].sum(min_count=1)
+        df = df.reset_index(name='total_sales')
+        df = df[['total_sales', 'year', 'month']]
+        return df.sort_values('total_sales', ascending=False, kind='stable').reset_index(drop=True)
+
+    def staff_headcount(self):
+        '''
+        The method 'staff_headcount' returns the number of staff in each country.
+
+            Parameters:
+                    None
+
+            Returns:
+                    df(Dataframe): The result of the scenario
+        '''
+        df = self.table('dim_store_details')
+        df = df.groupby('country_code', dropna=False)['staff_numbers'].sum(min_count=1)
+        df = df.reset_index(name='total_staff_numbers')
+        df = df[['total_staff_numbers', 'country_code']]
+        return df.sort_values('total_staff_numbers', ascending=False, kind='stable').reset_index(drop=True)
+
+    def top_selling_German_store(self):
+        '''
+        The method 'top_selling_German_store' returns the total sales of each store type in Germany, lowest
+        first.
+
+            Parameters:
+                    None
+
+            Returns:
+                    df(Dataframe): The result of the scenario
+        '''
+        df = self.store_sales()
+        df = df[df['country_code'] == 'DE']
+        df = df.groupby(['store_type', 'country_code'], dropna=False)['sales'].sum(min_count=1)
+        df = df.reset_index(name='total_sales')
+        df = df[['total_sales', 'store_type', 'country_code']]
+        return df.sort_values('total_sales', kind='stable').reset_index(drop=True)
+
+    def sales_growth_rate(self):
+        '''
+        The method 'sales_growth_rate' returns the average time between two consecutive sales in each year, 
+        with the sales in the time order of their typed 'sale_timestamp'.
+
+            Parameters:
+                    None
+
+            Returns:
+                    df(Dataframe): The result of the scenario
+        '''
+        df = self.table('dim_date_times').dropna(subset=['sale_timestamp'])
+        df = pd.DataFrame({'year': df['year'].astype(str), 'sale_timestamp': df['sale_timestamp']})
+        df = df.sort_values(['year', 'sale_timestamp'], kind='stable')
+        df['time_difference'] = df.groupby('year')['sale_timestamp'].shift(-1) - df['sale_timestamp']
+        df = df.dropna(subset=['time_difference']) # Exclude the last sale of each year
+        df = df.groupby('year')['time_difference'].mean().reset_index(name='average_time_difference')
+        return df.sort_values('year', kind='stable').reset_index(drop=True)
+
+def read_scenario_sql(scenario):
+    '''
+    The function 'read_scenario_sql' reads the query of a scenario. Only the first statement of the file is
+    returned, as some files repeat their query.
+
+        Parameters:
+                scenario(String): The name of the scenario
+
+        Returns:
+                query(String): The SQL query
+    '''
+    with open(os.path.join(SQL_DIR, scenario + '.sql'), 'r') as file:
+        return next(statement for statement in file.read().split(';') if statement.strip())
+
+def results_equal(local_result, postgres_result):
+    '''
+    The function 'results_equal' checks that a scenario returned the same result in process and in
+    PostgreSQL. Each column of the PostgreSQL result is converted to the type of the local column (intervals
+    and numbers are compared as floats with a relative tolerance, the rest as text). Rows which tie in the
+    'ORDER BY' can come in any order, so both results are sorted by every column first.
+
+        Parameters:
+                local_result(Dataframe): The result of 'AnalyticsEngine'
+                postgres_result(Dataframe): The result of the SQL query
+
+        Returns:
+                equal(Bool): True if the results are the same
+    '''
+    if list(local_result.columns) != list(postgres_result.columns) or len(local_result) != len(postgres_result):
+        return False
+    local_result, postgres_result = local_result.copy(), postgres_result.copy()
+    for column in local_result.columns:
+        if pd.api.types.is_timedelta64_dtype(local_result[column]):
+            local_result[column] = local_result[column].dt.total_seconds()
+            postgres_result[column] = pd.to_timedelta(postgres_result[column]).dt.total_seconds()
+        elif pd.api.types.is_numeric_dtype(local_result[column]):
+            postgres_result[column] = pd.to_numeric(postgres_result[column])
+        else:
+            local_result[column] = local_result[column].fillna('NULL').astype(str)
+            postgres_result[column] = postgres_result[column].fillna('NULL').astype(str)
+    columns = list(local_result.columns)
+    local_result = local_result.sort_values(columns).reset_index(drop=True)
+    postgres_result = postgres_result.sort_values(columns).reset_index(drop=True)
+    try:
+        pd.testing.assert_frame_equal(local_result, postgres_result, check_dtype=False, rtol=1e-9)
+        return True
+    except AssertionError as error:
+        print(error)
+        return False
+
+def explain_scenario(engine, scenario, repeat=1):
+    '''
+    The function 'explain_scenario' runs the query of a scenario on the local database with 
+    'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)', to see which indexes and joins PostgreSQL uses and how long 
+    the query takes without sending its rows. With 'repeat' the query is run several times and the run with 
+    the median execution time is returned, so a cold cache does not skew the timings.
+
+        Parameters:
+                engine(SQLAlchemy Engine object): The engine of the local database
+                scenario(String): The name of the scenario
+                repeat(Int): The number of times the query is run
+
+        Returns:
+                explain(Dictionary): The planning and execution time in ms, the shared buffers hit and read 
+                                     and the plan
+    '''
+    runs = []
+    with engine.connect() as connection:
+        for _ in range(max(repeat, 1)):
+            result = connection.exec_driver_sql(
+                'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + read_scenario_sql(scenario)
+                ).scalar()
+            runs.append(result[0] if isinstance(result, list) else json.loads(result)[0])
+    run = sorted(runs, key=lambda run: run['Execution Time'])[len(runs) // 2]
+    return {
+        'planning_time': run['Planning Time'],
+        'execution_time': run['Execution Time'],
+        'shared_hit_blocks': run['Plan'].get('Shared Hit Blocks'),
+        'shared_read_blocks': run['Plan'].get('Shared Read Blocks'),
+        'plan': run['Plan']
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Answer the business analytics scenarios from the Parquet snapshots.')
+    parser.add_argument('scenarios', nargs='*', help='The scenarios to run, all by default')
+    parser.add_argument('--repeat', type=int, default=1, help='The number of times each scenario is timed')
+    parser.add_argument('--check', action='store_true',
+                        help='Also run the SQL query on the local database and check the results are equal')
+    parser.add_argument('--explain', action='store_true',
+                        help='Also run the SQL query with EXPLAIN ANALYZE on the local database and report its timings')
+    parser.add_argument('--show', action='store_true', help='Print the result (and plan) of each scenario')
+    args = parser.parse_args()
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}. Choose from: {', '.join(SCENARIOS)}")
+
+    analytics = AnalyticsEngine()
+    if args.check or args.explain:
+        from database_utils import DatabaseConnector
+        engine = DatabaseConnector().init_local_db_engine()
+
+    for scenario in args.scenarios or SCENARIOS:
+        record = {'scenario': scenario}
+        # The first run also loads the tables and joins, the next ones only answer the scenario
+        for run in range(max(args.repeat, 1)):
+            start = time.perf_counter()
+            result = analytics.run(scenario)
+            record['first_time' if run == 0 else 'time'] = time.perf_counter() - start
+        record['rows'] = len(result)
+        if args.check:
+            start = time.perf_counter()
+            postgres_result = pd.read_sql(read_scenario_sql(scenario), engine)
+            record['postgres_time'] = time.perf_counter() - start
+            record['equal'] = results_equal(result, postgres_result)
+        if args.explain:
+            explain = explain_scenario(engine, scenario, args.repeat)
+            plan = explain.pop('plan')
+            record.update({'postgres_' + key: value for key, value in explain.items()})
+        print(json.dumps({key: round(value, 4) if isinstance(value, float) else value
+                          for key, value in record.items()}))
+        if args.show:
+            print(result.to_string(index=False))
+            if args.explain:
+                print(json.dumps(plan, indent=4))
@@ -0,0 +1,986 @@
+from data_cleaning import CARD_PROVIDER_RULES, DataCleaning, validate_card_numbers
+from data_extraction import DataExtractor
+from database_utils import DatabaseConnector
+from extraction_cache import ExtractionCache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from instrumentation import resident_memory_mb
+from integrity_check import IntegrityChecker
+from snapshot_store import SnapshotStore
+from sqlalchemy import create_engine
+from synthetic_data import SyntheticDataGenerator
+import argparse
+import collections
+import contextlib
+import json
+import multiprocessing
+import numbers
+import numpy as np
+import os
+import pandas as pd
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    import resource # Not available on Windows, where the peak memory is not measured
+except ImportError:
+    resource = None
+
+# The file the results of every run are appended to, so the runs of different commits can be compared
+RESULTS_FILE = os.path.join('.benchmarks', 'results.jsonl')
+
+# The tables whose clean methods can be sharded across worker processes, see 'DataCleaning.clean_in_parallel'
+SHARDED_TABLES = ['users', 'card_details', 'store_details', 'products', 'date_times']
+
+# The numbers of worker processes the sharded clean methods are benchmarked with, from 2 to the number of cores
+CORES = os.cpu_count() or 1
+WORKER_COUNTS = [count for count in (2, 4, 8, 16, 32, 64) if count < CORES] + ([CORES] if CORES > 1 else [])
+
+# The store API is called once per store, so it is benchmarked with at most this many stores
+MAX_STORES = 1000
+
+# The card details PDF has 50 rows on each page, so it is benchmarked with at most this many rows
+MAX_PDF_ROWS = 100000
+
+# The directory of the analytics scenarios
+SCENARIO_DIR = 'Business_analytics_scenarios_sql'
+
+# The queries on 'orders_table' which the sales scenarios ran before they read 'sales_rollup', the baseline of 
+# their latency benchmarks
+ORDERS_TABLE_SCENARIOS = {
+    'Top_selling_German_store': """
+        SELECT SUM(product_price * orders_table.product_quantity) AS total_sales, dim_store_details.store_type,
+            dim_store_details.country_code
+        FROM dim_products
+        INNER JOIN orders_table ON dim_products.product_code = orders_table.product_code
+        INNER JOIN dim_store_details ON dim_store_details.store_code = orders_table.store_code
+        WHERE dim_store_details.country_code = 'DE'
+        GROUP BY dim_store_details.store_type, dim_store_details.country_code
+        ORDER BY total_sales ASC""",
+    'Sales_percentage_by_store': """
+        WITH total_sales_all_stores AS (
+            SELECT SUM(product_price * orders_table.product_quantity) AS grand_total_sales
+            FROM dim_products
+            INNER JOIN orders_table ON dim_products.product_code = orders_table.product_code
+        )
+        SELECT dim_store_details.store_type, SUM(product_price * orders_table.product_quantity) AS total_sales,
+            (SUM(product_price * orders_table.product_quantity) / total_sales_all_stores.grand_total_sales) * 100.0
+            AS percentage_total
+        FROM dim_products
+        INNER JOIN orders_table ON dim_products.product_code = orders_table.product_code
+        INNER JOIN dim_store_details ON dim_store_details.store_code = orders_table.store_code
+        CROSS JOIN total_sales_all_stores
+        GROUP BY dim_store_details.store_type, total_sales_all_stores.grand_total_sales
+        ORDER BY total_sales DESC""",
+    'Online_sales': """
+        SELECT CASE WHEN dim_store_details.store_type = 'Web Portal' THEN 'Web' ELSE 'Offline' END AS location,
+            SUM(product_quantity) AS product_quantity_count, COUNT(product_price * product_quantity) AS number_of_sales
+        FROM dim_products
+        INNER JOIN orders_table ON dim_products.product_code = orders_table.product_code
+        INNER JOIN dim_store_details ON dim_store_details.store_code = orders_table.store_code
+        GROUP BY location
+        ORDER BY product_quantity_count DESC""",
+    'Highest_cost_month_per_year': """
+        SELECT SUM(product_price * orders_table.product_quantity) AS total_sales,
+            CAST(EXTRACT(YEAR FROM sale_timestamp AT TIME ZONE 'UTC') AS SMALLINT) AS year,
+            CAST(EXTRACT(MONTH FROM sale_timestamp AT TIME ZONE 'UTC') AS SMALLINT) AS month
+        FROM dim_products
+        INNER JOIN orders_table ON dim_products.product_code = orders_table.product_code
+        INNER JOIN dim_date_times ON dim_date_times.date_uuid = orders_table.date_uuid
+        WHERE sale_timestamp IS NOT NULL
+        GROUP BY month, year
+        ORDER BY total_sales DESC""",
+    'Average_highest_cost_months': """
+        SELECT CAST(EXTRACT(MONTH FROM sale_timestamp AT TIME ZONE 'UTC') AS SMALLINT) AS month,
+            SUM(product_price * orders_table.product_quantity) AS total_sales
+        FROM dim_products
+        INNER JOIN orders_table ON dim_products.product_code = orders_table.product_code
+        INNER JOIN dim_date_times ON dim_date_times.date_uuid = orders_table.date_uuid
+        WHERE sale_timestamp IS NOT NULL
+        GROUP BY month
+        ORDER BY total_sales DESC"""
+    }
+
+class LocalHTTPServer():
+    '''
+    The class 'LocalHTTPServer' is a local stand-in for the store API and the S3 website of the date events.
+    It serves fixed responses from a thread, with an ETag (or, with 'etag' False, the Last-Modified time of
+    the server start), and answers conditional requests with 304 when the response is unchanged. A route can also give a list of responses, one for each request and the last one repeated, where a
+    status code stands for an error response (e.g. [503, 429, body] fails twice before it succeeds).
+
+    Attributes
+    ----------
+    routes(Dictionary): Maps each path to the bytes it returns, a status code or a list of them
+    requests(Counter): The number of requests received for each path
+    downloads(Counter): The number of responses sent with a body for each path
+    server(ThreadingHTTPServer): The server, listening on a free local port
+    url(String): The base URL of the server
+
+    Methods
+    -------
+    start(self)
+    stop(self)
+    '''
+
+    def __init__(self, routes, etag=True):
+        self.routes = routes
+        self.requests = collections.Counter()
+        self.downloads = collections.Counter()
+        routes, requests, downloads, lock = self.routes, self.requests, self.downloads, threading.Lock()
+        last_modified = time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime())
+
+        class Handler(BaseHTTPRequestHandler):
+            def send_route(self, with_body):
+                path = self.path.split('?')[0]
+                with lock:
+                    requests[path] += 1
+                    body = routes.get(path, 404)
+                    if isinstance(body, list):
+                        body = body.pop(0) if len(body) > 1 else body[0]
+                if isinstance(body, int):
+                    self.send_response(body)
+                    self.end_headers()
+                    return
+                version = f'"{hash(body) & 0xffffffff:x}"' if etag else last_modified
+                if self.headers.get('If-None-Match' if etag else 'If-Modified-Since') == version:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag' if etag else 'Last-Modified', version)
+                self.end_headers()
+                if with_body:
+                    with lock:
+                        downloads[path] += 1
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                self.send_route(True)
+
+            def do_HEAD(self):
+                self.send_route(False)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class BenchmarkSuite():
+    '''
+    The class 'BenchmarkSuite' times the clean methods of 'DataCleaning', the extract methods of
+    'DataExtractor' and the upload of 'DatabaseConnector' on synthetic tables from 'SyntheticDataGenerator'.
+
+    The extractors run against local stand-ins: an HTTP server for the store API, the date events and a
+    PDF of the card details (read in process and by each number of 'workers'), a
+    SQLite file for the RDS tables and, if 'moto' is installed, a local S3 server for the products. The
+    upload goes to SQLite, or to the database of the 'BENCHMARK_DB_URL' environment variable (e.g. a local
+    PostgreSQL, which uses 'COPY'). On a PostgreSQL 'BENCHMARK_DB_URL', the latency of the sales scenarios is
+    compared on 'orders_table' and on 'sales_rollup'. The whole-table and chunked loads of the orders and the 
+    S3 extractions also report their peak memory. Every benchmark is run 'repeat' times on fresh inputs, and 
+    the minimum and median times are reported.
+
+    Attributes
+    ----------
+    repeat(Int): The number of times each benchmark is run
+    seed(Int): The seed of the synthetic data
+    workers(List): The numbers of worker processes the sharded clean methods are benchmarked with, e.g. the
+                   benchmark 'clean_users_4_workers' (the benchmarks 'clean_<table>' are the in-process baseline)
+    work_dir(String): A temporary directory for the caches and the SQLite database
+    tables(Dictionary): The generated tables, by name and number of rows
+    scenario_connectors(Dictionary): The connectors to the schema of the scenario benchmarks, by number of rows
+
+    Methods
+    -------
+    table(self, name, rows)
+    time(self, setup, run)
+    run(self, name, rows)
+    clean(self, name, rows, workers)
+    clean_baseline(self, name, rows, clean)
+    convert_weights(self, rows, convert)
+    validate_cards(self, rows, validate)
+    integrity_check(self, rows)
+    build_stores(self, rows, build)
+    extract_stores_api(self, rows)
+    extract_date_events(self, rows)
+    extract_pdf_cards(self, rows, workers)
+    extract_sql_orders(self, rows)
+    extract_sql_orders_in_chunks(self, rows)
+    s3_products(self, rows)
+    extract_s3_products(self, rows, mode)
+    upload_orders(self, rows)
+    peak_memory(self, run)
+    load_orders(self, rows, chunksize)
+    scenario_connector(self, rows)
+    scenario(self, rows, scenario, source)
+    '''
+
+    def __init__(self, repeat=3, seed=0, workers=()):
+        self.repeat = repeat
+        self.seed = seed
+        self.workers = workers
+        self.work_dir = tempfile.mkdtemp(prefix='benchmark-')
+        self.tables = {}
+        self.scenario_connectors = {}
+        self.benchmarks = {
+            'clean_users': lambda rows: self.clean('users', rows),
+            'clean_card_details': lambda rows: self.clean('card_details', rows),
+            'clean_store_details': lambda rows: self.clean('store_details', rows),
+            'clean_products': lambda rows: self.clean('products', rows),
+            'clean_orders': lambda rows: self.clean('orders', rows),
+            'clean_date_times': lambda rows: self.clean('date_times', rows),
+            'clean_users_apply': lambda rows: self.clean_baseline('users', rows, clean_user_data_apply),
+            'convert_weights': lambda rows: self.convert_weights(rows, DataCleaning().convert_product_weights),
+            'convert_weights_apply': lambda rows: self.convert_weights(rows, convert_product_weights_apply),
+            'validate_cards': lambda rows: self.validate_cards(rows, validate_card_numbers),
+            'validate_cards_loop': lambda rows: self.validate_cards(rows, validate_card_numbers_loop),
+            'integrity_check': self.integrity_check,
+            'build_stores': lambda rows: self.build_stores(rows, DataExtractor().build_stores_frame),
+            'build_stores_concat': lambda rows: self.build_stores(rows, build_stores_frame_concat),
+            'extract_stores_api': self.extract_stores_api,
+            'extract_date_events': self.extract_date_events,
+            'extract_pdf_cards': self.extract_pdf_cards,
+            'extract_sql_orders': self.extract_sql_orders,
+            'extract_sql_orders_in_chunks': self.extract_sql_orders_in_chunks,
+            'extract_s3_products': self.extract_s3_products,
+            'extract_s3_products_in_chunks': lambda rows: self.extract_s3_products(rows, 'stream'),
+            'extract_s3_products_in_parts': lambda rows: self.extract_s3_products(rows, 'parts'),
+            'upload_orders': self.upload_orders,
+            'load_orders': self.load_orders,
+            'load_orders_in_chunks': lambda rows: self.load_orders(rows, chunksize=50000)
+            }
+        for scenario in ORDERS_TABLE_SCENARIOS:
+            for source in ('orders_table', 'sales_rollup'):
+                self.benchmarks[f"scenario_{scenario}_{source}"] = \
+                    lambda rows, scenario=scenario, source=source: self.scenario(rows, scenario, source)
+        for worker_count in workers:
+            for name in SHARDED_TABLES:
+                self.benchmarks[f"clean_{name}_{worker_count}_workers"] = \
+                    lambda rows, name=name, worker_count=worker_count: self.clean(name, rows, worker_count)
+            self.benchmarks[f"extract_pdf_cards_{worker_count}_workers"] = \
+                lambda rows, worker_count=worker_count: self.extract_pdf_cards(rows, worker_count)
+
+    def table(self, name, rows):
+        '''
+        The method 'table' returns a synthetic source table, generated once for each number of rows.
+
+            Parameters:
+                    name(String): 'users', 'card_details', 'store_details', 'products', 'orders' or 'date_times'
+                    rows(Int): The number of rows
+
+            Returns:
+                    df(Dataframe): The table, which must not be modified
+        '''
+        if (name, rows) not in self.tables:
+            generator = SyntheticDataGenerator(self.seed)
+            self.tables[(name, rows)] = getattr(generator, name)(rows)
+        return self.tables[(name, rows)]
+
+    def time(self, setup, run):
+        '''
+        The method 'time' runs a benchmark 'repeat' times. The setup (e.g. creating an extractor with an
+        empty cache, or copying the input of a baseline which modifies it in place) is not timed.
+
+            Parameters:
+                    setup(Function): Returns the arguments of 'run'
+                    run(Function): The code which is timed
+
+            Returns:
+                    times(List): The time of each run in seconds
+        '''
+        times = []
+        for _ in range(self.repeat):
+            args = setup()
+            start = time.perf_counter()
+            run(*args)
+            times.append(time.perf_counter() - start)
+        return times
+
+    def run(self, name, rows):
+        '''
+        The method 'run' runs a benchmark and returns its record.
+
+            Parameters:
+                    name(String): The name of the benchmark
+                    rows(Int): The number of rows of the input
+
+            Returns:
+                    record(Dictionary): The benchmark, rows, minimum and median time and rows per second (and 
+                                        the peak memory of the benchmarks which measure it), or None if the 
+                                        benchmark cannot run here
+        '''
+        result = self.benchmarks[name](rows)
+        if result is None:
+            return None
+        input_rows, times, *measures = result
+        median = statistics.median(times)
+        return {
+            'benchmark': name,
+            'rows': input_rows,
+            'min': min(times),
+            'median': median,
+            'rows_per_s': input_rows / median if median else None,
+            **(measures[0] if measures else {})
+            }
+
+    def clean(self, name, rows, workers=1):
+        '''
+        The method 'clean' times the clean method of a table (with 'convert_product_weights' for the
+        products), in process or in row shards across a number of worker processes. The workers are started
+        by an untimed run first. The clean methods return a new dataframe, so every run is given the table.
+        '''
+        data_cleaner = DataCleaning(workers=workers)
+        clean_method = {
+            'users': data_cleaner.clean_user_data,
+            'card_details': data_cleaner.clean_card_data,
+            'store_details': data_cleaner.clean_store_data,
+            'products': lambda df: data_cleaner.convert_product_weights(data_cleaner.clean_products_data(df)),
+            'orders': data_cleaner.clean_orders_data,
+            'date_times': data_cleaner.clean_event_data
+            }[name]
+        df = self.table(name, rows)
+        try:
+            if workers > 1:
+                clean_method(df)
+            return rows, self.time(lambda: (df,), clean_method)
+        finally:
+            data_cleaner.close_workers()
+
+    def clean_baseline(self, name, rows, clean):
+        '''
+        The method 'clean_baseline' times the baseline of a clean method, e.g. 'clean_user_data_apply', 
+        the per-row code 'clean_user_data' replaced (compared with 'clean_users' at 15000 and 1000000 rows).
+        '''
+        df = self.table(name, rows)
+        return rows, self.time(lambda: (df,), clean)
+
+    def convert_weights(self, rows, convert):
+        '''
+        The method 'convert_weights' times the conversion of the cleaned product weights, 
+        'DataCleaning.convert_product_weights' or its baseline 'convert_product_weights_apply' (e.g. at 
+        1000000 rows). The baseline converts the weights in place, so each run gets a copy.
+        '''
+        df = DataCleaning().clean_products_data(self.table('products', rows))
+        return rows, self.time(lambda: (df.copy(),), convert)
+
+    def validate_cards(self, rows, validate):
+        '''
+        The method 'validate_cards' times a validation of the cleaned card numbers, 'validate_card_numbers' 
+        or its Python loop baseline 'validate_card_numbers_loop'.
+        '''
+        df = DataCleaning().clean_card_data(self.table('card_details', rows).copy())
+        return rows, self.time(lambda: (df['card_number'], df['card_provider']), validate)
+
+    def integrity_check(self, rows):
+        '''
+        The method 'integrity_check' times 'IntegrityChecker.find_orphans' (hashing the keys of the cleaned 
+        dimensions and anti-joining the cleaned orders to them), with the orders drawing their keys from the 
+        dimensions of 'SyntheticDataGenerator.tables'.
+        '''
+        tables = SyntheticDataGenerator(self.seed).tables(rows)
+        data_cleaner = DataCleaning()
+        dimensions = {
+            'dim_users': data_cleaner.clean_user_data(tables['users']),
+            'dim_card_details': data_cleaner.clean_card_data(tables['card_details']),
+            'dim_store_details': data_cleaner.clean_store_data(tables['store_details']),
+            'dim_products': data_cleaner.clean_products_data(tables['products']),
+            'dim_date_times': data_cleaner.clean_event_data(tables['date_times'])
+            }
+        df_orders = data_cleaner.clean_orders_data(tables['orders'])
+        snapshots = SnapshotStore(os.path.join(self.work_dir, 'snapshots'))
+        run = lambda: IntegrityChecker(snapshots, dimensions).find_orphans(df_orders)
+        return rows, self.time(lambda: (), run)
+
+    def build_stores(self, rows, build):
+        '''
+        The method 'build_stores' times the DataFrame built from the JSON records of the stores, 
+        'DataExtractor.build_stores_frame' or its baseline 'build_stores_frame_concat', without the API 
+        (e.g. at 1000, 10000 and 100000 stores).
+        '''
+        results = json.loads(self.table('store_details', rows).to_json(orient='records'))
+        return rows, self.time(lambda: (results,), build)
+
+    def extract_stores_api(self, rows):
+        '''
+        The method 'extract_stores_api' times 'list_number_of_stores' and 'retrieve_stores_data' against a
+        local store API, with at most 'MAX_STORES' stores and an empty cache on every run.
+        '''
+        stores = self.table('store_details', min(rows, MAX_STORES))
+        routes = {'/number_stores': json.dumps({'number_stores': len(stores)}).encode()}
+        for number, record in enumerate(stores.to_dict('records')):
+            routes[f'/store_details/{number}'] = json.dumps(record, default=str).encode()
+        server = LocalHTTPServer(routes).start()
+        try:
+            def run(extractor):
+                store_number = extractor.list_number_of_stores(f"{server.url}/number_stores", {})
+                extractor.retrieve_stores_data(f"{server.url}/store_details", {}, store_number)
+            return len(stores), self.time(lambda: (self.extractor(),), run)
+        finally:
+            server.stop()
+
+    def extract_date_events(self, rows):
+        '''
+        The method 'extract_date_events' times 'retrieve_date_events_data' against a local copy of
+        'date_details.json', with an empty cache on every run.
+        '''
+        df = self.table('date_times', rows)
+        server = LocalHTTPServer({'/date_details.json': df.to_json().encode()}).start()
+        try:
+            run = lambda extractor: extractor.retrieve_date_events_data(f"{server.url}/date_details.json", {})
+            return rows, self.time(lambda: (self.extractor(),), run)
+        finally:
+            server.stop()
+
+    def extract_pdf_cards(self, rows, workers=1):
+        '''
+        The method 'extract_pdf_cards' times 'retrieve_pdf_data' on a PDF of at most 'MAX_PDF_ROWS' card
+        details served by a local server, read in process or by a pool of worker processes, with an empty
+        cache on every run. The pool is kept between calls, so it is started by an untimed run first. It is
+        skipped if the PDF cannot be read (tabula needs Java).
+        '''
+        rows = min(rows, MAX_PDF_ROWS)
+        path = os.path.join(self.work_dir, f"card_details_{rows}.pdf")
+        if not os.path.exists(path):
+            write_table_pdf(self.table('card_details', rows), path)
+        with open(path, 'rb') as file:
+            server = LocalHTTPServer({'/card_details.pdf': file.read()}).start()
+        link = f"{server.url}/card_details.pdf"
+        extractor = self.extractor()
+        try:
+            if extractor.retrieve_pdf_data(link, max_workers=workers) is None:
+                print(f"Skipping 'extract_pdf_cards' with {workers} workers: the PDF could not be read")
+                return None
+            def setup():
+                extractor.cache = ExtractionCache(cache_dir=tempfile.mkdtemp(dir=self.work_dir))
+                return ()
+            return rows, self.time(setup, lambda: extractor.retrieve_pdf_data(link, max_workers=workers))
+        finally:
+            extractor.close_pdf_workers()
+            server.stop()
+
+    def peak_memory(self, run):
+        '''
+        The method 'peak_memory' runs a function once in a forked process and returns how far the resident 
+        memory rose above the size of the process when it started. The peak resident set size ('ru_maxrss') 
+        of a forked process starts from its size at the fork, so the earlier benchmarks are not counted. It 
+        returns None where 'fork' or 'resource' are not available, or if the function failed.
+        '''
+        if resource is None or 'fork' not in multiprocessing.get_all_start_methods():
+            return None
+        context = multiprocessing.get_context('fork')
+        receiver, sender = context.Pipe(duplex=False)
+        def measure():
+            start = resident_memory_mb()
+            run()
+            sender.send(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 - start) # KB on Linux
+        process = context.Process(target=measure)
+        process.start()
+        sender.close() # The pipe is closed once the process exits, so a failed run does not block
+        try:
+            return receiver.recv()
+        except EOFError:
+            return None
+        finally:
+            process.join()
+
+    def load_orders(self, rows, chunksize=None):
+        '''
+        The method 'load_orders' times the load of the orders as 'orders_data' does it (read, clean and upload 
+        the whole table) or, with a 'chunksize', as 'orders_data_in_chunks' does it, from the SQLite stand-in 
+        of the RDS database to SQLite or the database of 'BENCHMARK_DB_URL'. The peak memory of one more load 
+        is measured with 'peak_memory'.
+        '''
+        source_url = self.sqlite_engine(rows).url
+        url = os.environ.get('BENCHMARK_DB_URL', f"sqlite:///{os.path.join(self.work_dir, 'local.sqlite')}")
+        data_cleaner = DataCleaning()
+        def run():
+            # The engines are created by each run, as their connections cannot be shared with a forked process
+            source, connector = create_engine(source_url), DatabaseConnector()
+            connector.engine = create_engine(url)
+            extractor = self.extractor()
+            if chunksize is None:
+                df_orders = data_cleaner.clean_orders_data(extractor.read_rds_table('orders_table', source))
+                connector.upload_to_db(df_orders, 'benchmark_orders_table')
+            else:
+                df_chunks = extractor.read_rds_table_in_chunks('orders_table', source, chunksize)
+                connector.upload_chunks_to_db(data_cleaner.clean_in_chunks(df_chunks, data_cleaner.clean_orders_data), 
+                                              'benchmark_orders_table')
+            source.dispose()
+            connector.engine.dispose()
+        return rows, self.time(lambda: (), run), {'peak_rss_mb': self.peak_memory(run)}
+
+    def sqlite_engine(self, rows):
+        '''
+        The method 'sqlite_engine' returns a SQLite database holding 'orders_table', the stand-in for the
+        RDS database.
+        '''
+        path = os.path.join(self.work_dir, f"rds_{rows}.sqlite")
+        engine = create_engine(f"sqlite:///{path}")
+        if not os.path.exists(path):
+            self.table('orders', rows).to_sql('orders_table', engine, index=False, chunksize=100000)
+        return engine
+
+    def extract_sql_orders(self, rows):
+        '''
+        The method 'extract_sql_orders' times 'read_rds_table' on the SQLite stand-in.
+        '''
+        engine = self.sqlite_engine(rows)
+        run = lambda extractor: extractor.read_rds_table('orders_table', engine)
+        return rows, self.time(lambda: (self.extractor(),), run)
+
+    def extract_sql_orders_in_chunks(self, rows):
+        '''
+        The method 'extract_sql_orders_in_chunks' times reading every chunk of 'read_rds_table_in_chunks'
+        on the SQLite stand-in.
+        '''
+        engine = self.sqlite_engine(rows)
+        run = lambda extractor: sum(len(chunk) for chunk in extractor.read_rds_table_in_chunks('orders_table', engine))
+        return rows, self.time(lambda: (self.extractor(),), run)
+
+    @contextlib.contextmanager
+    def s3_products(self, rows):
+        '''
+        The method 's3_products' starts a local 'moto' S3 server holding the products CSV, and points boto3 at
+        it while the context is open. It yields the S3 address of the file, or None if 'moto' is not installed.
+        '''
+        try:
+            from moto.server import ThreadedMotoServer # Optional, only needed for the S3 benchmarks
+            import boto3
+        except ImportError:
+            yield None
+            return
+
+        server = ThreadedMotoServer(ip_address='127.0.0.1', port=0)
+        server.start()
+        environment = dict(os.environ)
+        os.environ.update({
+            'AWS_ENDPOINT_URL_S3': f"http://127.0.0.1:{server.get_host_and_port()[1]}",
+            'AWS_ACCESS_KEY_ID': 'benchmark',
+            'AWS_SECRET_ACCESS_KEY': 'benchmark',
+            'AWS_DEFAULT_REGION': 'eu-west-1'
+            })
+        try:
+            # The moto servers of a process share their buckets, so each server gets a bucket of its own
+            bucket_name = f"benchmark-{uuid.uuid4().hex}"
+            s3 = boto3.client('s3')
+            s3.create_bucket(Bucket=bucket_name, CreateBucketConfiguration={'LocationConstraint': 'eu-west-1'})
+            s3.put_object(Bucket=bucket_name, Key='products.csv', Body=self.table('products', rows).to_csv().encode())
+            yield f"s3://{bucket_name}/products.csv"
+        finally:
+            os.environ.clear()
+            os.environ.update(environment)
+            server.stop()
+
+    def extract_s3_products(self, rows, mode='file'):
+        '''
+        The method 'extract_s3_products' times the extraction of the products CSV from a local 'moto' S3
+        server, with an empty cache on every run, and measures the peak memory of one more extraction with
+        'peak_memory'. With mode 'file' the object is downloaded to a file and read by 'extract_from_s3', with
+        'stream' it is parsed in chunks from the response stream by 'extract_from_s3_in_chunks', and with 
+        'parts' it is downloaded with parallel ranged GETs of 1 MB and then parsed in chunks. It is skipped if 
+        'moto' is not installed.
+        '''
+        with self.s3_products(rows) as s3_address:
+            if s3_address is None:
+                print(f"Skipping the S3 benchmark ({mode}): moto is not installed")
+                return None
+            if mode == 'file':
+                run = lambda extractor: extractor.extract_from_s3(s3_address)
+            else:
+                run = lambda extractor: sum(len(df_chunk) for df_chunk in extractor.extract_from_s3_in_chunks(
+                    s3_address, parallel_parts=mode == 'parts', part_size=1024 ** 2))
+            times = self.time(lambda: (self.extractor(),), run)
+            return rows, times, {'peak_rss_mb': self.peak_memory(lambda: run(self.extractor()))}
+
+    def upload_orders(self, rows):
+        '''
+        The method 'upload_orders' times 'upload_to_db' with the cleaned orders, on SQLite or on the
+        database of 'BENCHMARK_DB_URL'.
+        '''
+        connector = DatabaseConnector()
+        url = os.environ.get('BENCHMARK_DB_URL', f"sqlite:///{os.path.join(self.work_dir, 'local.sqlite')}")
+        connector.engine = create_engine(url)
+        df = DataCleaning().clean_orders_data(self.table('orders', rows).copy())
+        return rows, self.time(lambda: (), lambda: connector.upload_to_db(df, 'benchmark_orders_table'))
+
+    def scenario_connector(self, rows):
+        '''
+        The method 'scenario_connector' returns a connector to the PostgreSQL database of 'BENCHMARK_DB_URL',
+        which holds the cleaned stores, products, dates and orders and the sales rollup refreshed from them. 
+        The tables are loaded once for each number of rows, into their own schema so the tables of the 
+        database are left alone. It returns None if 'BENCHMARK_DB_URL' is not a PostgreSQL database, as the 
+        scenarios are written for PostgreSQL.
+        '''
+        url = os.environ.get('BENCHMARK_DB_URL', '')
+        if not url.startswith('postgresql'):
+            return None
+        if rows not in self.scenario_connectors:
+            schema = f"benchmark_scenarios_{rows}"
+            with create_engine(url).begin() as connection:
+                connection.exec_driver_sql(f"DROP SCHEMA IF EXISTS {schema} CASCADE; CREATE SCHEMA {schema}")
+            connector = DatabaseConnector()
+            connector.engine = create_engine(url, connect_args={'options': f"-csearch_path={schema}"})
+            generator = SyntheticDataGenerator(self.seed)
+            stores = generator.store_details(max(rows // 1000, 10))
+            products = generator.products(max(rows // 100, 10))
+            date_times = generator.date_times(rows)
+            orders = generator.orders(rows, stores=stores, products=products, date_times=date_times)
+            data_cleaner = DataCleaning()
+            connector.upload_to_db(data_cleaner.clean_store_data(stores), 'dim_store_details')
+            connector.upload_to_db(data_cleaner.convert_product_weights(data_cleaner.clean_products_data(products)), 
+                                   'dim_products')
+            connector.upload_to_db(data_cleaner.clean_event_data(date_times), 'dim_date_times')
+            connector.upload_to_db(data_cleaner.clean_orders_data(orders), 'orders_table')
+            for script_name in ('Adding_sale_timestamp_and_indexes.sql', 'Creating_the_sales_rollup_table.sql'):
+                connector.run_sql_script(os.path.join('Create_the_database_schema_sql', script_name))
+            connector.refresh_sales_rollup(full_refresh=True)
+            self.scenario_connectors[rows] = connector
+        return self.scenario_connectors[rows]
+
+    def scenario(self, rows, scenario, source):
+        '''
+        The method 'scenario' times a sales scenario with 'rows' orders, either with the query on 
+        'orders_table' it ran before the rollup ('ORDERS_TABLE_SCENARIOS') or with its file in 'SCENARIO_DIR', 
+        which reads 'sales_rollup'. Before the rollup is timed, both queries are checked to give the same rows. 
+        It is skipped without a PostgreSQL 'BENCHMARK_DB_URL'.
+        '''
+        connector = self.scenario_connector(rows)
+        if connector is None:
+            print(f"Skipping 'scenario_{scenario}_{source}': BENCHMARK_DB_URL is not a PostgreSQL database")
+            return None
+
+        def query(sql):
+            with connector.engine.connect() as connection:
+                return connection.exec_driver_sql(sql).fetchall()
+
+        with open(os.path.join(SCENARIO_DIR, f"{scenario}.sql"), 'r') as file:
+            rollup_sql = file.read()
+        if source == 'sales_rollup':
+            # The sums of the rollup are numeric and added in another order, so they are compared as floats
+            as_floats = lambda result: pd.DataFrame(result).map(
+                lambda value: float(value) if isinstance(value, numbers.Number) else value)
+            pd.testing.assert_frame_equal(as_floats(query(rollup_sql)), 
+                                          as_floats(query(ORDERS_TABLE_SCENARIOS[scenario])), rtol=1e-9)
+        sql = rollup_sql if source == 'sales_rollup' else ORDERS_TABLE_SCENARIOS[scenario]
+        return rows, self.time(lambda: (), lambda: query(sql))
+
+    def extractor(self):
+        '''
+        The method 'extractor' returns a 'DataExtractor' with a new empty cache, so no run is served by the
+        cache of a previous one.
+        '''
+        cache_dir = tempfile.mkdtemp(dir=self.work_dir)
+        return DataExtractor(cache=ExtractionCache(cache_dir=cache_dir))
+
+    def close(self):
+        for rows, connector in self.scenario_connectors.items():
+            with connector.engine.begin() as connection:
+                connection.exec_driver_sql(f"DROP SCHEMA IF EXISTS benchmark_scenarios_{rows} CASCADE")
+            connector.engine.dispose()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+def write_table_pdf(df, path, rows_per_page=50):
+    '''
+    The function 'write_table_pdf' writes a table to a PDF file like 'card_details.pdf': the columns are
+    left-aligned at fixed positions and the header is repeated on every page, so tabula finds one table on
+    each page. The PDF is written directly, without a PDF library.
+
+        Parameters:
+                df(Dataframe): The table
+                path(String): The path of the PDF file
+                rows_per_page(Int): The number of rows on each page
+
+        Returns:
+                pages(Int): The number of pages
+    '''
+    escape = lambda text: str(text).replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    widths = [max(len(str(column)), int(df[column].astype(str).str.len().max() or 0)) * 6 + 20 
+              for column in df.columns]
+    positions = [40 + sum(widths[:number]) for number in range(len(widths))]
+    rows = df.astype(str).to_numpy().tolist()
+    page_count = max(1, -(-len(rows) // rows_per_page))
+    page_size = (max(612, positions[-1] + widths[-1] + 40), 792)
+
+    # The objects are the catalog (1), the page tree (2), the font (3), and a page and its content per page
+    objects = {1: b'<< /Type /Catalog /Pages 2 0 R >>', 3: b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>'}
+    kids = []
+    for page in range(page_count):
+        lines = [list(df.columns)] + rows[page * rows_per_page:(page + 1) * rows_per_page]
+        text = ['BT', '/F1 9 Tf']
+        for line_number, line in enumerate(lines):
+            for position, value in zip(positions, line):
+                text.append(f"1 0 0 1 {position} {page_size[1] - 40 - 12 * line_number} Tm ({escape(value)}) Tj")
+        text.append('ET')
+        content = '\n'.join(text).encode('latin-1', 'replace')
+        page_id, content_id = 4 + 2 * page, 5 + 2 * page
+        objects[content_id] = b'<< /Length %d >>\nstream\n' % len(content) + content + b'\nendstream'
+        objects[page_id] = (b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 3 0 R >> >> '
+                            b'/Contents %d 0 R >>' % (page_size[0], page_size[1], content_id))
+        kids.append(f"{page_id} 0 R")
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {page_count} >>".encode()
+
+    pdf = bytearray(b'%PDF-1.4\n')
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(pdf)
+        pdf += b'%d 0 obj\n' % object_id + objects[object_id] + b'\nendobj\n'
+    xref = len(pdf)
+    pdf += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for object_id in sorted(objects):
+        pdf += b'%010d 00000 n \n' % offsets[object_id]
+    pdf += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    with open(path, 'wb') as file:
+        file.write(pdf)
+    return page_count
+
+def build_stores_frame_concat(results):
+    '''
+    The function 'build_stores_frame_concat' is the baseline of 'DataExtractor.build_stores_frame': a 
+    one-row DataFrame is made of each store and the DataFrames are concatenated, and the stores which could 
+    not be retrieved are left out.
+
+        Parameters:
+                results(List): The store data of each store number, None for the stores which failed
+
+        Returns:
+                concat_df_stores(Dataframe): The combined data of the stores
+    '''
+    df_stores = []
+    for index, data in enumerate(results):
+        if data is not None:
+            df_store = pd.DataFrame(data, index = [index])
+            df_stores.append(df_store)
+    return pd.concat(df_stores)
+
+def clean_user_data_apply(df_user):
+    '''
+    The function 'clean_user_data_apply' is the baseline of 'DataCleaning.clean_user_data': the phone 
+    numbers are normalised by a chain of per-row apply() calls and the dates are parsed value by value 
+    ('format='mixed'' stands in for 'infer_datetime_format', which pandas no longer accepts).
+
+        Parameters:
+                df_user(Dataframe): A dataframe containing the user data
+
+        Returns:
+                df_user(Dataframe): A cleaned dataframe
+    '''
+    df_user = df_user.replace(['NULL', 'N/A', 'None'], np.nan)
+    df_user = df_user.dropna()
+
+    df_user['country_code'] = df_user['country_code'].astype('str').apply(lambda x: x.replace('GGB', 'GB'))
+
+    indexes = [752, 1046, 2995, 3536, 5306, 6420, 8386, 9013, 10211, 10360, 11366, 12177, 13111, 14101, 14499]
+    df_user = df_user.drop(indexes, errors='ignore')
+
+    columns = ['first_name', 'phone_number']
+    df_user[columns] = df_user[columns].apply(lambda x: x.str.replace(r'[.,x]', '', regex=True))
+    df_user[['first_name', 'last_name']] = df_user[['first_name', 'last_name']].apply(lambda x: x.str.capitalize())
+
+    df_user['phone_number'] = df_user['phone_number'].apply(lambda x: x[1:] if x.startswith('+') else x)
+    df_user['phone_number'] = df_user['phone_number'].apply(lambda x: '00' + x if not x.startswith('00') else x)
+    df_user['phone_number'] = df_user['phone_number'].astype('str').apply(lambda x: x.replace('-', ''))
+    df_user['phone_number'] = df_user['phone_number'].astype('str').apply(lambda x: x.replace(' ', ''))
+
+    df_user['address'] = df_user['address'].str.replace(r'[/,\n]', ',', regex=True)
+
+    df_user['date_of_birth'] = pd.to_datetime(df_user['date_of_birth'], format='mixed', errors='coerce')
+    df_user['join_date'] = pd.to_datetime(df_user['join_date'], format='mixed', errors='coerce')
+
+    return df_user
+
+def convert_product_weights_apply(df_products):
+    '''
+    The function 'convert_product_weights_apply' is the baseline of 'DataCleaning.convert_product_weights': 
+    each weight goes through three per-row apply() calls, which multiply the multipacks, convert the unit to 
+    kilograms and round the weight, and the weights are kept as strings.
+
+        Parameters:
+                df_products(Dataframe): A dataframe containing the cleaned products data
+
+        Returns:
+                df_products(Dataframe): The dataframe, with the weights converted in place
+    '''
+    def multiply_weight(weight):
+        if isinstance(weight, str) and 'x' in weight:
+            parts = weight.split('x')
+            numeric_part = int(parts[1].strip()[:-1])
+            multiplied_value = int(parts[0].strip()) * numeric_part
+            return str(multiplied_value) + 'g'
+        else:
+            return weight
+
+    def convert_units_to_kg(weight):
+        if isinstance(weight, str):
+            if weight.endswith('kg'):
+                numeric_part = float(weight[:-2])
+                return str(numeric_part) + 'kg'
+            elif weight.endswith('g'):
+                numeric_part = float(weight[:-1]) / 1000
+                return str(numeric_part) + 'kg'
+            elif weight.endswith('ml'):
+                numeric_part = float(weight[:-2]) / 1000
+                return str(numeric_part) + 'kg'
+            elif weight.endswith('oz'):
+                numeric_part = float(weight[:-2]) / 35.274
+                return str(numeric_part) + 'kg'
+        return weight
+
+    def convert_weight_to_3_decimal_points(weight):
+        if isinstance(weight, str):
+            numeric_part = round(float(weight[:-2]), 3)
+            return str(numeric_part) + 'kg'
+        return weight
+
+    df_products['weight'] = df_products['weight'].apply(multiply_weight)
+    df_products['weight'] = df_products['weight'].apply(convert_units_to_kg)
+    df_products['weight'] = df_products['weight'].apply(convert_weight_to_3_decimal_points)
+    df_products['weight'] = df_products['weight'].astype(str).str.replace('kg','')
+
+    return df_products
+
+def validate_card_numbers_loop(card_number, card_provider):
+    '''
+    The function 'validate_card_numbers_loop' is the baseline of 'validate_card_numbers': the same checks 
+    written as a Python loop over the rows.
+
+        Parameters:
+                card_number(Series): The cleaned card numbers
+                card_provider(Series): The provider of each card
+
+        Returns:
+                reasons(List): The reason of each card number
+    '''
+    reasons = []
+    for number, provider in zip(card_number, card_provider):
+        if not isinstance(number, str) or not number:
+            reasons.append('missing')
+        elif not number.isdigit() or not number.isascii():
+            reasons.append('not_digits')
+        elif provider not in CARD_PROVIDER_RULES:
+            reasons.append('unknown_provider')
+        elif len(number) not in CARD_PROVIDER_RULES[provider][1]:
+            reasons.append('length')
+        elif not any(low <= number[:len(low)] <= (high or low) 
+                     for low, _, high in (prefix.partition('-') for prefix in CARD_PROVIDER_RULES[provider][0])):
+            reasons.append('prefix')
+        else:
+            total = 0
+            for position, digit in enumerate(reversed(number)):
+                digit = int(digit) * (2 if position % 2 else 1)
+                total += digit - 9 if digit > 9 else digit
+            reasons.append('valid' if total % 10 == 0 else 'luhn')
+    return reasons
+
+def git_commit():
+    '''
+    The function 'git_commit' returns the commit the benchmarks are run on, with '+' if the working tree has
+    uncommitted changes.
+
+        Parameters:
+                None
+
+        Returns:
+                commit(String): The short hash of the commit, or 'unknown' outside a git repository
+    '''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                               text=True, check=True).stdout.strip()
+        return commit + ('+' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def compare(records, previous_records, threshold):
+    '''
+    The function 'compare' compares the median time of each benchmark with the last run of the same
+    benchmark and number of rows on another commit.
+
+        Parameters:
+                records(List): The records of this run
+                previous_records(List): The records of the previous runs, oldest first
+                threshold(Float): The slowdown reported as a regression, e.g. 0.1 for 10%
+
+        Returns:
+                regressions(List): The names of the benchmarks which regressed
+    '''
+    regressions = []
+    for record in records:
+        baseline = next((previous for previous in reversed(previous_records)
+                         if (previous['benchmark'], previous['rows']) == (record['benchmark'], record['rows'])
+                         and previous['commit'] != record['commit']), None)
+        if baseline is None:
+            continue
+        change = record['median'] / baseline['median'] - 1
+        regressed = change > threshold
+        print(f"{record['benchmark']} ({record['rows']} rows): {baseline['median']:.4f}s on {baseline['commit']} "
+              f"-> {record['median']:.4f}s ({change:+.1%}){' REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append(f"{record['benchmark']}[{record['rows']}]")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the extract, clean and upload steps on synthetic data.')
+    parser.add_argument('benchmarks', nargs='*', help='The benchmarks to run, all by default')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000],
+                        help='The numbers of rows to run every benchmark with (e.g. 10000 1000000 10000000)')
+    parser.add_argument('--repeat', type=int, default=3, help='The number of times each benchmark is run')
+    parser.add_argument('--seed', type=int, default=0, help='The seed of the synthetic data')
+    parser.add_argument('--workers', type=int, nargs='*', 
+                        default=WORKER_COUNTS, help='The numbers of worker processes of the sharded clean benchmarks')
+    parser.add_argument('--compare', action='store_true',
+                        help='Compare with the last results of another commit, and exit with 1 on a regression')
+    parser.add_argument('--threshold', type=float, default=0.1, help='The slowdown reported as a regression')
+    parser.add_argument('--results', default=RESULTS_FILE, help='The file the results are appended to')
+    args = parser.parse_args()
+
+    suite = BenchmarkSuite(repeat=args.repeat, seed=args.seed, workers=args.workers)
+    unknown = [name for name in args.benchmarks if name not in suite.benchmarks]
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(unknown)}. Choose from: {', '.join(suite.benchmarks)}")
+
+    previous_records = []
+    if os.path.exists(args.results):
+        with open(args.results, 'r') as file:
+            previous_records = [json.loads(line) for line in file if line.strip()]
+
+    commit = git_commit()
+    environment = {'commit': commit, 'python': platform.python_version(), 'pandas': pd.__version__,
+                   'time': time.strftime('%Y-%m-%dT%H:%M:%S%z')}
+    records = []
+    try:
+        for rows in args.rows:
+            for name in args.benchmarks or suite.benchmarks:
+                record = suite.run(name, rows)
+                if record is not None:
+                    record.update(environment)
+                    records.append(record)
+                    print(json.dumps({key: round(value, 4) if isinstance(value, float) else value
+                                      for key, value in record.items()}))
+    finally:
+        suite.close()
+
+    os.makedirs(os.path.dirname(args.results) or '.', exist_ok=True)
+    with open(args.results, 'a') as file:
+        for record in records:
+            file.write(json.dumps(record) + '\n')
+
+    if args.compare and compare(records, previous_records, args.threshold):
+        sys.exit(1)
@@ -0,0 +1,386 @@
+from collections import defaultdict
+import pandas as pd
+import re
+import string
+import time
+
+# Matches a regex which removes a single character or a class of single characters, e.g. '\?' or '[.,x]'.
+# Consecutive removals of single characters give the same result in any order, so they can be fused
+SINGLE_CHARACTER_PATTERN = re.compile(r'^(?:\[(?:[^\]\\]|\\.)+\]|\\.|[^\\\[\](){}.*+?^$|])$')
+
+# The Arrow-backed dtype of each kind of column used by 'CleaningEngine.apply_types'
+ARROW_TYPES = {
+    'int8': 'int8[pyarrow]',
+    'int16': 'int16[pyarrow]',
+    'int64': 'int64[pyarrow]',
+    'float64': 'double[pyarrow]',
+    'timestamp': 'timestamp[ns][pyarrow]',
+    'string': 'string[pyarrow]',
+    'bool': 'bool[pyarrow]'
+    }
+
+class CleaningEngine():
+    '''
+    The class 'CleaningEngine' cleans a dataframe by following a list of declarative rules. Each rule is a
+    tuple '(target, operation, argument)', where the target is a column name, a list of column names, '*'
+    for every column or a slice of column positions (e.g. 'slice(1, None)' for every column but the first).
+
+    The rules are applied in order. Before they are applied, they are compiled into as few vectorized passes
+    as possible: the null tokens become one 'isin' mask for each text column, consecutive removals of single
+    characters from a column are fused into one regex, and repeated string casts are dropped. Every pass
+    works on a single column and assigns it back, so the data is never copied as a whole. The rules are
+    applied to a shallow copy of the input dataframe, which is left unchanged.
+
+    Column operations
+    -----------------
+    as_str(None): Casts the column to strings, missing values become 'nan'
+    replace((pattern, replacement)): Replaces a literal string, or a regex if the pattern is compiled
+    replace_values((values, value)): Replaces the whole values found in a list
+    capitalize(None): Capitalizes the first letter of each value
+    strip_prefix(prefix): Removes a prefix from the values which start with it
+    null_if_contains(pattern): Sets the values matching a compiled regex to NaN
+    dates(formats): Parses dates with a list of explicit formats, or by inference if None
+    time(format): Parses the values with an explicit format (inferred if None) and keeps their time of day
+    numeric(decimals): Converts to numbers (non-numeric values become NaN), rounded if 'decimals' is given
+    int(dtype): Casts the column to integers, or to a nullable integer dtype (e.g. 'Int16') if given, in which
+                case values which are not numeric become missing
+    map(mapping): Maps each value with a dictionary, values which are not in it become NaN
+    fillna(value): Replaces the missing values with a value
+    category(None): Stores the column as a categorical column
+    function(function): Applies a vectorized function to the column
+
+    Frame operations
+    ----------------
+    null_tokens(tokens): Replaces the tokens (e.g. 'NULL') with NaN in the targeted text columns
+    dropna(None): Drops the rows with a missing value
+    drop_index(labels): Drops the rows with the given index labels, if they are present
+    blank_rows((column, predicate, argument)): Sets the targeted columns to NaN in the rows where the
+                                               predicate ('isna', 'not_contains', 'not_numeric') is true
+    drop_columns(columns): Drops columns
+    rename(mapping): Renames columns
+    timestamp((template, format, timezone)): Creates the targeted column by joining the text of other columns
+                                             with a template (e.g. '{year}-{month}-{day} {timestamp}') and
+                                             parsing it in one call with an explicit format. Values which do
+                                             not match become NaT, the timezone can be None
+    calendar(attributes): Adds a column for each attribute ('quarter', 'iso_week', 'iso_weekday' as compact
+                          'Int8', 'is_month_start' as 'boolean') of the targeted timestamp column, keyed by
+                          the name of the new column. Missing timestamps give missing attributes
+
+    Attributes
+    ----------
+    backend(String): 'pandas' to clean object columns, 'pyarrow' to convert the text columns to
+                     'string[pyarrow]' first so the string operations run in Arrow compute kernels
+                     (missing values then stay NA instead of becoming the string 'nan')
+    timings(Dictionary): The total time spent on each rule, keyed by 'name:target:operation'
+
+    Methods
+    -------
+    compile(self, rules)
+    is_single_character_removal(self, argument)
+    clean(self, df, rules, name, types)
+    apply_types(self, df, types)
+    apply_rule(self, df, target, operation, argument)
+    resolve_columns(self, df, target)
+    parse_dates(self, dates, date_formats)
+    report_timings(self)
+    '''
+
+    def __init__(self, backend='pandas'):
+        if backend not in ('pandas', 'pyarrow'):
+            raise ValueError(f"Unknown backend '{backend}', use 'pandas' or 'pyarrow'")
+        self.backend = backend
+        self.timings = defaultdict(float)
+        self.compiled = {}
+
+    def compile(self, rules):
+        '''
+        The method 'compile' turns a list of rules into the list of passes which is actually run. A frame
+        rule 'null_tokens' on every column is kept as a single pass which builds one mask per column,
+        consecutive single-character removals on the same column are fused into one regex, and a string
+        cast directly after another one is dropped.
+
+            Parameters:
+                    rules(List): The rules of a table
+
+            Returns:
+                    passes(List): The compiled rules
+        '''
+        passes = []
+        for target, operation, argument in rules:
+            previous = passes[-1] if passes else None
+            if previous and previous[0] == target and isinstance(target, str) and target != '*':
+                # A string cast directly after another one changes nothing
+                if operation == previous[1] == 'as_str':
+                    continue
+                # Removing one set of single characters and then another is one removal of their union
+                if operation == previous[1] == 'replace' and self.is_single_character_removal(argument) \
+                        and self.is_single_character_removal(previous[2]):
+                    fused = re.compile(f"{previous[2][0].pattern}|{argument[0].pattern}")
+                    passes[-1] = (target, 'replace', (fused, ''))
+                    continue
+            passes.append((target, operation, argument))
+
+        return passes
+
+    def is_single_character_removal(self, argument):
+        '''
+        The method 'is_single_character_removal' checks if the argument of a 'replace' rule removes single
+        characters, e.g. (re.compile(r'[.,x]'), '').
+
+            Parameters:
+                    argument(Tuple): The (pattern, replacement) of a 'replace' rule
+
+            Returns:
+                    removal(Bool): True if the rule only removes single characters
+        '''
+        pattern, replacement = argument
+        return replacement == '' and isinstance(pattern, re.Pattern) and pattern.flags == re.UNICODE \
+            and bool(SINGLE_CHARACTER_PATTERN.match(pattern.pattern))
+
+    def clean(self, df, rules, name='table', types=None):
+        '''
+        The method 'clean' compiles the rules of a table (once, the compiled rules are cached) and applies
+        them to the dataframe, recording the time spent on each rule. With the 'pyarrow' backend the columns
+        are then given their final Arrow-backed types by 'apply_types'.
+
+            Parameters:
+                    df(Dataframe): The dataframe to clean, it is not modified
+                    rules(List): The rules of the table
+                    name(String): The name of the table, used in the timings
+                    types(Dictionary): The final type of each column, see 'apply_types'
+
+            Returns:
+                    df(Dataframe): The cleaned dataframe
+        '''
+        if id(rules) not in self.compiled:
+            self.compiled[id(rules)] = self.compile(rules)
+
+        df = df.copy(deep=False) # New columns are assigned to the copy, the columns of the input are kept
+        if self.backend == 'pyarrow':
+            for column in df.columns[df.dtypes == object]:
+                df[column] = df[column].astype('string[pyarrow]')
+
+        for target, operation, argument in self.compiled[id(rules)]:
+            start = time.perf_counter()
+            df = self.apply_rule(df, target, operation, argument)
+            self.timings[f"{name}:{target}:{operation}"] += time.perf_counter() - start
+
+        if self.backend == 'pyarrow' and types:
+            start = time.perf_counter()
+            df = self.apply_types(df, types)
+            self.timings[f"{name}:*:apply_types"] += time.perf_counter() - start
+
+        return df
+
+    def apply_types(self, df, types):
+        '''
+        The method 'apply_types' converts the cleaned columns to compact Arrow-backed types. The kinds are
+        'category' for low-cardinality text (a pandas categorical), 'int8', 'int16', 'int64' and 'float64'
+        for numbers (values which are not numeric become null), 'timestamp' for dates, 'string' for text and 
+        'bool' for flags.
+        Columns which are not in the dataframe are skipped.
+
+            Parameters:
+                    df(Dataframe): The cleaned dataframe
+                    types(Dictionary): Maps column names to one of the kinds above
+
+            Returns:
+                    df(Dataframe): The dataframe with the new types
+        '''
+        for column, kind in types.items():
+            if column not in df.columns:
+                continue
+            series = df[column]
+            if kind == 'category':
+                series = series.astype('category')
+            elif kind in ('int8', 'int16', 'int64', 'float64'):
+                series = pd.to_numeric(series, errors='coerce').astype(ARROW_TYPES[kind])
+            elif kind == 'timestamp':
+                series = pd.to_datetime(series, errors='coerce').astype(ARROW_TYPES[kind])
+            elif kind in ('string', 'bool'):
+                series = series.astype(ARROW_TYPES[kind])
+            else:
+                raise ValueError(f"Unknown type '{kind}'")
+            df[column] = series
+
+        return df
+
+    def resolve_columns(self, df, target):
+        '''
+        The method 'resolve_columns' returns the names of the columns a rule targets.
+
+            Parameters:
+                    df(Dataframe): The dataframe being cleaned
+                    target(String, List or slice): The target of the rule
+
+            Returns:
+                    columns(List): The names of the columns
+        '''
+        if isinstance(target, slice):
+            return list(df.columns[target])
+        if target == '*':
+            return list(df.columns)
+        if isinstance(target, str):
+            return [target]
+        return list(target)
+
+    def apply_rule(self, df, target, operation, argument):
+        '''
+        The method 'apply_rule' applies one compiled rule to the dataframe.
+
+            Parameters:
+                    df(Dataframe): The dataframe being cleaned
+                    target(String, List or slice): The target of the rule
+                    operation(String): The name of the operation
+                    argument: The argument of the operation
+
+            Returns:
+                    df(Dataframe): The dataframe after the rule
+        '''
+        # Frame operations
+        if operation == 'dropna':
+            return df.dropna()
+        if operation == 'drop_index':
+            return df.drop(argument, errors='ignore') # A chunk or shard only contains some of the labels
+        if operation == 'drop_columns':
+            df.drop(columns=argument, inplace=True)
+            return df
+        if operation == 'rename':
+            df.rename(columns=argument, inplace=True)
+            return df
+        if operation == 'timestamp':
+            template, date_format, timezone = argument
+            text = None
+            for literal, field, _, _ in string.Formatter().parse(template):
+                if literal:
+                    text = literal if text is None else text + literal
+                if field:
+                    text = df[field].astype(str) if text is None else text + df[field].astype(str)
+            series = pd.to_datetime(text, format=date_format, errors='coerce')
+            df[target] = series.dt.tz_localize(timezone) if timezone else series
+            return df
+        if operation == 'calendar':
+            timestamps = df[target]
+            missing = timestamps.isna()
+            for column, attribute in argument.items():
+                if attribute == 'quarter':
+                    values = timestamps.dt.quarter
+                elif attribute in ('iso_week', 'iso_weekday'):
+                    values = timestamps.dt.isocalendar()['week' if attribute == 'iso_week' else 'day']
+                elif attribute == 'is_month_start':
+                    df[column] = timestamps.dt.is_month_start.astype('boolean').mask(missing)
+                    continue
+                else:
+                    raise ValueError(f"Unknown calendar attribute '{attribute}'")
+                df[column] = values.astype('Int8').mask(missing)
+            return df
+        if operation == 'blank_rows':
+            column, predicate, predicate_argument = argument
+            if predicate == 'isna':
+                mask = df[column].isna()
+            elif predicate == 'not_contains':
+                mask = ~df[column].str.contains(predicate_argument, regex=False).fillna(False).astype(bool)
+            elif predicate == 'not_numeric':
+                mask = pd.to_numeric(df[column], errors='coerce').isna()
+            else:
+                raise ValueError(f"Unknown predicate '{predicate}'")
+            for blanked in self.resolve_columns(df, target):
+                df[blanked] = df[blanked].mask(mask.to_numpy())
+            return df
+
+        # Column operations
+        for column in self.resolve_columns(df, target):
+            series = df[column]
+            if operation == 'null_tokens':
+                if pd.api.types.is_string_dtype(series.dtype): # Object, 'string' and Arrow string columns
+                    mask = series.isin(argument)
+                    if mask.any():
+                        series = series.mask(mask)
+                    else:
+                        continue # Nothing to replace, keep the column as it is
+            elif operation == 'as_str':
+                series = series.astype('string[pyarrow]' if self.backend == 'pyarrow' else str)
+            elif operation == 'replace':
+                pattern, replacement = argument
+                series = series.str.replace(pattern, replacement, regex=isinstance(pattern, re.Pattern))
+            elif operation == 'replace_values':
+                values, value = argument
+                series = series.replace(values, value)
+            elif operation == 'capitalize':
+                series = series.str.capitalize()
+            elif operation == 'strip_prefix':
+                series = series.str.replace(re.compile(f"^{re.escape(argument)}"), '', regex=True)
+            elif operation == 'null_if_contains':
+                mask = series.str.contains(argument, regex=True).fillna(False).astype(bool)
+                series = series.mask(mask)
+            elif operation == 'dates':
+                series = self.parse_dates(series, argument)
+            elif operation == 'time':
+                if argument is None:
+                    series = pd.to_datetime(series).dt.time
+                else: # A fixed ISO date in front keeps a time-only format on the fast ISO parser
+                    series = pd.to_datetime('1970-01-01 ' + series.astype(str), format=f"%Y-%m-%d {argument}", 
+                                            errors='coerce').dt.time
+            elif operation == 'numeric':
+                series = pd.to_numeric(series, errors='coerce')
+                if argument is not None:
+                    series = series.round(argument)
+            elif operation == 'int':
+                if argument is None:
+                    series = series.astype(int)
+                else:
+                    series = pd.to_numeric(series, errors='coerce').astype(argument)
+            elif operation == 'map':
+                series = series.map(argument)
+            elif operation == 'fillna':
+                series = series.fillna(argument)
+            elif operation == 'category':
+                series = series.astype('category')
+            elif operation == 'function':
+                series = argument(series)
+            else:
+                raise ValueError(f"Unknown operation '{operation}'")
+            df[column] = series
+
+        return df
+
+    def parse_dates(self, dates, date_formats=None):
+        '''
+        The method 'parse_dates' converts a column of date strings to datetimes using a list of explicit
+        formats instead of inferring the format of every value. The first format is applied to the whole
+        column and each of the following formats only to the values which are still not parsed. Values
+        which match none of the formats become NaT. Without formats, the format is inferred.
+
+            Parameters:
+                    dates(Series): A column containing the date strings
+                    date_formats(List): The date formats to try, the most common one first
+
+            Returns:
+                    parsed_dates(Series): A datetime column
+        '''
+        if not date_formats:
+            return pd.to_datetime(dates, errors='coerce')
+
+        parsed_dates = pd.to_datetime(dates, format=date_formats[0], errors='coerce')
+        for date_format in date_formats[1:]:
+            unparsed = parsed_dates.isna() & dates.notna()
+            if not unparsed.any():
+                break
+            parsed_dates[unparsed] = pd.to_datetime(dates[unparsed], format=date_format, errors='coerce')
+
+        return parsed_dates
+
+    def report_timings(self):
+        '''
+        The method 'report_timings' prints the time spent on each rule, the slowest rule first.
+
+            Parameters:
+                    None
+
+            Returns:
+                    timings(Dictionary): The total time spent on each rule
+        '''
+        for rule, seconds in sorted(self.timings.items(), key=lambda item: item[1], reverse=True):
+            print(f"{seconds:10.4f}s  {rule}")
+
+        return dict(self.timings)
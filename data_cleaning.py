@@ -1,31 +1,440 @@
+from cleaning_engine import CleaningEngine
+from concurrent.futures import ProcessPoolExecutor
+from instrumentation import instrument
+import functools
+import multiprocessing
 import numpy as np
+import os
 import pandas as pd
+import pyarrow as pa
 import re
+import shutil
+import tempfile
+import threading
+
+# The formats of the dates found in the source tables (e.g. '1968-10-16', '1968 October 16', 
+# 'October 1968 16', '1968/10/16')
+DATE_FORMATS = ['%Y-%m-%d', '%Y %B %d', '%B %Y %d', '%Y/%m/%d']
+
+# The values which stand for a missing value in the source data
+NULL_TOKENS = ['NULL', 'N/A', 'None']
+
+# A phone number needs the '00' prefix unless it starts with '00' once [.,x] and a leading '+' are removed
+PHONE_PREFIX_PATTERN = re.compile(r'^[.,x]*(?:\+[.,x]*)?0[.,x]*0')
+
+# Matches a leading '+' (with any [.,x] before it) and every [.,x], hyphen and space
+PHONE_STRIP_PATTERN = re.compile(r'^[.,x]*\+|[.,x\- ]')
+
+# Matches weights such as '3 x 200g', '1.5kg', '400ml' or '16oz'. The quantity is only given for multipacks
+WEIGHT_PATTERN = re.compile(r'^\s*(?:(?P<quantity>\d+)\s*x\s*)?(?P<value>\d+(?:\.\d+)?)\s*(?P<unit>kg|g|ml|oz)[\s.]*$')
+
+# The number each unit is divided by to convert it to kilograms
+UNIT_DIVISORS = {'kg': 1, 'g': 1000, 'ml': 1000, 'oz': 35.274}
+
+# The values of the 'removed' column of the products, which becomes the boolean column 'still_available'
+STILL_AVAILABLE_VALUES = {'Still_avaliable': True, 'Still_available': True, 'Removed': False}
+
+# The time of a sale is assembled from the text of these columns and parsed with one explicit format
+SALE_TIMESTAMP_TEMPLATE = '{year}-{month}-{day} {timestamp}'
+
+# The calendar attributes of the sale timestamp stored with the dates, so the queries do not parse text
+CALENDAR_COLUMNS = {
+    'quarter': 'quarter',
+    'iso_week': 'iso_week',
+    'iso_weekday': 'iso_weekday',
+    'is_month_start': 'is_month_start'
+    }
+
+# The weight classes of 'Adding_column_weight_class_for_dim_products_table.sql' (below 2kg, 40kg, 140kg and above)
+WEIGHT_CLASSES = ['Light', 'Mid_Sized', 'Heavy', 'Truck_Required']
+
+# The prefixes (single values or ranges of the same number of digits) and lengths of the card numbers of each 
+# provider found in the card details
+CARD_PROVIDER_RULES = {
+    'VISA 13 digit': (['4'], [13]),
+    'VISA 16 digit': (['4'], [16]),
+    'VISA 19 digit': (['4'], [19]),
+    'Mastercard': (['51-55', '2221-2720'], [16]),
+    'American Express': (['34', '37'], [15]),
+    'Discover': (['6011', '644-649', '65'], [16]),
+    'JCB 15 digit': (['1800', '2131'], [15]),
+    'JCB 16 digit': (['35'], [16]),
+    'Diners Club / Carte Blanche': (['300-305', '36', '38'], [14]),
+    'Maestro': (['50', '56-69'], [12, 13, 14, 15, 16, 17, 18, 19])
+    }
+
+# The reason codes of 'validate_card_numbers', the code of each reason is its position
+CARD_REASONS = ['valid', 'missing', 'not_digits', 'unknown_provider', 'length', 'prefix', 'luhn']
+
+# The sum of the digits of twice each digit, used by the Luhn checksum
+LUHN_DOUBLED = np.array([0, 2, 4, 6, 8, 1, 3, 5, 7, 9], dtype=np.uint8)
+
+def validate_card_numbers(card_number, card_provider, max_length=19):
+    '''
+    The function 'validate_card_numbers' checks the card numbers without a Python loop over the rows. The 
+    numbers are turned into a fixed-width uint8 matrix of digits (right-padded with zeros), on which the Luhn 
+    checksum and the first four digits are computed for every row at once. The prefix and length of each 
+    number are then checked against the rules of its provider in 'CARD_PROVIDER_RULES', one provider at a 
+    time.
+
+    Each number gets the first failing reason of 'CARD_REASONS': 'missing', 'not_digits' (any character 
+    other than a digit), 'unknown_provider', 'length', 'prefix' and 'luhn'.
+
+        Parameters:
+                card_number(Series): The cleaned card numbers
+                card_provider(Series): The provider of each card
+                max_length(Int): The maximum number of digits of a card number
+
+        Returns:
+                valid(Series): True for the valid card numbers
+                reasons(Series): The reason of each card number, a categorical of 'CARD_REASONS'
+    '''
+    width = max_length + 1 # One more character than a valid number, so longer numbers fail the length check
+    numbers = card_number.astype(object).where(card_number.notna(), '')
+    codes = numbers.to_numpy(dtype=f'U{width}').view(np.uint32).reshape(len(numbers), width)
+    present = codes != 0
+    lengths = present.sum(axis=1)
+    values = codes - ord('0')
+    is_digit = values < 10 # Unsigned, so the characters below '0' wrap around and fail as well
+    digits = np.where(is_digit, values, 0).astype(np.uint8)
+    not_digits = (present & ~is_digit).any(axis=1)
+
+    # Every second digit counting from the last one is doubled
+    doubled = (np.arange(width) & 1)[None, :] != ((lengths - 1) & 1)[:, None]
+    checksum = np.where(doubled, LUHN_DOUBLED[digits], digits).sum(axis=1, dtype=np.uint16)
+    luhn = checksum % 10 == 0
+
+    leading = digits[:, :4].astype(np.uint16) @ np.array([1000, 100, 10, 1], dtype=np.uint16)
+    known = np.zeros(len(numbers), dtype=bool)
+    length_ok = np.zeros(len(numbers), dtype=bool)
+    prefix_ok = np.zeros(len(numbers), dtype=bool)
+    provider_codes, providers = pd.factorize(card_provider)
+    for number, provider in enumerate(providers):
+        if provider not in CARD_PROVIDER_RULES:
+            continue
+        prefixes, provider_lengths = CARD_PROVIDER_RULES[provider]
+        rows = provider_codes == number
+        known |= rows
+        length_ok[rows] = np.isin(lengths[rows], provider_lengths)
+        matched = np.zeros(rows.sum(), dtype=bool)
+        for prefix in prefixes:
+            low, _, high = prefix.partition('-')
+            lead = leading[rows] // 10 ** (4 - len(low))
+            matched |= (lead >= int(low)) & (lead <= int(high or low))
+        prefix_ok[rows] = matched
+
+    reason_codes = np.select([lengths == 0, not_digits, ~known, ~length_ok, ~prefix_ok, ~luhn], 
+                             [1, 2, 3, 4, 5, 6], default=0).astype(np.int8)
+    reasons = pd.Series(pd.Categorical.from_codes(reason_codes, CARD_REASONS), index=card_number.index)
+    return pd.Series(reason_codes == 0, index=card_number.index), reasons
+
+def normalise_phone_numbers(phone_number):
+    '''
+    The function 'normalise_phone_numbers' removes a leading '+' and any [.,x], hyphens and spaces from the 
+    phone numbers in a single regex pass, and adds '00' at the start of the numbers which did not start with 
+    '00' once [.,x] and the leading '+' were removed.
+
+        Parameters:
+                phone_number(Series): A column of phone numbers
+
+        Returns:
+                phone_number(Series): The normalised phone numbers
+    '''
+    add_prefix = ~phone_number.str.contains(PHONE_PREFIX_PATTERN, regex=True).fillna(False).astype(bool)
+    phone_number = phone_number.str.replace(PHONE_STRIP_PATTERN, '', regex=True)
+    return phone_number.mask(add_prefix, '00' + phone_number)
+
+def strip_trailing_dot(weight):
+    '''
+    The function 'strip_trailing_dot' removes the dots and surrounding whitespace from the weights which end 
+    with a '.', e.g. '77g .'.
+
+        Parameters:
+                weight(Series): A column of weights
+
+        Returns:
+                weight(Series): The weights without the trailing dot
+    '''
+    ends_with_dot = weight.str.endswith('.').fillna(False).astype(bool)
+    return weight.mask(ends_with_dot, weight.str.replace('.', '', regex=False).str.strip())
+
+# The cleaning rules of each table, applied in order by 'CleaningEngine'. Each rule is a tuple 
+# (target, operation, argument), see 'CleaningEngine' for the operations
+USER_RULES = [
+    ('*', 'null_tokens', NULL_TOKENS),
+    ('*', 'dropna', None),
+    ('*', 'drop_index', [752, 1046, 2995, 3536, 5306, 6420, 8386, 9013, 10211, 10360, 11366, 12177, 13111, 14101, 14499]),
+    ('country_code', 'as_str', None),
+    ('country_code', 'replace', ('GGB', 'GB')),
+    ('country_code', 'category', None),
+    ('first_name', 'replace', (re.compile(r'[.,x]'), '')),
+    (['first_name', 'last_name'], 'capitalize', None),
+    ('phone_number', 'as_str', None),
+    ('phone_number', 'function', normalise_phone_numbers),
+    ('address', 'replace', (re.compile(r'[/,\n]'), ',')),
+    (['date_of_birth', 'join_date'], 'dates', DATE_FORMATS)
+    ]
+
+CARD_RULES = [
+    ('*', 'null_tokens', NULL_TOKENS),
+    ('card_number', 'as_str', None),
+    ('card_number', 'replace', (re.compile(r'\?'), '')),
+    ('*', 'as_str', None),
+    (['card_number', 'expiry_date'], 'null_if_contains', re.compile(r'[A-Za-z]')),
+    ('card_provider', 'blank_rows', ('card_number', 'isna', None)),
+    ('date_payment_confirmed', 'dates', ['%Y-%m-%d'])
+    ]
+
+STORE_RULES = [
+    ('*', 'null_tokens', NULL_TOKENS),
+    ('address', 'as_str', None),
+    ('address', 'replace', ('\n', ',')),
+    ('opening_date', 'dates', DATE_FORMATS),
+    ('index', 'int', None),
+    (slice(1, None), 'blank_rows', ('opening_date', 'isna', None)),
+    ('continent', 'as_str', None),
+    ('continent', 'strip_prefix', 'ee'),
+    (['longitude', 'latitude'], 'numeric', 5),
+    ('staff_numbers', 'as_str', None),
+    ('staff_numbers', 'replace', (re.compile(r'[A-Za-z]'), '')),
+    ('staff_numbers', 'int', 'Int16'),
+    ('locality', 'fillna', 'N/A'),
+    ('lat', 'as_str', None),
+    ('lat', 'replace_values', ('None', np.nan))
+    ]
+
+PRODUCT_RULES = [
+    ('product_price', 'as_str', None),
+    (slice(1, None), 'blank_rows', ('product_price', 'not_contains', '£')),
+    ('weight', 'function', strip_trailing_dot),
+    ('date_added', 'dates', DATE_FORMATS),
+    ('removed', 'map', STILL_AVAILABLE_VALUES),
+    ('*', 'rename', {'Unnamed: 0': 'index', 'removed': 'still_available'}),
+    ('product_price', 'as_str', None),
+    ('product_price', 'replace', ('£', '')),
+    ('product_price', 'numeric', None)
+    ]
+
+ORDER_RULES = [
+    ('*', 'drop_columns', ['first_name', 'last_name', '1'])
+    ]
+
+EVENT_RULES = [
+    ('*', 'null_tokens', NULL_TOKENS),
+    ('*', 'blank_rows', ('month', 'not_numeric', None)),
+    ('sale_timestamp', 'timestamp', (SALE_TIMESTAMP_TEMPLATE, '%Y-%m-%d %H:%M:%S', 'UTC')),
+    ('sale_timestamp', 'calendar', CALENDAR_COLUMNS),
+    ('timestamp', 'time', '%H:%M:%S')
+    ]
+
+# The final types of the cleaned columns when the 'pyarrow' backend is used, see 'CleaningEngine.apply_types'. 
+# Low-cardinality text columns become categoricals and numbers and dates get numeric and timestamp types
+TABLE_TYPES = {
+    'users': {
+        'country_code': 'category',
+        'date_of_birth': 'timestamp',
+        'join_date': 'timestamp'
+        },
+    'card_details': {
+        'card_provider': 'category',
+        'date_payment_confirmed': 'timestamp'
+        },
+    'store_details': {
+        'longitude': 'float64',
+        'latitude': 'float64',
+        'staff_numbers': 'int16',
+        'opening_date': 'timestamp',
+        'store_type': 'category',
+        'country_code': 'category',
+        'continent': 'category'
+        },
+    'products': {
+        'product_price': 'float64',
+        'date_added': 'timestamp',
+        'category': 'category',
+        'still_available': 'bool'
+        },
+    'orders': {
+        'product_quantity': 'int16'
+        },
+    'date_times': {
+        'time_period': 'category',
+        'quarter': 'int8',
+        'iso_week': 'int8',
+        'iso_weekday': 'int8',
+        'is_month_start': 'bool'
+        }
+    }
+
+# A table with fewer rows than this for each worker is cleaned in process, as the shards would cost more to 
+# pass to the workers than to clean
+MIN_SHARD_ROWS = 20000
+
+# The directory the shards are written to, a RAM-backed tmpfs on Linux so the Arrow files never touch the disk
+SHARD_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+def shardable(clean_method):
+    '''
+    The function 'shardable' is a decorator which runs a cleaning method of 'DataCleaning' on row shards in 
+    its process pool ('clean_in_parallel') when the cleaner has more than one worker and the table is large 
+    enough. Only methods whose rules are row-local can be sharded: each row is cleaned the same way whatever 
+    the other rows are. The row blanking of the rules is mask-based and the rows are dropped by label, so 
+    both work on a shard. Dates must be parsed with explicit formats, as an inferred format would be 
+    inferred from the first value of each shard.
+
+        Parameters:
+                clean_method(Function): The cleaning method
+
+        Returns:
+                wrapper(Function): The method, sharded when the cleaner has workers
+    '''
+    @functools.wraps(clean_method)
+    def wrapper(self, df, *args, **kwargs):
+        if self.workers > 1 and len(df) >= 2 * MIN_SHARD_ROWS:
+            return self.clean_in_parallel(df, clean_method.__name__)
+        return clean_method(self, df, *args, **kwargs)
+    return wrapper
+
+def write_arrow_file(df, path):
+    '''
+    The function 'write_arrow_file' writes a dataframe, with its index, to an Arrow IPC file.
+
+        Parameters:
+                df(Dataframe): The dataframe
+                path(String): The path of the file
+
+        Returns:
+                written(Bool): False if a column cannot be stored by Arrow (e.g. an object column mixing 
+                               numbers and strings), in which case nothing is written
+    '''
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return False
+    with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return True
+
+def missing_values(df):
+    '''
+    The function 'missing_values' finds the value which marks the missing values of each object column of a 
+    dataframe (e.g. NaN, NaT or None). Arrow stores all of them as nulls, which pandas reads back as None, 
+    so 'read_arrow_file' puts the original value back.
+
+        Parameters:
+                df(Dataframe): The dataframe
+
+        Returns:
+                missing(Dictionary): The missing value of each object column which has any
+    '''
+    missing = {}
+    for column in df.columns[(df.dtypes == object).to_numpy()]:
+        is_missing = df[column].isna().to_numpy()
+        if is_missing.any():
+            missing[column] = df[column].to_numpy()[is_missing.argmax()]
+    return missing
+
+def read_arrow_file(path, missing=None, dtypes=None):
+    '''
+    The function 'read_arrow_file' reads a dataframe written by 'write_arrow_file'. The file is memory 
+    mapped, so it is not copied before the conversion to pandas. The dtypes are restored from the pandas 
+    metadata Arrow keeps in the file, so each column, and the index, comes back with the dtype it was 
+    written with, whatever the backend. Integer columns with missing values are read as objects, as they 
+    were in the extracted tables, instead of floats.
+
+        Parameters:
+                path(String): The path of the file
+                missing(Dictionary): The missing value of each object column, see 'missing_values'
+                dtypes(Dictionary): The dtype of each column, which is restored if the metadata gives another 
+                                    one (except for categoricals, which 'clean_in_parallel' unifies)
+
+        Returns:
+                df(Dataframe): The dataframe, with its index
+    '''
+    with pa.memory_map(path) as source:
+        table = pa.ipc.open_file(source).read_all()
+    df = table.to_pandas(integer_object_nulls=True)
+    for column, dtype in (dtypes or {}).items():
+        if not isinstance(dtype, pd.CategoricalDtype) and df[column].dtype != dtype:
+            df[column] = df[column].astype(dtype)
+    for column, value in (missing or {}).items():
+        df[column] = df[column].where(df[column].notna(), value)
+    return df
+
+def clean_shard(backend, clean_method, shard, output_path, missing=None):
+    '''
+    The function 'clean_shard' runs in a worker process and cleans one shard of a table.
+
+        Parameters:
+                backend(String): The backend of the cleaner
+                clean_method(String): The name of the cleaning method, e.g. 'clean_store_data'
+                shard(String or Dataframe): The path of the Arrow file of the shard, or the shard itself if 
+                                            it could not be written to Arrow
+                output_path(String): The path of the Arrow file the cleaned shard is written to
+                missing(Dictionary): The missing value of each object column of the shard
+
+        Returns:
+                df_shard(Dataframe): None if the cleaned shard was written to 'output_path', otherwise the 
+                                     cleaned shard
+                timings(Dictionary): The time spent on each rule
+                dtypes(Dictionary): The dtype of each column of the cleaned shard
+                missing(Dictionary): The missing value of each object column of the cleaned shard
+    '''
+    data_cleaner = DataCleaning(backend)
+    df_shard = read_arrow_file(shard, missing) if isinstance(shard, str) else shard
+    df_shard = getattr(data_cleaner, clean_method)(df_shard)
+    written = write_arrow_file(df_shard, output_path)
+    return ((None if written else df_shard), dict(data_cleaner.engine.timings), df_shard.dtypes.to_dict(), 
+            missing_values(df_shard))
 
 class DataCleaning():
     '''
     The class 'DataCleaning' contains several methods designed to perform a sequence of data cleaning and 
     transformation operations on several dataframes.
 
+    The cleaning of each table is declared as a list of rules (e.g. 'USER_RULES'), which are compiled and 
+    applied by a 'CleaningEngine'. The input dataframes are not modified. With the 'pyarrow' backend the 
+    cleaned columns are also given the compact types of 'TABLE_TYPES'. With more than one worker, the 
+    methods marked 'shardable' clean large tables in row shards across a process pool.
+
+    Attributes
+    ----------
+    backend(String): 'pandas' for object columns, 'pyarrow' for Arrow-backed columns
+    engine(CleaningEngine): The engine which applies the rules, its 'timings' record the time of each rule
+    workers(Int): The number of worker processes the shardable methods use, 1 to clean in process
+
     Methods
     -------
     clean_user_data(self, df_user)
+    parse_dates(self, dates, date_formats)
     clean_card_data(self, df_card)
+    validate_card_data(self, df_card)
     clean_store_data(self, df_stores)
     clean_products_data(self, df_products)
     convert_product_weights(self, df_products)
-    multiply_weight(weight)
-    convert_units_to_kg(weight)
-    convert_weight_to_3_decimal_points(weight)
     clean_orders_data(self, df_orders)
     clean_event_data(self, df_event_data)
+    clean_in_chunks(self, chunks, clean_method)
+    clean_in_parallel(self, df, clean_method, shards)
+    close_workers(self)
+    memory_report(self, df, clean_method)
     '''
 
+    def __init__(self, backend='pandas', workers=1):
+        self.backend = backend
+        self.engine = CleaningEngine(backend)
+        self.workers = workers
+        self.executor = None
+        self.executor_lock = threading.Lock() # The pipeline cleans several tables at the same time
 
+    @instrument('clean')
+    @shardable
     def clean_user_data(self, df_user):
         '''
-        The method 'clean_user_data' it performs a series of data cleaning and transformation operations on 
-        the input dataframe 'df_user'.
+        The method 'clean_user_data' applies the rules 'USER_RULES' to the input dataframe 'df_user'. Rows 
+        with missing values and a few known invalid rows are dropped, 'GGB' is replaced with 'GB' in 
+        'country_code', the names are capitalized, the phone numbers are normalised to start with '00' and 
+        the dates are parsed.
 
             Parameters:
                     df_user(Dataframe): A dataframe containing the user data 
@@ -33,47 +442,29 @@ class DataCleaning():
             Returns:
                     df_user(Dataframe): A cleaned dataframe
         '''
-        # Drop NULL values
-        df_user = df_user.replace(['NULL', 'N/A', 'None'], np.nan)
-        df_user = df_user.dropna()
-
-        # Replace 'GGB' with 'GB' in column 'country_code' 
-        df_user['country_code'] = df_user['country_code'].astype('str').apply(lambda x: x.replace('GGB', 'GB'))
-       
-       # Clean data by dropping rows with specified indexes
-        indexes = [752, 1046, 2995, 3536, 5306, 6420, 8386, 9013, 10211, 10360, 11366, 12177, 13111, 14101, 14499]
-        df_user = df_user.drop(indexes)
-
-        # Replace [.,x] with nothing in 'Column'
-        columns = ['first_name', 'phone_number']
-        df_user[columns] = df_user[columns].apply(lambda x: x.str.replace('[\.,x]', '', regex=True))
+        return self.engine.clean(df_user, USER_RULES, 'users', TABLE_TYPES['users'])
 
-        # Capitalize the columns first_name and last_name
-        df_user[['first_name', 'last_name']] = df_user[['first_name', 'last_name']].apply(lambda x: x.str.capitalize())
-
-        # Removes '+' and adds '00' at the start of phone_number
-        df_user['phone_number'] = df_user['phone_number'].apply(lambda x: x[1:] if x.startswith('+') else x)
-        df_user['phone_number'] = df_user['phone_number'].apply(lambda x: '00' + x if not x.startswith('00') else x)
-
-        # Remove hyphens from 'phone_number'
-        df_user['phone_number'] = df_user['phone_number'].astype('str').apply(lambda x: x.replace('-', ''))
-
-        # Remove spaces from 'phone_number'
-        df_user['phone_number'] = df_user['phone_number'].astype('str').apply(lambda x: x.replace(' ', ''))
-
-        # Replace [/,\n] with a comma in 'address'
-        df_user['address'] = df_user['address'].str.replace(r'[/,\n]', ',', regex=True)
+    def parse_dates(self, dates, date_formats=DATE_FORMATS):
+        '''
+        The method 'parse_dates' converts a column of date strings to datetimes trying each of the explicit 
+        formats in turn, see 'CleaningEngine.parse_dates'.
 
-        # Convert to DateTime format
-        df_user['date_of_birth'] = pd.to_datetime(df_user['date_of_birth'], infer_datetime_format=True, errors='coerce')
-        df_user['join_date'] = pd.to_datetime(df_user['join_date'], infer_datetime_format=True, errors='coerce')
+            Parameters:
+                    dates(Series): A column containing the date strings
+                    date_formats(List): The date formats to try, the most common one first
 
-        return df_user
+            Returns:
+                    parsed_dates(Series): A datetime column
+        '''
+        return self.engine.parse_dates(dates, date_formats)
 
+    @instrument('clean')
+    @shardable
     def clean_card_data(self, df_card):
         '''
-        The method 'clean_card_data' it performs a series of data cleaning and transformation operations on 
-        the input dataframe 'df_card'.
+        The method 'clean_card_data' applies the rules 'CARD_RULES' to the input dataframe 'df_card'. '?' is 
+        removed from the card numbers, every column is cast to strings, card numbers and expiry dates with 
+        letters are set to NaN (along with the provider of those cards) and the payment dates are parsed.
 
             Parameters:
                     df_card(Dataframe): A dataframe containing the card data 
@@ -81,36 +472,38 @@ class DataCleaning():
             Returns:
                     df_card(Dataframe): A cleaned dataframe
         '''
-        # Replace NULL values with NaN
-        df_card = df_card.replace(['NULL', 'N/A', 'None'], np.nan)
-
-        # Convert card_number column to string type
-        df_card['card_number'] = df_card['card_number'].astype(str)
-
-        # Remove '?' from card_number
-        df_card['card_number'] = df_card['card_number'].str.replace(r'\?', '', regex=True)
-
-        # Convert the DataFrame to string type
-        df_card = df_card.astype(str)
+        return self.engine.clean(df_card, CARD_RULES, 'card_details', TABLE_TYPES['card_details'])
 
-        # Remove alphabetic characters from card_number  
-        df_card[['card_number', 'expiry_date']] = df_card[['card_number', 'expiry_date']].replace('[A-Za-z]', np.nan, regex=True) 
-
-        # Get indices of rows with NaN in 'card_number' column
-        indices = df_card[df_card['card_number'].isna()].index
-
-        # Replace corresponding values in 'card_provider' column with NaN
-        df_card.loc[indices, 'card_provider'] = np.nan
-
-        # Clean date columns
-        df_card['date_payment_confirmed'] = pd.to_datetime(df_card['date_payment_confirmed'], format='%Y-%m-%d', errors='coerce')
+    @instrument('clean')
+    def validate_card_data(self, df_card):
+        '''
+        The method 'validate_card_data' checks the cleaned card numbers with 'validate_card_numbers' (Luhn 
+        checksum, and prefix and length of the provider) and prints the number of invalid cards for each 
+        reason, so bad card numbers are found before 'Adding_foreign_keys.sql' fails on them. The cards are 
+        not removed.
 
-        return df_card
+        Parameters:
+                df_card(Dataframe): A dataframe containing the cleaned card data
 
+        Returns:
+                valid(Series): True for the valid card numbers
+                reasons(Series): The reason of each card number, see 'CARD_REASONS'
+        '''
+        valid, reasons = validate_card_numbers(df_card['card_number'], df_card['card_provider'])
+        counts = reasons[~valid].value_counts()
+        if counts.any():
+            print(f"{int((~valid).sum())} invalid card numbers:", 
+                  ', '.join(f"{reason}={count}" for reason, count in counts.items() if count))
+        return valid, reasons
+
+    @instrument('clean')
+    @shardable
     def clean_store_data(self, df_stores):
         '''
-        The method 'clean_store_data' it performs a series of data cleaning and transformation operations on 
-        the input dataframe 'df_stores'.
+        The method 'clean_store_data' applies the rules 'STORE_RULES' to the input dataframe 'df_stores'. 
+        Rows without a valid opening date are blanked, 'ee' is removed from the start of the continents, the 
+        coordinates are rounded to 5 decimal points, letters are removed from 'staff_numbers' (which become 
+        nullable 16-bit integers) and missing localities become 'N/A'.
 
             Parameters:
                     df_stores(Dataframe): A dataframe containing the store data 
@@ -118,49 +511,16 @@ class DataCleaning():
             Returns:
                     df_stores(Dataframe): A cleaned dataframe
         '''
-        # Replace NULL with NaN
-        df_stores = df_stores.replace(['NULL', 'N/A', 'None'], np.nan)
-
-        # Replacing '\n' with ','
-        df_stores['address'] = df_stores['address'].astype(str)
-        df_stores['address'] = df_stores['address'].str.replace('\n', ',')
-
-        # Clean date columns
-        df_stores['opening_date'] = pd.to_datetime(df_stores['opening_date'], errors='coerce')
-
-        # Get indices of rows with NaT in 'opening_date' column
-        indices = df_stores[df_stores['opening_date'].isna()].index
-
-        # Replace corresponding values in data frame with NaN
-        df_stores['index'] = df_stores['index'].astype(int)
-        df_stores.iloc[indices, 1:] = np.nan
-
-        # Clean 'ee' from the continent column
-        df_stores['continent'] = df_stores['continent'].astype(str)
-        df_stores['continent'] = df_stores['continent'].apply(lambda x: x[2:] if x.startswith('ee') else x)
-
-        # Convert the 'longitude' column to a numeric type
-        df_stores[['longitude', 'latitude']] = df_stores[['longitude', 'latitude']].apply(pd.to_numeric, errors='coerce')
-
-        # Round longitude to 5 decimal points
-        df_stores['longitude'] = df_stores['longitude'].round(5)
-
-        # Round latitude to 5 decimal points
-        df_stores['latitude'] = df_stores['latitude'].round(5)
-
-        # Remove all alphabetic characters from column 'staff_numbers'
-        df_stores['staff_numbers'] = df_stores['staff_numbers'].astype(str)
-        df_stores['staff_numbers'] = df_stores['staff_numbers'].str.replace('[A-Za-z]', '', regex=True)
-
-        # Replace 'None' with 'NaN' in column 'lat'
-        df_stores['lat'] = df_stores['lat'].astype(str).replace('None', np.nan)
-
-        return df_stores
+        return self.engine.clean(df_stores, STORE_RULES, 'store_details', TABLE_TYPES['store_details'])
 
+    @instrument('clean')
+    @shardable
     def clean_products_data(self, df_products):
         '''
-        The method 'clean_products_data' it performs a series of data cleaning and transformation operations on 
-        the input dataframe 'df_stores'.
+        The method 'clean_products_data' applies the rules 'PRODUCT_RULES' to the input dataframe 
+        'df_products'. Rows whose price has no '£' are blanked, the trailing '.' is removed from the 
+        weights, the dates are parsed, 'removed' becomes the boolean column 'still_available' and '£' is 
+        removed from the prices, which are converted to numbers.
 
             Parameters:
                     df_products(Dataframe): A dataframe containing the products data 
@@ -168,121 +528,50 @@ class DataCleaning():
             Returns:
                     df_products(Dataframe): A cleaned dataframe
         '''
-        # Find indices of entries starting with '£'
-        df_products['product_price'] = df_products['product_price'].astype(str)
-        indices = df_products[~df_products['product_price'].str.contains('£')].index
-
-        # Replace unnecessary values with 'NaN
-        df_products.iloc[indices, 1:] = np.nan
-
-        # Replace '.' with '' and remove whitespace
-        df_products['weight'] = df_products['weight'].apply(
-            lambda x: x.replace('.', '').strip() 
-            if isinstance(x, str) and x.endswith('.') 
-            else x
-            )
-        # Clean date columns
-        df_products['date_added'] = pd.to_datetime(df_products['date_added'], errors ='coerce')
-
-        # Rename column 1
-        df_products = df_products.rename(columns={'Unnamed: 0': 'index'})
-
-        # Remove "£" from column product_price
-        df_products['product_price'] = df_products['product_price'].astype(str).str.replace('£','')
-
-        return df_products
+        return self.engine.clean(df_products, PRODUCT_RULES, 'products', TABLE_TYPES['products'])
     
+    @instrument('clean')
+    @shardable
     def convert_product_weights(self, df_products):
         '''
-        The 'convert_product_weights' method is designed to modify and convert the weight column in 
-        dataframe 'df_products'. The method applies three different functions to transform the 
-        weight values in the DataFrame, the 'multiply_weight', 'convert_units_to_kg' and 
-        'convert_weight_to_3_decimal_points'.
+        The 'convert_product_weights' method is designed to convert the weight column in dataframe 
+        'df_products' to kilograms and to add the 'weight_class' column.
+
+        The distinct weights are parsed in a single pass by 'WEIGHT_PATTERN', which splits values such as 
+        '3 x 200g' and '1.5kg' into their quantity, value and unit, and mapped back to the rows, as a 
+        products table repeats a few thousand weights. The unit is converted to kilograms with the 
+        'UNIT_DIVISORS' lookup table and the result is rounded to three decimal places. Weights which cannot 
+        be parsed become NaN. The 'weight_class' buckets are the same as the CASE in 
+        'Adding_column_weight_class_for_dim_products_table.sql'.
 
         Parameters:
                 df_products(Dataframe): A dataframe containing the products data
 
         Returns:
-                df_products(Dataframe): A cleaned dataframe
+                df_products(Dataframe): A cleaned copy of the dataframe with a float 'weight' column in 
+                                        kilograms
         '''   
-        def multiply_weight(weight):
-            '''
-            The 'multiply_weight' function identifies strings with 'x' (e.g., "200g x 3"). If found, it 
-            multiplies the numeric part after 'x' by the numeric part before 'x', adding 'g' at the end to 
-            return the result.
-
-            Parameters:
-                    weight(String): The weight value containing 'x'
-
-            Returns:
-                    weight(String): The weight value with 'g' appended at the end of the string
-            '''
-            if isinstance(weight, str) and 'x' in weight:
-                parts = weight.split('x')
-                numeric_part = int(parts[1].strip()[:-1])  # Extract the numeric part without 'g'
-                multiplied_value = int(parts[0].strip()) * numeric_part  # Multiply the numeric parts
-                return str(multiplied_value) + 'g'
-            else:
-                return weight
-               
-        def convert_units_to_kg(weight):
-            '''
-            This function converts weight values to kilograms by identifying the unit (kg, g, ml, oz) at the 
-            end of the value and making the appropriate conversion. 
-            
-            Parameters:
-                    weight(String): The weight value
-
-            Returns:
-                    weight(String): The weight is returned as a string with 'kg' appended at the end of the 
-                                    string
-            '''
-            if isinstance(weight, str):
-                if weight.endswith('kg'):
-                    numeric_part = float(weight[:-2])
-                    return str(numeric_part) + 'kg'
-                elif weight.endswith('g'):
-                    numeric_part = float(weight[:-1]) / 1000
-                    return str(numeric_part) + 'kg'
-                elif weight.endswith('ml'):
-                    numeric_part = float(weight[:-2]) / 1000
-                    return str(numeric_part) + 'kg'
-                elif weight.endswith('oz'):
-                    numeric_part = float(weight[:-2]) / 35.274
-                    return str(numeric_part) + 'kg'
-                
-            return weight
-        
-        def convert_weight_to_3_decimal_points(weight):
-            '''
-            This function rounds the weight value to three decimal places and appends 'kg' to the result.
-            
-            Parameters:
-                    weight(String): The weight value
-
-            Returns:
-                    weight(String): The weight value in three decimal places
-            '''
-            if isinstance(weight, str):
-                numeric_part = round(float(weight[:-2]), 3)  # Extract numeric part, convert to float, and round to 3 decimal places
-                return str(numeric_part) + 'kg'
-            
-            return weight
-        
-        # The apply() function is used to map each row of the 'weight' column through each of the three 
-        # conversion functions.
-        df_products['weight'] = df_products['weight'].apply(multiply_weight)
-        df_products['weight'] = df_products['weight'].apply(convert_units_to_kg)
-        df_products['weight'] = df_products['weight'].apply(convert_weight_to_3_decimal_points)
-
-        # Remove "kg" units from the weight column 
-        df_products['weight'] = df_products['weight'].astype(str).str.replace('kg','')
-
-        return df_products
+        weight_codes, unique_weights = pd.factorize(df_products['weight'].astype(str))
+        weights = pd.Series(unique_weights, dtype=object).str.extract(WEIGHT_PATTERN)
+        quantity = pd.to_numeric(weights['quantity'], errors='coerce').fillna(1) # A weight without 'x' is a single item
+        value = pd.to_numeric(weights['value'], errors='coerce')
+        kilograms = (quantity * value / weights['unit'].map(UNIT_DIVISORS)).round(3).to_numpy('float64')
+
+        # Each row takes the weight of its code, a missing weight (code -1) stays NaN
+        kilograms = np.append(kilograms, np.nan)
+        weight = pd.Series(kilograms[weight_codes], index=df_products.index)
+
+        # Bucket the weights, a missing weight has no weight class
+        conditions = [weight < 2, weight < 40, weight < 140, weight >= 140]
+        weight_class = np.select(conditions, WEIGHT_CLASSES, default=None)
+
+        # The columns are set on a new dataframe, so the dataframe of the caller is left unchanged
+        return df_products.assign(weight=weight, weight_class=weight_class)
     
+    @instrument('clean')
     def clean_orders_data(self, df_orders):
         '''
-        The 'clean_orders_data' method it's only task is to drop a few columns.
+        The 'clean_orders_data' method it's only task is to drop a few columns, see 'ORDER_RULES'.
 
         Parameters:
                 df_orders(Dataframe): A dataframe containing the orders data 
@@ -290,15 +579,17 @@ class DataCleaning():
         Returns:
                 df_orders(Dataframe): A cleaned dataframe
         '''
-        # Drop the columns first-name, last_name and 1
-        df_orders.drop(['first_name', 'last_name', '1'], axis=1, inplace=True)
-
-        return df_orders
+        return self.engine.clean(df_orders, ORDER_RULES, 'orders', TABLE_TYPES['orders'])
     
+    @instrument('clean')
+    @shardable
     def clean_event_data(self, df_event_data):
         '''
-        The method 'clean_event_data' performs a series of data cleaning and transformation operations on 
-        the input dataframe 'df_event_data'.
+        The method 'clean_event_data' applies the rules 'EVENT_RULES' to the input dataframe 
+        'df_event_data'. Rows with a non-numeric month are blanked, the typed 'sale_timestamp' (UTC) is 
+        assembled from the year, month, day and time with one explicit format, its quarter, ISO week and 
+        ISO weekday are added as compact integer columns and its month-start flag as a boolean column. The 
+        time is kept from the timestamps.
 
         Parameters:
                 df_event_data(Dataframe): A dataframe containing the event data
@@ -306,20 +597,126 @@ class DataCleaning():
         Returns:
                 df_event(Dataframe): A cleaned dataframe 
         '''
-        # Replace NULL values with 'Nan'
-        df_event_data = df_event_data.replace(['NULL', 'N/A', 'None'], np.nan)
+        return self.engine.clean(df_event_data, EVENT_RULES, 'date_times', TABLE_TYPES['date_times'])
 
-        # Convert the column month to numeric, non-numeric values will be NaN
-        numeric_values = pd.to_numeric(df_event_data['month'], errors='coerce')
+    @instrument('clean')
+    def clean_in_chunks(self, chunks, clean_method):
+        '''
+        The method 'clean_in_chunks' applies one of the cleaning methods to each chunk yielded by 
+        'DataExtractor.read_rds_table_in_chunks', so a table can be cleaned without holding all of it in 
+        memory. Empty chunks left after cleaning are skipped.
 
-        # Get the indices of non-numeric values
-        non_numeric_indices = np.where(np.isnan(numeric_values))
+        Parameters:
+                chunks(Iterable): An iterable of dataframes
+                clean_method(Function): The cleaning method to apply, e.g. 'self.clean_orders_data'
 
-        # Replace unnecessary values with 'NaN
-        df_event_data.iloc[non_numeric_indices] = np.nan
+        Yields:
+                df_chunk(Dataframe): A cleaned chunk
+        '''
+        for df_chunk in chunks:
+            df_chunk = clean_method(df_chunk)
+            if not df_chunk.empty:
+                yield df_chunk
 
-        # Clean time columns
-        df_event_data['timestamp'] = pd.to_datetime(df_event_data['timestamp']).dt.time
+    @instrument('clean')
+    def clean_in_parallel(self, df, clean_method, shards=None):
+        '''
+        The method 'clean_in_parallel' splits a table into contiguous row shards and cleans them with one of 
+        the cleaning methods across a process pool, so the regex-heavy rules use every core. The pool is 
+        kept between calls, 'close_workers' shuts it down.
+
+        The shards are not pickled: each one is written to an Arrow IPC file in 'SHARD_DIR' (shared memory 
+        on Linux), which the worker memory maps, and the cleaned shard comes back the same way. A shard with 
+        a column Arrow cannot store is pickled instead. Each shard is read back with the dtypes and the 
+        missing values (NaN, NaT or None) it had before it was written, so the result is the same as the 
+        one of the method run in process, with either backend. The cleaned shards are concatenated in shard 
+        order, so the rows keep the order of their original index, and the columns which are categoricals 
+        in the shards (with different categories in each) become categoricals again.
 
-        return df_event_data
-    
+        Parameters:
+                df(Dataframe): A dataframe containing the extracted data
+                clean_method(String): The name of the cleaning method, e.g. 'clean_store_data'
+                shards(Int): The number of shards, one for each worker by default
+
+        Returns:
+                df(Dataframe): The cleaned dataframe
+        '''
+        shards = shards or self.workers
+        with self.executor_lock:
+            if self.executor is None:
+                # Workers are spawned rather than forked, as the pipeline runs its stages in threads
+                self.executor = ProcessPoolExecutor(max_workers=self.workers, 
+                                                    mp_context=multiprocessing.get_context('spawn'))
+
+        shard_dir = tempfile.mkdtemp(prefix='shards-', dir=SHARD_DIR)
+        try:
+            futures = []
+            bounds = np.linspace(0, len(df), shards + 1).astype(int)
+            for number, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+                df_shard = df.iloc[start:stop]
+                input_path = os.path.join(shard_dir, f"input-{number}.arrow")
+                output_path = os.path.join(shard_dir, f"output-{number}.arrow")
+                shard = input_path if write_arrow_file(df_shard, input_path) else df_shard
+                futures.append((self.executor.submit(clean_shard, self.backend, clean_method, shard, output_path, 
+                                                     missing_values(df_shard)), output_path))
+
+            df_shards, shard_dtypes = [], []
+            for future, output_path in futures:
+                df_shard, timings, dtypes, missing = future.result()
+                if df_shard is None:
+                    df_shard = read_arrow_file(output_path, missing, dtypes)
+                df_shards.append(df_shard)
+                shard_dtypes.append(dtypes)
+                for rule, seconds in timings.items():
+                    self.engine.timings[rule] += seconds
+        finally:
+            shutil.rmtree(shard_dir, ignore_errors=True)
+
+        df = pd.concat(df_shards)
+        for column in df.columns:
+            dtype = shard_dtypes[0][column]
+            if isinstance(dtype, pd.CategoricalDtype):
+                # The categories keep the dtype the worker gave them (e.g. 'string' rather than 'str')
+                df[column] = df[column].astype(dtype.categories.dtype).astype('category')
+        return df
+
+    def close_workers(self):
+        '''
+        The method 'close_workers' shuts down the process pool used by 'clean_in_parallel'.
+
+        Parameters:
+                None
+
+        Returns:
+                None
+        '''
+        with self.executor_lock:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+    def memory_report(self, df, clean_method):
+        '''
+        The method 'memory_report' cleans a copy of a table with each backend and compares the memory used by 
+        each column of the results, so the saving of the Arrow-backed types can be measured for every table.
+
+        Parameters:
+                df(Dataframe): A dataframe containing the extracted data
+                clean_method(String): The name of the cleaning method, e.g. 'clean_store_data'
+
+        Returns:
+                report(Dataframe): The memory of each column in MB with each backend, and the total
+        '''
+        memory = {}
+        for backend in ('pandas', 'pyarrow'):
+            data_cleaner = DataCleaning(backend)
+            df_clean = getattr(data_cleaner, clean_method)(df.copy())
+            memory[backend] = df_clean.memory_usage(deep=True, index=False) / 1024 ** 2
+
+        report = pd.DataFrame(memory)
+        report.loc['total'] = report.sum()
+        report['saving'] = 1 - report['pyarrow'] / report['pandas']
+        print(f"Memory usage of '{clean_method}' (MB):")
+        print(report.round(3))
+
+        return report
@@ -1,28 +1,121 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from extraction_cache import ExtractionCache
+from instrumentation import instrument, metrics
+from requests.adapters import HTTPAdapter
 from sqlalchemy import create_engine, inspect
+from urllib3.util.retry import Retry
 import boto3
+import hashlib
+import io
 import json
+import os
 import pandas as pd
 import requests
 import sqlalchemy.exc
 import tabula
+import tempfile
 import yaml
 
+try:
+    from pypdf import PdfReader # Optional, used to count the pages of a PDF file
+except ImportError:
+    PdfReader = None
+
+# Columns and dtypes of the store details returned by the API. The values are kept as raw objects here, 
+# as they are converted to their final types by 'DataCleaning.clean_store_data'
+STORE_SCHEMA = {
+    'index': 'int64',
+    'address': 'object',
+    'longitude': 'object',
+    'lat': 'object',
+    'locality': 'object',
+    'store_code': 'object',
+    'staff_numbers': 'object',
+    'opening_date': 'object',
+    'store_type': 'object',
+    'latitude': 'object',
+    'country_code': 'object',
+    'continent': 'object'
+    }
+
+# Columns and dtypes of 'products.csv', declared up front so the chunks of a streamed file all have the same 
+# dtypes. The values are kept as strings, as they are converted by 'DataCleaning.clean_products_data'
+PRODUCT_SCHEMA = {
+    'Unnamed: 0': 'int64',
+    'product_name': 'object',
+    'product_price': 'object',
+    'weight': 'object',
+    'category': 'object',
+    'EAN': 'object',
+    'date_added': 'object',
+    'uuid': 'object',
+    'removed': 'object',
+    'product_code': 'object'
+    }
+
 class DataExtractor():
     """
     The class 'DataExtractor' is designed to extract data from various sources such as databases, files, 
     APIs and web pages.
 
+    The files, APIs and S3 objects are cached by an 'ExtractionCache', so a source which has not changed 
+    since the last run is neither downloaded nor parsed again.
+
+    Attributes
+    ----------
+    cache(ExtractionCache): The cache of the extracted data, a default cache in '.cache' is used if None
+    dtype_backend(String): 'numpy' for the default dtypes, 'pyarrow' for Arrow-backed dtypes
+    pdf_executor(ProcessPoolExecutor): The pool which reads the pages of the PDF, None until it is needed
+    pdf_workers(Int): The number of worker processes of 'pdf_executor'
+
     Methods
     -------
+    to_dtype_backend(self, df)
     read_rds_table(self, table_name, engine)
-    retrieve_pdf_data(self, link)
+    read_rds_table_delta(self, table_name, engine, high_water_mark)
+    read_rds_table_in_chunks(self, table_name, engine, chunksize)
+    cache_file(self, link, suffix)
+    http_version(self, url, header_dict)
+    split_pdf_pages(self, path, max_workers, pages_per_task)
+    read_pdf_pages(path, pages)
+    pdf_pool(self, max_workers)
+    retrieve_pdf_data(self, link, max_workers, pages_per_task)
+    close_pdf_workers(self)
     list_number_of_stores(self, num_stores_endpoint, header_dict)
-    retrieve_stores_data(self, store_endpoint, header_dict, store_number)
+    create_session(self, header_dict, pool_size, max_retries, backoff_factor)
+    fetch_store(self, session, endpoint, timeout)
+    build_stores_frame(self, results)
+    retrieve_stores_data(self, store_endpoint, header_dict, store_number, max_workers, timeout, max_retries, 
+                         backoff_factor)
     extract_from_s3(self, s3_address)
+    download_s3_in_parts(self, s3, bucket_name, key, size, part_size, max_workers)
+    extract_from_s3_in_chunks(self, s3_address, chunksize, parallel_parts, part_size)
     retrieve_date_events_data(self, store_endpoint, header_dict)
     """
 
+    def __init__(self, cache=None, dtype_backend='numpy'):
+        self.cache = cache if cache is not None else ExtractionCache()
+        self.dtype_backend = dtype_backend
+        self.pdf_executor = None
+        self.pdf_workers = 0
+
+    def to_dtype_backend(self, df):
+        '''
+        The method 'to_dtype_backend' converts the columns of an extracted dataframe to Arrow-backed dtypes 
+        ('string[pyarrow]', 'int64[pyarrow]', ...) when the extractor was created with 
+        'dtype_backend='pyarrow''. Otherwise the dataframe is returned unchanged.
+
+            Parameters:
+                    df(Dataframe): The extracted dataframe, or None if the extraction failed
+
+            Returns:
+                    df(Dataframe): The dataframe with the dtypes of the chosen backend
+        '''
+        if df is None or self.dtype_backend != 'pyarrow':
+            return df
+        return df.convert_dtypes(dtype_backend='pyarrow')
     
+    @instrument('extract')
     def read_rds_table(self, table_name, engine):
         '''
         The method 'read_rds_table' is responsible for reading data from a specified table in a relational 
@@ -45,31 +138,271 @@ class DataExtractor():
                 query = sqlalchemy.text(f"SELECT * FROM {table_name}")
                 with engine.connect() as connection:
                     df_user = pd.read_sql_query(query, connection)
-                    return df_user
+                    return self.to_dtype_backend(df_user)
+            except (sqlalchemy.exc.SQLAlchemyError, Exception) as error:
+                print("Error extracting data from table:", error)
+        else:
+            print("Database engine not initialized. Please initialize the engine first.")
+
+    @instrument('extract')
+    def read_rds_table_delta(self, table_name, engine, high_water_mark=None):
+        '''
+        The method 'read_rds_table_delta' reads only the rows of a table which were added since the last 
+        load, i.e. the rows whose 'index' is greater than the high-water mark. Without a high-water mark the 
+        whole table is read.
+
+        The rows are labelled with their 'index', which is their position in the full table, so the 
+        cleaning methods which drop or blank rows by index give the same result on a delta.
+
+            Parameters:
+                    table_name(String): Specify the name of the database table
+                    engine(SQLAlchemy Engine object): Establishing a connection to the database
+                    high_water_mark(Int): The largest 'index' which was already loaded
+
+            Returns:
+                    df_delta(Dataframe): A dataframe containing the new rows of the table
+        '''
+        if engine:
+            try:
+                query = f'SELECT * FROM {table_name}'
+                params = {}
+                if high_water_mark is not None:
+                    query += ' WHERE "index" > :high_water_mark'
+                    params['high_water_mark'] = int(high_water_mark)
+                query = sqlalchemy.text(query + ' ORDER BY "index"')
+                with engine.connect() as connection:
+                    df_delta = pd.read_sql_query(query, connection, params=params)
+                df_delta.index = pd.Index(df_delta['index'].to_numpy())
+                return self.to_dtype_backend(df_delta)
+            except (sqlalchemy.exc.SQLAlchemyError, Exception) as error:
+                print("Error extracting data from table:", error)
+        else:
+            print("Database engine not initialized. Please initialize the engine first.")
+
+    @instrument('extract')
+    def read_rds_table_in_chunks(self, table_name, engine, chunksize=50000):
+        '''
+        The method 'read_rds_table_in_chunks' is the streaming version of 'read_rds_table'. The query is 
+        executed on a server-side cursor ('stream_results=True') and the rows are fetched 'chunksize' at a 
+        time, so only one chunk of the table is held in memory.
+
+        Each chunk keeps the row labels it would have had in the full table (0, 1, 2, ...), so the cleaning 
+        methods which drop or blank rows by index give the same result chunk by chunk.
+
+            Parameters:
+                    table_name(String): Specify the name of the database table
+                    engine(SQLAlchemy Engine object): Establishing a connection to the database
+                    chunksize(Int): The number of rows in each chunk
+
+            Yields:
+                    df_chunk(Dataframe): A dataframe containing the next 'chunksize' rows of the table
+        '''
+        if engine:
+            try:
+                query = sqlalchemy.text(f"SELECT * FROM {table_name}")
+                with engine.connect() as connection:
+                    connection = connection.execution_options(stream_results=True) # Use a server-side cursor
+                    offset = 0
+                    for df_chunk in pd.read_sql_query(query, connection, chunksize=chunksize):
+                        df_chunk.index = pd.RangeIndex(offset, offset + len(df_chunk))
+                        offset += len(df_chunk)
+                        yield self.to_dtype_backend(df_chunk)
             except (sqlalchemy.exc.SQLAlchemyError, Exception) as error:
                 print("Error extracting data from table:", error)
         else:
             print("Database engine not initialized. Please initialize the engine first.")
 
-    def retrieve_pdf_data(self, link):
+    def cache_file(self, link, suffix=''):
+        '''
+        The method 'cache_file' downloads a file to the cache directory and returns its local path. The 
+        file is stored under the hash of its URL, together with a '.json' file holding the ETag and 
+        Last-Modified date sent by the server and the SHA-256 hash of the content. On the next call a 
+        conditional request ('If-None-Match' / 'If-Modified-Since') is sent, and if the file is unchanged 
+        (status code 304) the cached copy is used without downloading it again.
+
+            Parameters:
+                    link(String): The URL of the file
+                    suffix(String): The extension added to the cached file name, e.g. '.pdf'
+
+            Returns:
+                    path(String): The local path of the cached file
+                    version(String): The ETag, Last-Modified date or content hash of the file
+        '''
+        path = self.cache.path(link, suffix=suffix)
+        meta_path = path + '.json'
+
+        headers = {}
+        meta = {}
+        if os.path.exists(path) and os.path.exists(meta_path):
+            with open(meta_path, 'r') as file:
+                meta = json.load(file)
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        with requests.get(link, headers=headers, stream=True, timeout=60) as response:
+            if response.status_code == 304: # The cached file is still up to date
+                self.cache.touch(path)
+                return path, meta.get('etag') or meta.get('last_modified') or meta['sha256']
+            response.raise_for_status()
+            # Write to a temporary file first, so a concurrent run never reads a half-written file
+            content_hash = hashlib.sha256()
+            fd, temp_path = tempfile.mkstemp(dir=self.cache.temp_dir)
+            with os.fdopen(fd, 'wb') as file:
+                for block in response.iter_content(chunk_size=1 << 20):
+                    file.write(block)
+                    content_hash.update(block)
+                    metrics.add_bytes(len(block))
+            os.replace(temp_path, path)
+            meta = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'sha256': content_hash.hexdigest()
+                }
+
+        with open(meta_path, 'w') as file:
+            json.dump(meta, file)
+
+        return path, meta['etag'] or meta['last_modified'] or meta['sha256']
+
+    def http_version(self, url, header_dict=None):
+        '''
+        The method 'http_version' sends an HTTP HEAD request to find the version of a source without 
+        downloading it.
+
+            Parameters:
+                    url(String): The URL of the source
+                    header_dict(Dictionary): A dictionary containing headers required for API requests
+
+            Returns:
+                    version(String): The ETag or Last-Modified date of the source, or an empty string if the 
+                                     server sends neither (the cached entry is then only limited by its TTL)
+        '''
+        try:
+            response = requests.head(url, headers=header_dict, timeout=10)
+            if response.status_code == 200:
+                return response.headers.get('ETag') or response.headers.get('Last-Modified') or ''
+        except requests.exceptions.RequestException as error:
+            print("Error connecting to the API:", error)
+        return ''
+
+    def split_pdf_pages(self, path, max_workers, pages_per_task=None):
+        '''
+        The method 'split_pdf_pages' counts the pages of a PDF file and splits them into contiguous page 
+        ranges, one for each task sent to the process pool.
+
+            Parameters:
+                    path(String): The local path of the PDF file
+                    max_workers(Int): The number of worker processes
+                    pages_per_task(Int): The number of pages in each range, by default the pages are split 
+                                         evenly between the workers
+
+            Returns:
+                    page_ranges(List): Page ranges in page order, e.g. ['1-50', '51-100'], or None if the 
+                                       pages cannot be counted because 'pypdf' is not installed
+        '''
+        if PdfReader is None:
+            return None
+        page_count = len(PdfReader(path).pages)
+        if not pages_per_task:
+            pages_per_task = max(1, -(-page_count // max_workers)) # Ceiling division
+        page_ranges = []
+        for first_page in range(1, page_count + 1, pages_per_task):
+            last_page = min(first_page + pages_per_task - 1, page_count)
+            page_ranges.append(f"{first_page}-{last_page}")
+
+        return page_ranges
+
+    @staticmethod
+    def read_pdf_pages(path, pages):
+        '''
+        The function 'read_pdf_pages' runs in a worker process and extracts the tables of a range of pages. 
+        When 'jpype' is installed tabula keeps its JVM inside the worker process, so the JVM is started once 
+        per worker and reused for every page range the worker reads.
+
+            Parameters:
+                    path(String): The local path of the PDF file
+                    pages(String): The page range to read, e.g. '1-50'
+
+            Returns:
+                    df_list(List): A list of dataframes, one for each table found in the pages
+        '''
+        return tabula.read_pdf(path, pages=pages)
+
+    def pdf_pool(self, max_workers):
+        '''
+        The method 'pdf_pool' returns the process pool of 'retrieve_pdf_data'. The pool is kept between calls,
+        and replaced by a new one when a call asks for a different number of workers.
+
+            Parameters:
+                    max_workers(Int): The number of worker processes
+
+            Returns:
+                    pdf_executor(ProcessPoolExecutor): The pool with 'max_workers' processes
+        '''
+        if self.pdf_executor is not None and self.pdf_workers != max_workers:
+            self.close_pdf_workers()
+        if self.pdf_executor is None:
+            self.pdf_executor = ProcessPoolExecutor(max_workers=max_workers)
+            self.pdf_workers = max_workers
+        return self.pdf_executor
+
+    @instrument('extract')
+    def retrieve_pdf_data(self, link, max_workers=4, pages_per_task=None):
         '''
         The method 'retrive_pdf_data' is responsible for extracting data from a PDF file.
 
+        The PDF file is cached locally by 'cache_file', so it is only downloaded again when it changes, and 
+        the extracted dataframe is cached for each version of the file, so an unchanged file is not parsed 
+        again either. Its pages are split into ranges which are read in parallel by a process pool, and the 
+        tables are merged in page order. The pool is kept between calls so its workers (and their JVMs) are 
+        reused while 'max_workers' stays the same (see 'pdf_pool'), 'close_pdf_workers' shuts it down.
+
             Parameters:
                     link(String): Represents the link to the PDF file
+                    max_workers(Int): The number of worker processes, 1 reads the whole file in this process
+                    pages_per_task(Int): The number of pages read by each task
 
             Returns:
                     df_card(Dataframe): A dataframe containing the data from the PDF file
         '''
         try:
-            # Extract data from all pages of the PDF
-            df_list = tabula.read_pdf(link, pages='all')
+            path, version = self.cache_file(link, suffix='.pdf')
+            df_card = self.cache.load_frame(link, version)
+            if df_card is not None:
+                return self.to_dtype_backend(df_card)
+            page_ranges = self.split_pdf_pages(path, max_workers, pages_per_task) if max_workers > 1 else None
+            if not page_ranges or len(page_ranges) == 1:
+                # Extract data from all pages of the PDF
+                df_list = tabula.read_pdf(path, pages='all')
+            else:
+                # 'executor.map' yields the results in the order of 'page_ranges', so the page order is kept
+                results = self.pdf_pool(max_workers).map(self.read_pdf_pages, [path] * len(page_ranges), page_ranges)
+                df_list = [df for page_range_dfs in results for df in page_range_dfs]
             # Concatenate the dataframes into a single dataframe
             df_card = pd.concat(df_list, ignore_index=True)
-            return df_card             
+            self.cache.save_frame(link, version, df_card)
+            return self.to_dtype_backend(df_card)             
         except Exception as error:
             print("Error retrieving PDF data:", error)
+
+    def close_pdf_workers(self):
+        '''
+        The method 'close_pdf_workers' shuts down the process pool used by 'retrieve_pdf_data'.
+
+            Parameters:
+                    None
+
+            Returns:
+                    None
+        '''
+        if self.pdf_executor is not None:
+            self.pdf_executor.shutdown()
+            self.pdf_executor = None
+            self.pdf_workers = 0
     
+    @instrument('extract')
     def list_number_of_stores(self, num_stores_endpoint, header_dict):
         '''
         The method 'list_number_of_stores' is responsible for fetching the total number of stores from an 
@@ -84,6 +417,7 @@ class DataExtractor():
         '''
         try:
             response = requests.get(num_stores_endpoint, headers=header_dict) # It sends an HTTP GET request to the API endpoint
+            metrics.add_bytes(len(response.content))
             if response.status_code == 200: # Check if the status_code is 200 (indicating a successful response)
                 data = response.json()
                 store_number = data['number_stores'] 
@@ -93,47 +427,137 @@ class DataExtractor():
         except requests.exceptions.RequestException as error:
             print("Error connecting to the API:", error)
 
-    def retrieve_stores_data(self, store_endpoint, header_dict, store_number):
+    def create_session(self, header_dict, pool_size=16, max_retries=3, backoff_factor=0.5):
+        '''
+        The method 'create_session' builds a 'requests.Session' whose connection pool is shared by every 
+        request sent through it, so the TCP/TLS handshake is done once per connection instead of once per 
+        request. Requests answered with 429 or a 5xx status code are retried with an exponential backoff.
+
+            Parameters:
+                    header_dict(Dictionary): A dictionary containing headers required for API requests
+                    pool_size(Int): The maximum number of connections kept open to the API host
+                    max_retries(Int): The number of times a failed request is retried
+                    backoff_factor(Float): The backoff factor used between retries (0.5, 1, 2, ... seconds)
+
+            Returns:
+                    session(requests.Session): A session with the headers and retry policy mounted
+        '''
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=['GET'],
+            respect_retry_after_header=True
+            )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.headers.update(header_dict)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        return session
+
+    def fetch_store(self, session, endpoint, timeout=10):
+        '''
+        The method 'fetch_store' sends an HTTP GET request for a single store through the shared session.
+
+            Parameters:
+                    session(requests.Session): The session created by 'create_session'
+                    endpoint(String): The API endpoint URL of the store
+                    timeout(Float): The number of seconds to wait for the API before giving up
+
+            Returns:
+                    data(Dictionary): The store data, or None if the store could not be retrieved
+        '''
+        try:
+            response = session.get(endpoint, timeout=timeout) # It sends an HTTP GET request to the API endpoint
+            if response.status_code == 200: # Check if the status_code is 200 (indicating a successful response)
+                return response.json()
+            print(f"Error retrieving store data from {endpoint}. Status code:", response.status_code)
+        except requests.exceptions.RequestException as error:
+            print(f"Error connecting to the API for {endpoint}:", error)
+
+    def build_stores_frame(self, results):
+        '''
+        The method 'build_stores_frame' collects the JSON records of the stores in a list and turns them into 
+        a DataFrame with a single 'DataFrame.from_records' call.
+
+            Parameters:
+                    results(List): The store data returned by 'fetch_store' for each store number, None for 
+                                   the stores which could not be retrieved
+
+            Returns:
+                    df_stores(Dataframe): A DataFrame with the columns and dtypes of 'STORE_SCHEMA'
+        '''
+        # A store that could not be retrieved keeps its row with only the 'index' filled in, so the row 
+        # positions still match the store numbers
+        records = [data if data is not None else {'index': number} for number, data in enumerate(results)]
+        df_stores = pd.DataFrame.from_records(records, columns=list(STORE_SCHEMA))
+        return df_stores.astype(STORE_SCHEMA)
+
+    @instrument('extract')
+    def retrieve_stores_data(self, store_endpoint, header_dict, store_number, max_workers=16, timeout=10, 
+                             max_retries=3, backoff_factor=0.5):
         '''
         The method 'retrieve_stores_data' is responsible for retrieving data for multiple stores from an API 
         endpoint and combining the data into a single pandas DataFrame.
 
+        The stores are fetched concurrently by a bounded thread pool of 'max_workers' threads which share 
+        one pooled 'requests.Session'. The results are returned in store number order regardless of the 
+        order in which the responses arrive. Setting 'max_workers' to 1 fetches the stores one by one.
+        The DataFrame is built from the results by 'build_stores_frame'. When every store was retrieved, 
+        the DataFrame is cached, and the next call within the TTL of the cache does not send any request.
+
             Parameters:
                     store_endpoint(String): The base API endpoint for the stores 
                     header_dict(Dictionary): A dictionary containing headers required for API requests
                     store_number(Int): The number of stores
+                    max_workers(Int): The maximum number of requests in flight at the same time
+                    timeout(Float): The number of seconds to wait for each request
+                    max_retries(Int): The number of times a request answered with 429/5xx is retried
+                    backoff_factor(Float): The backoff factor used between retries
 
             Returns:
-                    concat_df_stores(Dataframe): It returns the concatenated DataFrame 'concat_df_stores', 
-                                                 which contains the combined data for all the stores 
-                                                 retrieved from the API endpoint
+                    concat_df_stores(Dataframe): It returns the DataFrame 'concat_df_stores' with the 
+                                                 columns and dtypes of 'STORE_SCHEMA', which contains the 
+                                                 combined data for all the stores retrieved from the API 
+                                                 endpoint
         '''
-        # Initialises two empty lists 'df_stores' & 'endpoints'
-        df_stores = []
-        endpoints = []
-        # Generates individual endpoints based on 'store_endpoint' & 'store_number' using f-strings ranging from 0 to 'store_number' and appends them to the 'endpoints' list
-        for number in range(0, store_number):
-            endpoint = f"{store_endpoint}/{number}"
-            endpoints.append(endpoint)
-        try:
-            for index, endpoint in enumerate(endpoints):
-                response = requests.get(endpoint, headers=header_dict) # It sends an HTTP GET request to the API endpoint
-                if response.status_code == 200: # Check if the status_code is 200 (indicating a successful response)
-                    data = response.json()
-                df_store = pd.DataFrame(data, index = [index])
-                df_stores.append(df_store)  
-            else:
-                print("Error retrieving stores data. Status code:", response.status_code)
-        except requests.exceptions.RequestException as error:
-            print("Error connecting to the API:", error)
-        concat_df_stores = pd.concat(df_stores) # Combining the data into a single pandas DataFrame  
+        # The store API sends no ETag, so the cached stores are only limited by the TTL of the cache
+        cache_uri = f"{store_endpoint}?store_number={store_number}"
+        concat_df_stores = self.cache.load_frame(cache_uri)
+        if concat_df_stores is not None:
+            return self.to_dtype_backend(concat_df_stores)
+
+        # Generates individual endpoints based on 'store_endpoint' & 'store_number' using f-strings ranging from 0 to 'store_number'
+        endpoints = [f"{store_endpoint}/{number}" for number in range(0, store_number)]
+        session = self.create_session(header_dict, pool_size=max_workers, max_retries=max_retries, 
+                                      backoff_factor=backoff_factor)
+        span = metrics.current_span() # The responses arrive in the worker threads
+        session.hooks['response'].append(
+            lambda response, *args, **kwargs: metrics.add_bytes(len(response.content), span)
+            )
+        # 'executor.map' yields the results in the order of 'endpoints', so the store order is preserved
+        with session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(lambda endpoint: self.fetch_store(session, endpoint, timeout), endpoints))
+
+        concat_df_stores = self.build_stores_frame(results)
 
-        return concat_df_stores
+        if all(data is not None for data in results): # Stores which failed are fetched again on the next run
+            self.cache.save_frame(cache_uri, '', concat_df_stores)
+
+        return self.to_dtype_backend(concat_df_stores)
     
+    @instrument('extract')
     def extract_from_s3(self, s3_address):
         '''
         The method 'extract_from_s3' is responsible for extracting data from an Amazon S3 bucket.
 
+        The ETag of the object is read first with a HEAD request. If the object is unchanged since it was 
+        last extracted, the cached dataframe is returned without downloading or parsing the file. Otherwise 
+        the file is downloaded to a temporary file of its own, so concurrent runs never overwrite each 
+        other's file.
+
             Parameters:
                     s3_address(String): It represents the S3 address where the data is located
 
@@ -143,17 +567,94 @@ class DataExtractor():
         '''
         s3 = boto3.client('s3') # It initialises an S3 client using 'boto3' library to interact with AWS S3
         bucket_name, key = s3_address.split('/', 3)[2:] # The split() function was used to separate the bucket name and key from the address
-        df_products = s3.download_file(bucket_name,key,'products.csv') # It downloads the data in CSV format
-        df_products_file = 'products.csv'
-        df_products = pd.read_csv(df_products_file)
+        version = s3.head_object(Bucket=bucket_name, Key=key)['ETag']
+        df_products = self.cache.load_frame(s3_address, version)
+        if df_products is not None:
+            return self.to_dtype_backend(df_products)
 
-        return df_products  
+        fd, df_products_file = tempfile.mkstemp(suffix='.csv', dir=self.cache.temp_dir)
+        os.close(fd)
+        try:
+            s3.download_file(bucket_name, key, df_products_file) # It downloads the data in CSV format
+            metrics.add_bytes(os.path.getsize(df_products_file))
+            df_products = pd.read_csv(df_products_file, dtype=PRODUCT_SCHEMA)
+        finally:
+            os.remove(df_products_file)
+        self.cache.save_frame(s3_address, version, df_products)
+
+        return self.to_dtype_backend(df_products)  
         
+    def download_s3_in_parts(self, s3, bucket_name, key, size, part_size=8 * 1024 ** 2, max_workers=8):
+        '''
+        The method 'download_s3_in_parts' downloads a large S3 object in memory with parallel ranged GET 
+        requests of 'part_size' bytes, which is faster than a single stream for large objects.
+
+            Parameters:
+                    s3(boto3 S3 client): The client used for the requests
+                    bucket_name(String): The name of the bucket
+                    key(String): The key of the object
+                    size(Int): The size of the object in bytes
+                    part_size(Int): The number of bytes downloaded by each request
+                    max_workers(Int): The maximum number of requests in flight at the same time
+
+            Returns:
+                    buffer(io.BytesIO): A buffer containing the object
+        '''
+        content = bytearray(size)
+        def download_part(start):
+            end = min(start + part_size, size) - 1
+            response = s3.get_object(Bucket=bucket_name, Key=key, Range=f"bytes={start}-{end}")
+            content[start:end + 1] = response['Body'].read()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(download_part, range(0, size, part_size))) # 'list' raises the errors of the parts
+
+        return io.BytesIO(content)
+
+    @instrument('extract')
+    def extract_from_s3_in_chunks(self, s3_address, chunksize=100000, parallel_parts=False, part_size=8 * 1024 ** 2):
+        '''
+        The method 'extract_from_s3_in_chunks' is the streaming version of 'extract_from_s3'. The CSV file is 
+        read straight from the S3 response stream, without writing it to disk, and it is parsed 'chunksize' 
+        rows at a time with the dtypes of 'PRODUCT_SCHEMA', so only one chunk of the file is held in memory. 
+        The chunks keep their row labels in the whole file.
+
+        With 'parallel_parts' the object is instead downloaded in memory with parallel ranged GET requests 
+        and then parsed in chunks, which is faster for large objects but holds the raw file in memory.
+
+            Parameters:
+                    s3_address(String): It represents the S3 address where the data is located
+                    chunksize(Int): The number of rows in each chunk
+                    parallel_parts(Bool): Whether the object is downloaded with parallel ranged requests
+                    part_size(Int): The number of bytes downloaded by each ranged request
+
+            Yields:
+                    df_chunk(Dataframe): A dataframe containing the next 'chunksize' rows of the CSV file
+        '''
+        s3 = boto3.client('s3') # It initialises an S3 client using 'boto3' library to interact with AWS S3
+        bucket_name, key = s3_address.split('/', 3)[2:]
+        if parallel_parts:
+            size = s3.head_object(Bucket=bucket_name, Key=key)['ContentLength']
+            body = self.download_s3_in_parts(s3, bucket_name, key, size, part_size)
+        else:
+            s3_object = s3.get_object(Bucket=bucket_name, Key=key)
+            size = s3_object['ContentLength']
+            body = s3_object['Body'] # A 'StreamingBody', read as it is parsed
+        metrics.add_bytes(size)
+
+        with pd.read_csv(body, dtype=PRODUCT_SCHEMA, chunksize=chunksize) as reader:
+            for df_chunk in reader:
+                yield self.to_dtype_backend(df_chunk)
+
+    @instrument('extract')
     def retrieve_date_events_data(self, store_endpoint, header_dict):
         '''
         The method 'retrieve_date_events_data' is responsible for retrieving date events data from an API 
         endpoint and converting it into a pandas DataFrame.
 
+        The dataframe is cached for each version (ETag or Last-Modified date) of the JSON file, so an 
+        unchanged file is neither downloaded nor parsed again.
+
             Parameters:
                     store_endpoint(String): The API endpoint URL for date events data
                     header_dict(Dictionary): A dictionary containing headers required for API requests
@@ -161,15 +662,21 @@ class DataExtractor():
             Returns:
                     df_events_data(Dataframe): A dataframe containing the date events data extracted from the API endpoint
         '''
+        version = self.http_version(store_endpoint, header_dict)
+        df_events_data = self.cache.load_frame(store_endpoint, version)
+        if df_events_data is not None:
+            return self.to_dtype_backend(df_events_data)
+
         try:
             response = requests.get(store_endpoint, headers=header_dict) # It sends an HTTP GET request to the API endpoint
+            metrics.add_bytes(len(response.content))
             if response.status_code == 200: # Check if the status_code is 200 (indicating a successful response)
                 data = response.json()
                 df_events_data = pd.DataFrame(data)
+                self.cache.save_frame(store_endpoint, version, df_events_data)
             else:
                 print("Error retrieving stores data. Status code:", response.status_code)
         except requests.exceptions.RequestException as error:
             print("Error connecting to the API:", error)
 
-        return df_events_data
-    
+        return self.to_dtype_backend(df_events_data)
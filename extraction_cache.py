@@ -0,0 +1,231 @@
+import hashlib
+import os
+import pandas as pd
+import re
+import tempfile
+import time
+
+try:
+    import pyarrow.parquet as pq # Optional, the dataframes are pickled without a Parquet engine
+except ImportError:
+    pq = None
+
+# The name of a file of a cache entry: the hash of the source, then the extension of the file and, for the 
+# files downloaded by 'DataExtractor.cache_file', '.json' for the file holding their version
+ENTRY_NAME = re.compile(r'([0-9a-f]{64})(.*)')
+
+# The extensions of the dataframes stored by 'save_frame'
+FRAME_SUFFIXES = ('.parquet', '.pkl')
+
+class ExtractionCache():
+    '''
+    The class 'ExtractionCache' is a local cache for the data extracted by 'DataExtractor'. Each entry is
+    stored under the SHA-256 hash of the source URI and the version of the source (its ETag, Last-Modified
+    date or content hash), so a new version of a source never hits an old entry.
+
+    Dataframes are stored as Parquet files, or as pickle files when Parquet is not available or cannot
+    store the columns (e.g. object columns which mix numbers and strings). Entries older than 'ttl' seconds
+    are expired, and when the cache grows above 'max_size' bytes the least recently used entries are removed.
+    The files being written are kept in 'temp_dir' until they are complete, so they are never evicted.
+
+    Attributes
+    ----------
+    cache_dir(String): The directory where the entries are stored
+    temp_dir(String): The directory where the files are written before they are renamed into 'cache_dir'
+    max_size(Int): The maximum total size of the cache in bytes
+    ttl(Int): The number of seconds an entry is valid for after it was written
+
+    Methods
+    -------
+    path(self, uri, version, suffix)
+    load_frame(self, uri, version)
+    read_parquet(self, path)
+    save_frame(self, uri, version, df)
+    is_fresh(self, path)
+    touch(self, path)
+    evict(self)
+    remove(self, paths)
+    '''
+
+    def __init__(self, cache_dir='.cache', max_size=2 * 1024 ** 3, ttl=24 * 60 * 60):
+        self.cache_dir = cache_dir
+        self.temp_dir = os.path.join(cache_dir, 'tmp')
+        self.max_size = max_size
+        self.ttl = ttl
+        os.makedirs(self.temp_dir, exist_ok=True)
+
+    def path(self, uri, version='', suffix=''):
+        '''
+        The method 'path' returns the path of the cache entry of a source.
+
+            Parameters:
+                    uri(String): The URI of the source
+                    version(String): The version of the source, empty if it is not known
+                    suffix(String): The extension of the file, e.g. '.parquet'
+
+            Returns:
+                    path(String): The path of the entry inside 'cache_dir'
+        '''
+        key = hashlib.sha256(f"{uri}\0{version}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, key + suffix)
+
+    def load_frame(self, uri, version=''):
+        '''
+        The method 'load_frame' returns the cached dataframe of a source, if there is a fresh entry for
+        this version of the source.
+
+            Parameters:
+                    uri(String): The URI of the source
+                    version(String): The version of the source, empty if it is not known
+
+            Returns:
+                    df(Dataframe): The cached dataframe, or None if there is no fresh entry
+        '''
+        for suffix, read in (('.parquet', self.read_parquet), ('.pkl', pd.read_pickle)):
+            path = self.path(uri, version, suffix)
+            if self.is_fresh(path):
+                try:
+                    df = read(path)
+                except Exception as error:
+                    print("Error reading cache entry, it will be extracted again:", error)
+                    continue
+                self.touch(path)
+                print(f"Loaded '{uri}' from the cache")
+                return df
+
+    def read_parquet(self, path):
+        '''
+        The method 'read_parquet' reads a dataframe stored by 'save_frame'. pandas 3 reads text columns as
+        its 'str' dtype, so the columns which were stored from 'object' columns (e.g. the columns of
+        'PRODUCT_SCHEMA') are given back their dtype, and a cached dataframe is the same as an extracted one.
+
+            Parameters:
+                    path(String): The path of the Parquet file
+
+            Returns:
+                    df(Dataframe): The stored dataframe
+        '''
+        df = pd.read_parquet(path)
+        metadata = (pq.read_schema(path).pandas_metadata if pq is not None else None) or {}
+        object_columns = [column['name'] for column in metadata.get('columns', []) 
+                          if column.get('numpy_type') == 'object' and column['name'] in df.columns 
+                          and df[column['name']].dtype != object]
+        if object_columns:
+            df = df.astype({column: object for column in object_columns})
+        return df
+
+    def save_frame(self, uri, version, df):
+        '''
+        The method 'save_frame' stores the dataframe of a source in the cache. The file is written to a
+        temporary path in 'temp_dir' first and then renamed, so concurrent runs never read a half-written 
+        entry.
+
+            Parameters:
+                    uri(String): The URI of the source
+                    version(String): The version of the source, empty if it is not known
+                    df(Dataframe): The dataframe to store
+
+            Returns:
+                    None
+        '''
+        fd, temp_path = tempfile.mkstemp(dir=self.temp_dir)
+        os.close(fd)
+        try:
+            try:
+                df.to_parquet(temp_path)
+                suffix = '.parquet'
+            except (ImportError, ValueError, TypeError): # No Parquet engine, or mixed types in a column
+                df.to_pickle(temp_path)
+                suffix = '.pkl'
+            os.replace(temp_path, self.path(uri, version, suffix))
+        except Exception as error:
+            print("Error writing cache entry:", error)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self.evict()
+
+    def is_fresh(self, path):
+        '''
+        The method 'is_fresh' checks if a cache entry exists and was written less than 'ttl' seconds ago.
+
+            Parameters:
+                    path(String): The path of the entry
+
+            Returns:
+                    fresh(Bool): True if the entry can be used
+        '''
+        return os.path.exists(path) and time.time() - os.stat(path).st_mtime < self.ttl
+
+    def touch(self, path):
+        '''
+        The method 'touch' marks an entry as used. The access time is used for the LRU order, while the
+        modification time is kept as the time the entry was written, which the TTL is measured from.
+
+            Parameters:
+                    path(String): The path of the entry
+
+            Returns:
+                    None
+        '''
+        os.utime(path, (time.time(), os.stat(path).st_mtime))
+
+    def evict(self):
+        '''
+        The method 'evict' removes the expired entries and then the least recently used ones until the
+        total size of the cache is below 'max_size'. Only complete entries are removed: a dataframe stored by 
+        'save_frame', or a file downloaded by 'DataExtractor.cache_file' together with its '.json' file, 
+        which are removed as one. The files in 'temp_dir', which are still being written, and any other file 
+        are left alone, as the stages of the pipeline use the cache at the same time.
+
+            Parameters:
+                    None
+
+            Returns:
+                    None
+        '''
+        files = {}
+        for entry in os.scandir(self.cache_dir):
+            match = ENTRY_NAME.fullmatch(entry.name)
+            if match and entry.is_file():
+                files.setdefault(match.group(1), []).append((match.group(2), entry))
+
+        entries = []
+        for key_files in files.values():
+            suffixes = {suffix for suffix, _ in key_files}
+            is_frame = any(suffix in FRAME_SUFFIXES for suffix in suffixes)
+            is_file = any(suffix + '.json' in suffixes for suffix in suffixes)
+            if not (is_frame or is_file):
+                continue
+            try:
+                stats = [entry.stat() for _, entry in key_files]
+            except FileNotFoundError: # Removed by a concurrent run
+                continue
+            paths = [entry.path for _, entry in key_files]
+            if time.time() - max(stat.st_mtime for stat in stats) >= self.ttl:
+                self.remove(paths)
+            else:
+                last_used = max(max(stat.st_atime, stat.st_mtime) for stat in stats)
+                entries.append((last_used, sum(stat.st_size for stat in stats), paths))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, paths in sorted(entries): # Least recently used first
+            if total_size <= self.max_size:
+                break
+            self.remove(paths)
+            total_size -= size
+
+    def remove(self, paths):
+        '''
+        The method 'remove' deletes the files of an entry, ignoring the ones a concurrent run already removed.
+
+            Parameters:
+                    paths(List): The paths of the files of the entry
+
+            Returns:
+                    None
+        '''
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,420 @@
+from collections import defaultdict
+import cProfile
+import functools
+import inspect
+import json
+import logging
+import os
+import pandas as pd
+import threading
+import time
+
+try:
+    import resource # Not available on Windows, where the peak memory is not recorded
+except ImportError:
+    resource = None
+
+logger = logging.getLogger('etl.metrics')
+
+# The size of a memory page, the unit of '/proc/self/statm'
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def resident_memory_mb():
+    '''
+    The function 'resident_memory_mb' returns the current resident set size of the process, read from
+    '/proc/self/statm', unlike the peak of 'resource' which never goes down.
+
+        Parameters:
+                None
+
+        Returns:
+                rss(Float): The resident memory in MB, or None where '/proc' is not available (e.g. macOS)
+    '''
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            return int(file.read().split()[1]) * PAGE_SIZE / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return None
+
+class Span():
+    '''
+    The class 'Span' is the record of one call of an instrumented method.
+
+    Attributes
+    ----------
+    record(Dictionary): The stage, kind and method of the call, its wall and CPU time, rows in and out, bytes
+                        transferred, the resident memory of the process when it started and finished and 
+                        the peak memory of the process so far
+    '''
+
+    def __init__(self, kind, method, stage, rows_in):
+        self.record = {
+            'stage': stage,
+            'kind': kind,
+            'method': method,
+            'wall_time': 0.0,
+            'cpu_time': 0.0,
+            'rows_in': rows_in,
+            'rows_out': None,
+            'bytes': 0,
+            'rss_start_mb': resident_memory_mb(),
+            'rss_end_mb': None,
+            'process_peak_rss_mb': None,
+            'status': 'done'
+            }
+
+class Instrumentation():
+    '''
+    The class 'Instrumentation' records the wall time, CPU time, rows in and out, bytes transferred and peak
+    memory of every call of the extract, clean and upload methods decorated with 'instrument'.
+
+    Each finished call is sent as a JSON line to the 'etl.metrics' logger, and the totals of each method can
+    be written as an OpenMetrics text file. The CPU time is the time of the calling thread, so the stages
+    running at the same time in 'PipelineRunner' do not count each other's work. The resident memory of the
+    process is sampled when a call starts and finishes, so the difference is the memory the call kept (plus
+    that of the stages running at the same time), and the process peak is the largest resident set size of
+    the whole process so far, which cannot be attributed to one call. The bytes are reported by the methods themselves with
+    'add_bytes' (downloads, S3 objects and the CSV streamed to COPY).
+
+    Methods which return a generator (e.g. 'read_rds_table_in_chunks') are measured while the generator is
+    consumed: only the time spent producing the chunks is counted, and the record is sent when the generator
+    is exhausted or closed. When the generators are chained (e.g. the chunks read, cleaned by 
+    'clean_in_chunks' and uploaded by 'upload_chunks_to_db'), the time spent producing an item is taken off 
+    the span which asked for it, so each record only holds the time of its own code and the wall times of 
+    the chain add up to the time of the load. Only the outermost instrumented call of a thread is recorded: the instrumented
+    methods called by another one (e.g. 'upload_to_db' by 'upsert_to_db', or 'clean_in_parallel' by a
+    sharded clean method) are part of its record, so no work is counted twice in the totals.
+
+    Attributes
+    ----------
+    records(List): The records of the finished calls
+    local(threading.local): The stage and the stack of open spans of each thread
+
+    Methods
+    -------
+    set_stage(self, stage)
+    spans(self)
+    current_span(self)
+    add_bytes(self, size, span)
+    measure(self, kind, function, args, kwargs)
+    measure_generator(self, span, generator)
+    finish(self, span)
+    profile(self, name, profiler, profile_dir)
+    totals(self)
+    write_openmetrics(self, path)
+    '''
+
+    def __init__(self):
+        self.records = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def set_stage(self, stage):
+        '''
+        The method 'set_stage' sets the name of the pipeline stage the current thread is running, which is
+        added to the records of the calls it makes.
+
+            Parameters:
+                    stage(String): The name of the stage, or None
+
+            Returns:
+                    None
+        '''
+        self.local.stage = stage
+
+    def spans(self):
+        '''
+        The method 'spans' returns the stack of open spans of the current thread.
+
+            Parameters:
+                    None
+
+            Returns:
+                    spans(List): The open spans, the innermost last
+        '''
+        if not hasattr(self.local, 'spans'):
+            self.local.spans = []
+        return self.local.spans
+
+    def current_span(self):
+        '''
+        The method 'current_span' returns the innermost open span of the current thread. It can be passed to
+        'add_bytes' from the worker threads of a method.
+
+            Parameters:
+                    None
+
+            Returns:
+                    span(Span): The innermost open span, or None outside instrumented methods
+        '''
+        spans = self.spans()
+        return spans[-1] if spans else None
+
+    def add_bytes(self, size, span=None):
+        '''
+        The method 'add_bytes' adds a number of bytes transferred to a span.
+
+            Parameters:
+                    size(Int): The number of bytes
+                    span(Span): The span, the innermost open span of the current thread by default
+
+            Returns:
+                    None
+        '''
+        span = span or self.current_span()
+        if span is not None:
+            with self.lock:
+                span.record['bytes'] += int(size)
+
+    def measure(self, kind, function, args, kwargs):
+        '''
+        The method 'measure' calls an instrumented method and records the call.
+
+            Parameters:
+                    kind(String): 'extract', 'clean', 'upload' or 'sql'
+                    function(Function): The method
+                    args(Tuple): The positional arguments, 'self' first
+                    kwargs(Dictionary): The keyword arguments
+
+            Returns:
+                    result: The result of the method, a generator is wrapped by 'measure_generator'
+        '''
+        if self.spans(): # Called by another instrumented method, which records the call
+            return function(*args, **kwargs)
+        frames = [arg for arg in list(args[1:]) + list(kwargs.values()) if isinstance(arg, pd.DataFrame)]
+        span = Span(kind, function.__name__, getattr(self.local, 'stage', None),
+                    len(frames[0]) if frames else None)
+        self.spans().append(span)
+        start, start_cpu = time.perf_counter(), time.thread_time()
+        try:
+            result = function(*args, **kwargs)
+        except Exception:
+            span.record['status'] = 'failed'
+            raise
+        finally:
+            span.record['wall_time'] += time.perf_counter() - start
+            span.record['cpu_time'] += time.thread_time() - start_cpu
+            self.spans().pop()
+            if span.record['status'] == 'failed':
+                self.finish(span)
+
+        if inspect.isgenerator(result):
+            span.record['rows_out'] = 0
+            return self.measure_generator(span, result)
+        if isinstance(result, pd.DataFrame):
+            span.record['rows_out'] = len(result)
+        elif isinstance(result, int) and not isinstance(result, bool):
+            span.record['rows_out'] = result # The number of rows uploaded
+        self.finish(span)
+        return result
+
+    def measure_generator(self, span, generator):
+        '''
+        The method 'measure_generator' yields the items of a generator, adding the time spent producing
+        each of them and the rows of the dataframes to the span of the method which returned it. The same 
+        time is taken off the open span of the consumer, if it is instrumented, which is paused meanwhile.
+
+            Parameters:
+                    span(Span): The span of the method
+                    generator(Generator): The generator returned by the method
+
+            Yields:
+                    item: The items of the generator
+        '''
+        try:
+            while True:
+                consumer = self.current_span()
+                self.spans().append(span)
+                start, start_cpu = time.perf_counter(), time.thread_time()
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    break
+                except Exception:
+                    span.record['status'] = 'failed'
+                    raise
+                finally:
+                    wall_time, cpu_time = time.perf_counter() - start, time.thread_time() - start_cpu
+                    span.record['wall_time'] += wall_time
+                    span.record['cpu_time'] += cpu_time
+                    if consumer is not None:
+                        consumer.record['wall_time'] -= wall_time
+                        consumer.record['cpu_time'] -= cpu_time
+                    self.spans().pop()
+                if isinstance(item, pd.DataFrame):
+                    span.record['rows_out'] += len(item)
+                yield item
+        finally:
+            generator.close()
+            self.finish(span)
+
+    def finish(self, span):
+        '''
+        The method 'finish' records the resident and peak memory of the process when a call finished, stores
+        its record and logs it as a JSON line.
+
+            Parameters:
+                    span(Span): The span of the call
+
+            Returns:
+                    None
+        '''
+        span.record['rss_end_mb'] = resident_memory_mb()
+        if resource is not None:
+            span.record['process_peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # KB on Linux
+        with self.lock:
+            self.records.append(span.record)
+        logger.info(json.dumps({key: round(value, 4) if isinstance(value, float) else value
+                                for key, value in span.record.items()}))
+
+    def profile(self, name, profiler=None, profile_dir='profiles'):
+        '''
+        The method 'profile' returns a context manager which profiles the code run inside it, e.g. one
+        pipeline stage, with 'cProfile' (saved as '<name>.prof', readable with 'pstats' or snakeviz) or
+        'pyinstrument' (saved as '<name>.html'). Only the calling thread is profiled. Without a profiler
+        nothing is done. Only one cProfile profiler can be active in a process (Python 3.12+), so the 
+        cProfile contexts of different threads wait for each other.
+
+            Parameters:
+                    name(String): The name of the profile file
+                    profiler(String): 'cprofile', 'pyinstrument' or None
+                    profile_dir(String): The directory the profiles are saved to
+
+            Returns:
+                    context(Context manager): The profiling context
+        '''
+        return Profile(name, profiler, profile_dir)
+
+    def totals(self):
+        '''
+        The method 'totals' adds up the records of each method.
+
+            Parameters:
+                    None
+
+            Returns:
+                    totals(Dictionary): Maps (kind, method) to the number of calls and the total wall time,
+                                        CPU time, rows in and out and bytes
+        '''
+        totals = defaultdict(lambda: defaultdict(float))
+        with self.lock:
+            records = list(self.records)
+        for record in records:
+            total = totals[(record['kind'], record['method'])]
+            total['calls'] += 1
+            total['failures'] += record['status'] == 'failed'
+            for key in ('wall_time', 'cpu_time', 'rows_in', 'rows_out', 'bytes'):
+                total[key] += record[key] or 0
+        return totals
+
+    def write_openmetrics(self, path):
+        '''
+        The method 'write_openmetrics' writes the totals of each method, and the peak memory of the process,
+        to an OpenMetrics text file which can be read by Prometheus (e.g. through the node exporter's
+        textfile collector). The file is written to a temporary path and then renamed.
+
+            Parameters:
+                    path(String): The path of the file
+
+            Returns:
+                    None
+        '''
+        metrics = [
+            ('etl_calls', 'calls', 'The number of calls of each method'),
+            ('etl_failures', 'failures', 'The number of calls which raised an error'),
+            ('etl_wall_seconds', 'wall_time', 'The wall time spent in each method'),
+            ('etl_cpu_seconds', 'cpu_time', 'The CPU time spent in each method'),
+            ('etl_rows_in', 'rows_in', 'The rows passed to each method'),
+            ('etl_rows_out', 'rows_out', 'The rows returned or uploaded by each method'),
+            ('etl_bytes', 'bytes', 'The bytes transferred by each method')
+            ]
+        totals = self.totals()
+        lines = []
+        for name, key, help_text in metrics:
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"# HELP {name} {help_text}.")
+            for (kind, method), total in sorted(totals.items()):
+                lines.append(f'{name}_total{{kind="{kind}",method="{method}"}} {total[key]:g}')
+        if resource is not None:
+            lines.append("# TYPE etl_peak_rss_bytes gauge")
+            lines.append("# HELP etl_peak_rss_bytes The peak resident set size of the process.")
+            lines.append(f"etl_peak_rss_bytes {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}")
+        lines.append("# EOF")
+
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        os.replace(temp_path, path)
+
+class Profile():
+    '''
+    The class 'Profile' is the context manager returned by 'Instrumentation.profile'.
+
+    Attributes
+    ----------
+    name(String): The name of the profile file
+    profiler(String): 'cprofile', 'pyinstrument' or None
+    profile_dir(String): The directory the profiles are saved to
+    '''
+
+    # Held while a cProfile profiler is active, as there can only be one in a process
+    cprofile_lock = threading.Lock()
+
+    def __init__(self, name, profiler, profile_dir):
+        self.name = name
+        self.profiler = profiler
+        self.profile_dir = profile_dir
+        self.session = None
+
+    def __enter__(self):
+        if self.profiler == 'cprofile':
+            Profile.cprofile_lock.acquire()
+            try:
+                self.session = cProfile.Profile()
+                self.session.enable()
+            except Exception:
+                self.session = None
+                Profile.cprofile_lock.release()
+                raise
+        elif self.profiler == 'pyinstrument':
+            from pyinstrument import Profiler # Optional, only needed for this profiler
+            self.session = Profiler(async_mode='disabled')
+            self.session.start()
+        elif self.profiler is not None:
+            raise ValueError(f"Unknown profiler '{self.profiler}', use 'cprofile' or 'pyinstrument'")
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.session is None:
+            return False
+        if self.profiler == 'cprofile':
+            self.session.disable()
+            Profile.cprofile_lock.release()
+        os.makedirs(self.profile_dir, exist_ok=True)
+        if self.profiler == 'cprofile':
+            self.session.dump_stats(os.path.join(self.profile_dir, f"{self.name}.prof"))
+        else:
+            self.session.stop()
+            with open(os.path.join(self.profile_dir, f"{self.name}.html"), 'w') as file:
+                file.write(self.session.output_html())
+        return False
+
+# The instrumentation shared by every instrumented method
+metrics = Instrumentation()
+
+def instrument(kind):
+    '''
+    The function 'instrument' is a decorator which records every call of a method with 'metrics'.
+
+        Parameters:
+                kind(String): The kind of the method, 'extract', 'clean', 'upload' or 'sql'
+
+        Returns:
+                decorator(Function): The decorator
+    '''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            return metrics.measure(kind, function, args, kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,196 @@
+from snapshot_store import SnapshotStore
+import numpy as np
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# The foreign keys of 'orders_table' added by 'Adding_foreign_keys.sql': each column of the orders references
+# the key column of a dimension table
+FOREIGN_KEYS = {
+    'card_number': ('dim_card_details', 'card_number'),
+    'date_uuid': ('dim_date_times', 'date_uuid'),
+    'product_code': ('dim_products', 'product_code'),
+    'store_code': ('dim_store_details', 'store_code'),
+    'user_uuid': ('dim_users', 'user_uuid')
+    }
+
+# The snapshot the quarantined orders are kept in until their dimension rows arrive
+QUARANTINE_TABLE = 'orders_table_quarantine'
+
+class IntegrityChecker():
+    '''
+    The class 'IntegrityChecker' finds the orders whose foreign keys are not in the cleaned dimension tables
+    before they are uploaded, so 'Adding_foreign_keys.sql' does not fail on an orphan key after every table
+    has been loaded.
+
+    The distinct keys of each dimension are read from its snapshot (only the key column) as an Arrow array,
+    and each foreign key column of the orders is anti-joined to it with 'pyarrow.compute.is_in', which hashes
+    the keys once and probes the set with every order in Arrow's kernels. The time is linear in the number
+    of orders and the memory is bounded by the number of distinct keys, plus one boolean mask per column.
+    A missing foreign key is not an orphan, as the constraint allows NULL.
+
+    The orphan orders are kept in the snapshot 'QUARANTINE_TABLE'. They are checked again by every incremental
+    load of the orders ('recheck'), and the ones whose keys have arrived are loaded with the new orders, so
+    the high-water mark of the orders can move past the quarantined orders without losing them.
+
+    Attributes
+    ----------
+    snapshots(SnapshotStore): The snapshots the dimension keys are read from
+    keys(Dictionary): The distinct keys of each dimension table given directly, instead of its snapshot
+
+    Methods
+    -------
+    key_index(self, table_name, column)
+    find_orphans(self, df_orders)
+    report(self, orphans)
+    split(self, df_orders)
+    recheck(self)
+    save_quarantine(self, df_quarantine, mode)
+    quarantine(self, df_orders, mode)
+    '''
+
+    def __init__(self, snapshots=None, tables=None):
+        self.snapshots = snapshots or SnapshotStore()
+        self.keys = {}
+        for table_name, key_column in FOREIGN_KEYS.values():
+            if table_name in (tables or {}):
+                keys = pa.array(tables[table_name][key_column], from_pandas=True)
+                self.keys[table_name] = keys.unique().drop_null()
+
+    def key_index(self, table_name, column):
+        '''
+        The method 'key_index' returns the distinct keys of a dimension table, read from its snapshot unless
+        the table was given directly.
+
+            Parameters:
+                    table_name(String): The name of the dimension table
+                    column(String): The key column
+
+            Returns:
+                    keys(pyarrow.Array): The distinct keys, or None if the table has no snapshot
+        '''
+        if table_name in self.keys:
+            return self.keys[table_name]
+        if not os.path.exists(self.snapshots.table_path(table_name)):
+            return None
+        return self.snapshots.read_table(table_name, [column]).column(column).unique().drop_null()
+
+    def find_orphans(self, df_orders):
+        '''
+        The method 'find_orphans' anti-joins every foreign key column of the orders to the keys of its
+        dimension table. The columns whose dimension has no snapshot are not checked.
+
+            Parameters:
+                    df_orders(Dataframe): The cleaned orders
+
+            Returns:
+                    orphans(Dataframe): One boolean column for each checked foreign key, True for the orders
+                                        whose key is not in the dimension
+        '''
+        orphans = {}
+        for column, (table_name, key_column) in FOREIGN_KEYS.items():
+            if column not in df_orders.columns:
+                continue
+            keys = self.key_index(table_name, key_column)
+            if keys is None:
+                print(f"No snapshot of '{table_name}', '{column}' is not checked")
+                continue
+            values = pa.array(df_orders[column], from_pandas=True)
+            found = pc.is_in(values, value_set=keys.cast(values.type))
+            orphans[column] = pc.and_(pc.is_valid(values), pc.invert(found)).to_numpy(zero_copy_only=False)
+        return pd.DataFrame(orphans, index=df_orders.index)
+
+    def report(self, orphans):
+        '''
+        The method 'report' prints the number of orphan orders of each foreign key.
+
+            Parameters:
+                    orphans(Dataframe): The result of 'find_orphans'
+
+            Returns:
+                    counts(Dictionary): The number of orphans of each foreign key column
+        '''
+        counts = {column: int(mask.sum()) for column, mask in orphans.items()}
+        if any(counts.values()):
+            print(f"{int(orphans.any(axis=1).sum())} orders with orphan keys:",
+                  ', '.join(f"{column}={count}" for column, count in counts.items() if count))
+        return counts
+
+    def split(self, df_orders):
+        '''
+        The method 'split' separates the orders with an orphan key from the others. The orphan orders get the
+        column 'orphan_keys', which lists their orphan foreign keys.
+
+            Parameters:
+                    df_orders(Dataframe): The cleaned orders
+
+            Returns:
+                    df_orders(Dataframe): The orders whose keys are all in the dimension tables
+                    df_quarantine(Dataframe): The orders with an orphan key
+        '''
+        orphans = self.find_orphans(df_orders)
+        self.report(orphans)
+        is_orphan = orphans.any(axis=1).to_numpy()
+        df_quarantine = df_orders[is_orphan].copy()
+        orphan_keys = pd.Series('', index=df_quarantine.index, dtype=object)
+        for column, mask in orphans[is_orphan].items():
+            orphan_keys += np.where(mask, f"{column},", '')
+        df_quarantine['orphan_keys'] = orphan_keys.str.rstrip(',')
+        return df_orders[~is_orphan], df_quarantine
+
+    def recheck(self):
+        '''
+        The method 'recheck' checks the quarantined orders again against the current dimension keys. The
+        snapshot is not changed here, the orders still in quarantine are saved with 'save_quarantine' once the
+        released orders are loaded, so a failed load does not lose them.
+
+            Parameters:
+                    None
+
+            Returns:
+                    df_released(Dataframe): The quarantined orders whose keys are now all in the dimension tables
+                    df_quarantine(Dataframe): The orders which stay in quarantine
+        '''
+        if not os.path.exists(self.snapshots.table_path(QUARANTINE_TABLE)):
+            return None, None
+        df_quarantine = self.snapshots.read(QUARANTINE_TABLE).drop(columns='orphan_keys')
+        df_released, df_quarantine = self.split(df_quarantine)
+        if len(df_released):
+            print(f"{len(df_released)} quarantined orders released")
+        return df_released, df_quarantine
+
+    def save_quarantine(self, df_quarantine, mode='overwrite'):
+        '''
+        The method 'save_quarantine' writes the quarantined orders to the snapshot 'QUARANTINE_TABLE'. With
+        mode 'overwrite' the snapshot is replaced even if there are no orders left in quarantine. The snapshot
+        is the only copy of the quarantined orders, so a failed write is raised, and the orders load fails
+        before its high-water mark is saved.
+
+            Parameters:
+                    df_quarantine(Dataframe): The orders with an orphan key, see 'split'
+                    mode(String): 'overwrite' or 'append'
+
+            Returns:
+                    None
+        '''
+        if mode == 'overwrite' or len(df_quarantine):
+            if not self.snapshots.write(df_quarantine, QUARANTINE_TABLE, mode):
+                raise RuntimeError(f"The quarantined orders could not be written to '{QUARANTINE_TABLE}'")
+
+    def quarantine(self, df_orders, mode='append'):
+        '''
+        The method 'quarantine' removes the orders with an orphan key before they are uploaded and writes
+        them to the snapshot 'QUARANTINE_TABLE' straight away. It is used by the chunked full load, which
+        overwrites the quarantine with its first chunk and appends the next ones.
+
+            Parameters:
+                    df_orders(Dataframe): The cleaned orders
+                    mode(String): 'overwrite' or 'append'
+
+            Returns:
+                    df_orders(Dataframe): The orders whose keys are all in the dimension tables
+        '''
+        df_orders, df_quarantine = self.split(df_orders)
+        self.save_quarantine(df_quarantine, mode)
+        return df_orders
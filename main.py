@@ -1,6 +1,10 @@
-from database_utils import DatabaseConnector
+from database_utils import DatabaseConnector, UPSERT_KEYS
 from data_extraction import DataExtractor
 from data_cleaning import DataCleaning
+from integrity_check import IntegrityChecker
+from snapshot_store import SnapshotStore
+import itertools
+import pandas as pd
 
 # Paths
 creds_file = 'db_creds.yaml'
@@ -14,24 +18,38 @@ data_events_path = 'https://data-handling-public.s3.eu-west-1.amazonaws.com/date
 # Instances
 connector = DatabaseConnector()
 extractor = DataExtractor()
-data_cleaner = DataCleaning(connector)
+data_cleaner = DataCleaning()
+snapshots = SnapshotStore()
+integrity_checker = IntegrityChecker(snapshots)
 
-def user_data(connector, extractor, data_cleaner, creds_file):
+def user_data(connector, extractor, data_cleaner, creds_file, full_refresh=False):
 
     # Initiating database engine and listing the table names
-    creds = connector.read_db_creds(creds_file)
-    engine = connector.init_db_engine(creds)
+    engine = connector.init_source_engine(creds_file)
 
-    # Extracting data from table
+    # Extracting the rows added since the last run, or the whole table for a full refresh
     connector.list_db_tables(engine) # tables names
-    df_user = extractor.read_rds_table('legacy_users', engine)
+    high_water_mark = None if full_refresh else connector.read_high_water_mark('legacy_users', 'dim_users')
+    df_user = extractor.read_rds_table_delta('legacy_users', engine, high_water_mark)
+    if df_user is None: # The error was printed by the extractor, the stage fails rather than loading nothing
+        raise RuntimeError("The rows of 'legacy_users' could not be extracted")
+    if df_user.empty:
+        print("No new rows in 'legacy_users'")
+        return 0
 
     # Cleaning the extracted data
     cleaned_data = data_cleaner.clean_user_data(df_user)
-    cleaned_data.to_string('users_data')
 
-    # Uploading the dataframe to SQL
-    connector.upload_to_db(cleaned_data, 'dim_users')
+    # Uploading the dataframe to SQL, the delta is merged into the existing table. The snapshot and the mark 
+    # are only written once the rows are loaded, so a failed load is extracted again by the next run
+    if high_water_mark is None:
+        rows = connector.upload_to_db(cleaned_data, 'dim_users')
+    else:
+        rows = connector.upsert_to_db(cleaned_data, 'dim_users', UPSERT_KEYS['dim_users'])
+    snapshots.write(cleaned_data, 'dim_users', 'overwrite' if high_water_mark is None else 'append')
+    connector.save_high_water_mark('legacy_users', df_user['index'].max())
+
+    return rows
 
 def card_data(connector, extractor, data_cleaner, pdf_link):
 
@@ -40,10 +58,11 @@ def card_data(connector, extractor, data_cleaner, pdf_link):
 
     # Cleaning the extracted data
     cleaned_data = data_cleaner.clean_card_data(df_card)
-    cleaned_data.to_string('card_data')
+    data_cleaner.validate_card_data(cleaned_data)
+    snapshots.write(cleaned_data, 'dim_card_details')
 
     # Uploading the dataframe to SQL
-    connector.upload_to_db(cleaned_data, 'dim_card_details')
+    return connector.upload_to_db(cleaned_data, 'dim_card_details')
 
 def store_data(connector, extractor, data_cleaner, num_stores_endpoint, header_dict, store_endpoint):
 
@@ -55,10 +74,10 @@ def store_data(connector, extractor, data_cleaner, num_stores_endpoint, header_d
 
     # Cleaning the extracted data
     cleaned_data = data_cleaner.clean_store_data(df_stores)
-    cleaned_data.to_string('store_details')
+    snapshots.write(cleaned_data, 'dim_store_details')
 
     # Uploading the dataframe to SQL
-    connector.upload_to_db(cleaned_data, 'dim_store_details')
+    return connector.upload_to_db(cleaned_data, 'dim_store_details')
     
 def product_data(connector, extractor, data_cleaner, s3_address):
 
@@ -68,27 +87,88 @@ def product_data(connector, extractor, data_cleaner, s3_address):
     # Cleaning the extracted data
     cleaned_data = data_cleaner.clean_products_data(df_product)
     cleaned_data = data_cleaner.convert_product_weights(cleaned_data)
-    cleaned_data.to_string('product_details')
+    snapshots.write(cleaned_data, 'dim_products')
 
     # Uploading the dataframe to SQL
-    connector.upload_to_db(cleaned_data, 'dim_products')
+    return connector.upload_to_db(cleaned_data, 'dim_products')
+
+def product_data_in_chunks(connector, extractor, data_cleaner, s3_address, chunksize=100000):
+
+    # Extracting, cleaning and uploading the CSV file one chunk at a time
+    df_chunks = extractor.extract_from_s3_in_chunks(s3_address, chunksize)
+    cleaned_chunks = data_cleaner.clean_in_chunks(
+        df_chunks, lambda df_chunk: data_cleaner.convert_product_weights(data_cleaner.clean_products_data(df_chunk))
+        )
+    return connector.upload_chunks_to_db(cleaned_chunks, 'dim_products')
 
-def orders_data(connector, extractor, data_cleaner, creds_file):
+def orders_data(connector, extractor, data_cleaner, creds_file, full_refresh=False):
 
      # Initiating database engine and listing the table names
-    creds = connector.read_db_creds(creds_file)
-    engine = connector.init_db_engine(creds)
+    engine = connector.init_source_engine(creds_file)
 
-    # Extracting data from table
+    # Extracting the rows added since the last run, or the whole table for a full refresh
     connector.list_db_tables(engine) # tables names
-    df_orders = extractor.read_rds_table('orders_table', engine)
-
-    # Cleaning the extracted data
-    cleaned_data = data_cleaner.clean_orders_data(df_orders)
-    cleaned_data.to_string('orders_table')
+    high_water_mark = None if full_refresh else connector.read_high_water_mark('orders_table', 'orders_table')
+    df_orders = extractor.read_rds_table_delta('orders_table', engine, high_water_mark)
+    if df_orders is None: # The error was printed by the extractor, the stage fails rather than loading nothing
+        raise RuntimeError("The rows of 'orders_table' could not be extracted")
+
+    # The quarantined orders are checked again by an incremental load, a full refresh extracts them again
+    df_released, df_quarantine = (None, None) if high_water_mark is None else integrity_checker.recheck()
+    if df_orders.empty and (df_released is None or df_released.empty):
+        print("No new rows in 'orders_table'")
+        return 0
+
+    # Cleaning the extracted data, the orders whose keys are not in the dimension snapshots are quarantined 
+    # and the quarantined orders whose keys have arrived are loaded with the new ones
+    cleaned_data, df_orphans = integrity_checker.split(data_cleaner.clean_orders_data(df_orders))
+    if df_released is not None:
+        cleaned_data = pd.concat([df_released, cleaned_data], ignore_index=True)
+        df_orphans = pd.concat([df_quarantine, df_orphans], ignore_index=True)
     
-    # Uploading the dataframe to SQL
-    connector.upload_to_db(cleaned_data, 'orders_table')
+    # Uploading the dataframe to SQL, the delta is merged into the existing table. The snapshot, the 
+    # quarantine and the mark are only written once the orders are loaded, and 'save_quarantine' raises 
+    # if the quarantine cannot be written, so the mark is not saved and the next run checks the orders again
+    if high_water_mark is None:
+        rows = connector.upload_to_db(cleaned_data, 'orders_table')
+    else:
+        rows = connector.upsert_to_db(cleaned_data, 'orders_table', UPSERT_KEYS['orders_table'])
+    snapshots.write(cleaned_data, 'orders_table', 'overwrite' if high_water_mark is None else 'append')
+    integrity_checker.save_quarantine(df_orphans)
+    if df_released is not None and not df_released.empty:
+        # The released orders keep their old 'index', which the sales rollup has already passed, so it is 
+        # rebuilt in full by its next refresh
+        connector.clear_high_water_mark('sales_rollup')
+    if not df_orders.empty:
+        connector.save_high_water_mark('orders_table', df_orders['index'].max())
+
+    return rows
+
+def orders_data_in_chunks(connector, extractor, data_cleaner, creds_file, chunksize=50000):
+
+    # Initiating database engine
+    engine = connector.init_source_engine(creds_file)
+
+    # Extracting, cleaning and uploading the table one chunk at a time. The whole table is reloaded, so the 
+    # first chunk replaces the quarantined orders and the next ones are appended to them. The cleaned chunks 
+    # are written to a staging snapshot, which replaces the snapshot of 'orders_table' once every chunk is 
+    # loaded, and the largest 'index' read is saved as the high-water mark of the incremental loads
+    df_chunks = extractor.read_rds_table_in_chunks('orders_table', engine, chunksize)
+    modes = itertools.chain(['overwrite'], itertools.repeat('append'))
+    high_water_marks = []
+    def clean_chunk(df_chunk):
+        mode = next(modes)
+        high_water_marks.append(df_chunk['index'].max())
+        cleaned_chunk = integrity_checker.quarantine(data_cleaner.clean_orders_data(df_chunk), mode)
+        if not snapshots.write(cleaned_chunk, 'orders_table_staging', mode):
+            raise RuntimeError("The orders could not be written to the snapshot 'orders_table_staging'")
+        return cleaned_chunk
+    rows = connector.upload_chunks_to_db(data_cleaner.clean_in_chunks(df_chunks, clean_chunk), 'orders_table')
+    if high_water_marks:
+        snapshots.replace('orders_table_staging', 'orders_table')
+        connector.save_high_water_mark('orders_table', max(high_water_marks))
+
+    return rows
 
 def date_events_data(connector, extractor, data_cleaner, data_events_path):
 
@@ -97,8 +177,12 @@ def date_events_data(connector, extractor, data_cleaner, data_events_path):
 
     # Cleaning the extracted data
     cleaned_data = data_cleaner.clean_event_data(df_events_data)
-    cleaned_data.to_string('event_data')
+    snapshots.write(cleaned_data, 'dim_date_times')
 
     # Uploading the dataframe to SQL
-    connector.upload_to_db(cleaned_data, 'dim_date_times')
+    return connector.upload_to_db(cleaned_data, 'dim_date_times')
+
+def snapshot_data(connector, table_name):
 
+    # Uploading a table from its snapshot, without extracting and cleaning it again
+    return connector.upload_to_db(snapshots.read(table_name), table_name)
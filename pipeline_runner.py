@@ -0,0 +1,323 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from data_cleaning import DataCleaning
+from data_extraction import DataExtractor
+from instrumentation import metrics, resident_memory_mb
+import argparse
+import json
+import logging
+import main
+import os
+import time
+
+# The directory of the scripts which create the star schema
+SQL_DIR = 'Create_the_database_schema_sql'
+
+# The table loaded by each job, used to load the jobs from their snapshots
+JOB_TABLES = {
+    'user_data': 'dim_users',
+    'card_data': 'dim_card_details',
+    'store_data': 'dim_store_details',
+    'product_data': 'dim_products',
+    'orders_data': 'orders_table',
+    'date_events_data': 'dim_date_times'
+    }
+
+# The jobs which load the dimension tables
+DIMENSION_JOBS = ['user_data', 'card_data', 'store_data', 'product_data', 'date_events_data']
+
+class PipelineRunner():
+    '''
+    The class 'PipelineRunner' runs the ETL jobs of 'main.py' and the schema scripts of 
+    'Create_the_database_schema_sql' as a dependency graph (DAG). A stage starts as soon as all the 
+    stages it depends on have finished, and independent stages run at the same time in a thread pool.
+
+    For every stage the start and end time, the wall time, the number of rows processed and the resident 
+    memory of the process before and after the stage are recorded, and the critical path (the chain of stages which determines the total run time) is reported.
+
+    Attributes
+    ----------
+    connector(DatabaseConnector): The connector shared by all the stages
+    extractor(DataExtractor): The extractor shared by all the stages
+    data_cleaner(DataCleaning): The data cleaner shared by all the stages
+    max_workers(Int): The maximum number of stages running at the same time, 1 when the stages are profiled 
+                      with cProfile
+    full_refresh(Bool): Whether 'legacy_users' and 'orders_table' are reloaded in full instead of 
+                        incrementally
+    from_snapshot(Bool): Whether the jobs upload the Parquet snapshots of the tables instead of extracting 
+                         and cleaning them again
+    profiler(String): 'cprofile' or 'pyinstrument' to profile every stage, None by default
+    profile_dir(String): The directory the profile of each stage is saved to
+    stages(Dictionary): Maps the name of each stage to its function and the stages it depends on
+    records(Dictionary): The timing record of each stage which was run
+    products_fingerprint(String): The fingerprint of the snapshot of 'dim_products' when the run started
+
+    Methods
+    -------
+    build_stages(self)
+    products_reloaded(self)
+    sql_stage(self, script_name)
+    run(self, stage_names)
+    run_stage(self, name)
+    critical_path(self)
+    report(self)
+    '''
+
+    def __init__(self, connector, extractor, data_cleaner, max_workers=4, full_refresh=False, from_snapshot=False, 
+                 profiler=None, profile_dir='profiles'):
+        self.connector = connector
+        self.extractor = extractor
+        self.data_cleaner = data_cleaner
+        if profiler == 'cprofile' and max_workers > 1:
+            # Only one cProfile profiler can be active in a process (Python 3.12+), so the stages run one by one
+            print("The stages are profiled with cProfile, they are run one at a time")
+            max_workers = 1
+        self.max_workers = max_workers
+        self.full_refresh = full_refresh
+        self.from_snapshot = from_snapshot
+        self.profiler = profiler
+        self.profile_dir = profile_dir
+        self.stages = self.build_stages()
+        self.records = {}
+        self.products_fingerprint = None
+
+    def build_stages(self):
+        '''
+        The method 'build_stages' defines the stages of the pipeline and their dependencies. The orders job 
+        waits for the dimension jobs, as its orders are checked against the keys of their snapshots before 
+        the upload. The primary keys wait for the load of every dimension and the foreign keys wait for the 
+        primary keys and the orders table. The sale timestamps and indexes are added once the orders, dates 
+        and stores are loaded and the foreign keys are added: the two scripts lock 'orders_table' and 
+        'dim_date_times' in opposite orders, so they would deadlock if they ran at the same time. The sales 
+        rollup is refreshed after them, and rebuilt in full when the products changed, as it holds the 
+        value of the sales at the prices of 'dim_products'. With 'from_snapshot' each job uploads the snapshot of its table 
+        instead.
+
+            Parameters:
+                    None
+
+            Returns:
+                    stages(Dictionary): Maps the name of each stage to a tuple (function, dependencies)
+        '''
+        connector, extractor, data_cleaner = self.connector, self.extractor, self.data_cleaner
+        stages = {
+            # Extract, clean and load jobs
+            'user_data': (lambda: main.user_data(connector, extractor, data_cleaner, main.creds_file, 
+                                                 self.full_refresh), []),
+            'card_data': (lambda: main.card_data(connector, extractor, data_cleaner, main.pdf_link), []),
+            'store_data': (lambda: main.store_data(connector, extractor, data_cleaner, main.num_stores_endpoint, 
+                                                   main.header_dict, main.store_endpoint), []),
+            'product_data': (lambda: main.product_data(connector, extractor, data_cleaner, main.s3_address), []),
+            'orders_data': (lambda: main.orders_data(connector, extractor, data_cleaner, main.creds_file, 
+                                                     self.full_refresh), DIMENSION_JOBS),
+            'date_events_data': (lambda: main.date_events_data(connector, extractor, data_cleaner, 
+                                                               main.data_events_path), []),
+            # Schema scripts, the tables are uploaded with their final column types so no casting is needed
+            'primary_keys': (self.sql_stage('Creating_primary_keys.sql'), DIMENSION_JOBS),
+            'foreign_keys': (self.sql_stage('Adding_foreign_keys.sql'), ['primary_keys', 'orders_data']),
+            'indexes': (self.sql_stage('Adding_sale_timestamp_and_indexes.sql'), 
+                        ['orders_data', 'date_events_data', 'store_data', 'foreign_keys']),
+            # Summary tables
+            'create_sales_rollup': (self.sql_stage('Creating_the_sales_rollup_table.sql'), 
+                                    ['indexes', 'product_data']),
+            'sales_rollup': (lambda: connector.refresh_sales_rollup(self.full_refresh or self.products_reloaded()), 
+                             ['create_sales_rollup', 'product_data'])
+            }
+        if self.from_snapshot:
+            for job, table_name in JOB_TABLES.items():
+                stages[job] = (lambda table_name=table_name: main.snapshot_data(connector, table_name), [])
+        return stages
+
+    def products_reloaded(self):
+        '''
+        The method 'products_reloaded' tells whether the stage 'product_data' changed the content of 
+        'dim_products' in this run, in which case the prices frozen in the sales rollup may be stale. The 
+        fingerprint of the products snapshot is compared with the one read when the run started, so 
+        reloading the same products keeps the incremental refresh of the rollup.
+
+            Parameters:
+                    None
+
+            Returns:
+                    reloaded(Bool): True if the stage 'product_data' is done and the products changed
+        '''
+        if self.records.get('product_data', {}).get('status') != 'done':
+            return False
+        fingerprint = main.snapshots.read_manifest().get('dim_products', {}).get('fingerprint')
+        return fingerprint is None or fingerprint != self.products_fingerprint
+
+    def sql_stage(self, script_name):
+        '''
+        The method 'sql_stage' returns a stage function which runs one of the schema scripts.
+
+            Parameters:
+                    script_name(String): The name of the SQL file in 'SQL_DIR'
+
+            Returns:
+                    stage(Function): A function which runs the script
+        '''
+        return lambda: self.connector.run_sql_script(os.path.join(SQL_DIR, script_name))
+
+    def run_stage(self, name):
+        '''
+        The method 'run_stage' runs a single stage and records its timing, the number of rows it processed 
+        and the resident memory of the process before and after it. The stage is profiled if a profiler was chosen. A stage fails when its function raises, 
+        e.g. when an upload or a schema script fails, and the stages which depend on it are then skipped.
+
+            Parameters:
+                    name(String): The name of the stage
+
+            Returns:
+                    None
+        '''
+        function = self.stages[name][0]
+        record = self.records[name]
+        record['start'] = time.perf_counter() - self.start_time
+        record['rss_start_mb'] = resident_memory_mb()
+        start_cpu = time.thread_time()
+        metrics.set_stage(name) # The calls of the instrumented methods are recorded under the stage name
+        try:
+            with metrics.profile(name, self.profiler, self.profile_dir):
+                rows = function()
+            record['rows'] = rows if isinstance(rows, int) else None
+            record['status'] = 'done'
+        except Exception as error:
+            record['status'] = 'failed'
+            record['error'] = str(error)
+            print(f"Stage '{name}' failed:", error)
+        record['end'] = time.perf_counter() - self.start_time
+        record['wall_time'] = record['end'] - record['start']
+        record['cpu_time'] = time.thread_time() - start_cpu
+        record['rss_end_mb'] = resident_memory_mb()
+        metrics.set_stage(None)
+
+    def run(self, stage_names=None):
+        '''
+        The method 'run' runs the selected stages, together with every stage they depend on, in dependency 
+        order. A stage whose dependencies failed is skipped.
+
+            Parameters:
+                    stage_names(List): The names of the stages to run, all the stages by default
+
+            Returns:
+                    records(Dictionary): The timing record of each stage
+        '''
+        # Add the dependencies of the selected stages
+        selected = set()
+        pending = list(stage_names or self.stages)
+        while pending:
+            name = pending.pop()
+            if name not in selected:
+                selected.add(name)
+                pending.extend(self.stages[name][1])
+
+        self.records = {name: {'stage': name, 'status': 'pending', 'rows': None} for name in selected}
+        self.products_fingerprint = main.snapshots.read_manifest().get('dim_products', {}).get('fingerprint')
+        self.connector.init_local_db_engine() # Prompt for the password, if needed, before the threads start
+        self.start_time = time.perf_counter()
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                for name in sorted(selected):
+                    record = self.records[name]
+                    if record['status'] != 'pending':
+                        continue
+                    dependencies = [self.records[dependency]['status'] for dependency in self.stages[name][1]]
+                    if any(status in ('failed', 'skipped') for status in dependencies):
+                        record['status'] = 'skipped'
+                    elif all(status == 'done' for status in dependencies):
+                        record['status'] = 'running'
+                        running[executor.submit(self.run_stage, name)] = name
+                if not running:
+                    if any(record['status'] == 'pending' for record in self.records.values()):
+                        continue # A stage was skipped, so its dependents have to be skipped as well
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    del running[future]
+
+        return self.records
+
+    def critical_path(self):
+        '''
+        The method 'critical_path' finds the chain of dependent stages with the longest total wall time, 
+        which is the lower bound of the run time however many workers are used.
+
+            Parameters:
+                    None
+
+            Returns:
+                    path(List): The names of the stages on the critical path, in run order
+        '''
+        longest = {}
+        def path_to(name):
+            if name not in longest:
+                dependencies = [dependency for dependency in self.stages[name][1] 
+                                if self.records.get(dependency, {}).get('wall_time') is not None]
+                previous = max((path_to(dependency) for dependency in dependencies), default=(0.0, []))
+                longest[name] = (previous[0] + self.records[name]['wall_time'], previous[1] + [name])
+            return longest[name]
+
+        paths = [path_to(name) for name, record in self.records.items() if record.get('wall_time') is not None]
+        return max(paths, default=(0.0, []))[1]
+
+    def report(self):
+        '''
+        The method 'report' prints the record of every stage as a JSON line, ordered by start time, 
+        followed by the critical path.
+
+            Parameters:
+                    None
+
+            Returns:
+                    None
+        '''
+        for record in sorted(self.records.values(), key=lambda record: record.get('start', float('inf'))):
+            print(json.dumps({key: round(value, 3) if isinstance(value, float) else value 
+                              for key, value in record.items()}))
+        path = self.critical_path()
+        total = sum(self.records[name]['wall_time'] for name in path)
+        print(f"Critical path ({total:.2f}s):", ' -> '.join(path))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the ETL pipeline as a dependency graph of stages.')
+    parser.add_argument('stages', nargs='*', help='The stages to run (with their dependencies), all by default')
+    parser.add_argument('--workers', type=int, default=4, help='The maximum number of stages running at once')
+    parser.add_argument('--full-refresh', action='store_true', 
+                        help='Reload the users and orders tables in full instead of only the new rows')
+    parser.add_argument('--arrow', action='store_true', 
+                        help='Extract and clean the tables with Arrow-backed dtypes instead of object columns')
+    parser.add_argument('--clean-workers', type=int, default=1, 
+                        help='Clean the large tables in row shards across this many worker processes')
+    parser.add_argument('--from-snapshot', action='store_true', 
+                        help='Upload the Parquet snapshots of the tables instead of extracting them again')
+    parser.add_argument('--metrics-log', help='Append the JSON record of every extract/clean/upload call to this file '
+                        '(they are printed to stderr by default)')
+    parser.add_argument('--openmetrics', help='Write the totals of every extract/clean/upload method to this '
+                        'OpenMetrics text file')
+    parser.add_argument('--profile', choices=['cprofile', 'pyinstrument'], 
+                        help='Profile every stage, with cprofile the stages are run one at a time')
+    parser.add_argument('--profile-dir', default='profiles', help='The directory the profiles are saved to')
+    args = parser.parse_args()
+
+    extractor, data_cleaner = main.extractor, main.data_cleaner
+    if args.arrow:
+        extractor = DataExtractor(dtype_backend='pyarrow')
+    if args.arrow or args.clean_workers > 1:
+        data_cleaner = DataCleaning(backend='pyarrow' if args.arrow else 'pandas', workers=args.clean_workers)
+    handler = logging.FileHandler(args.metrics_log) if args.metrics_log else logging.StreamHandler()
+    metrics_logger = logging.getLogger('etl.metrics')
+    metrics_logger.addHandler(handler)
+    metrics_logger.setLevel(logging.INFO)
+
+    runner = PipelineRunner(main.connector, extractor, data_cleaner, max_workers=args.workers, 
+                            full_refresh=args.full_refresh, from_snapshot=args.from_snapshot, 
+                            profiler=args.profile, profile_dir=args.profile_dir)
+    unknown = [name for name in args.stages if name not in runner.stages]
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(unknown)}. Choose from: {', '.join(runner.stages)}")
+    runner.run(args.stages)
+    data_cleaner.close_workers()
+    runner.report()
+    if args.openmetrics:
+        metrics.write_openmetrics(args.openmetrics)
@@ -0,0 +1,250 @@
+import json
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+# The columns each table is partitioned by in its snapshot, the tables not listed are not partitioned
+PARTITION_COLUMNS = {
+    'dim_date_times': ['year']
+    }
+
+class SnapshotStore():
+    '''
+    The class 'SnapshotStore' keeps a Parquet snapshot of every cleaned table, so the tables can be uploaded
+    again or analysed without extracting and cleaning them again.
+
+    Each table is a directory of zstd-compressed Parquet files, partitioned as in 'PARTITION_COLUMNS'. A
+    snapshot is written to a temporary directory which then replaces the old one, so readers never see a
+    half-written table. The swap is two renames (the old directory is moved away, then the new one into
+    place), so a reader can briefly find no snapshot while it is replaced. 'manifest.json' records the
+    number of rows, the schema, the time and a fingerprint of the content of every snapshot, so the stages
+which depend on a table can tell whether its content changed. The snapshots are read with memory-mapped
+    Arrow reads, and the partition columns are given back their position and type from the manifest.
+
+    Attributes
+    ----------
+    snapshot_dir(String): The directory of the snapshots
+    compression(String): The Parquet compression codec
+
+    Methods
+    -------
+    table_path(self, table_name)
+    write(self, df, table_name, mode)
+    fingerprint(self, df)
+    replace(self, source_name, table_name)
+    read_table(self, table_name, columns)
+    read(self, table_name, columns)
+    read_manifest(self)
+    update_manifest(self, table_name, entry)
+    '''
+
+    def __init__(self, snapshot_dir='snapshots', compression='zstd'):
+        self.snapshot_dir = snapshot_dir
+        self.compression = compression
+        self.lock = threading.Lock() # The pipeline writes the snapshots of several tables at the same time
+        os.makedirs(snapshot_dir, exist_ok=True)
+
+    def table_path(self, table_name):
+        '''
+        The method 'table_path' returns the directory of the snapshot of a table.
+
+            Parameters:
+                    table_name(String): The name of the table
+
+            Returns:
+                    path(String): The directory of the snapshot
+        '''
+        return os.path.join(self.snapshot_dir, table_name)
+
+    def write(self, df, table_name, mode='overwrite'):
+        '''
+        The method 'write' writes a cleaned table as a Parquet snapshot and records it in the manifest.
+
+        With mode 'overwrite' the whole snapshot is written to a temporary directory which then replaces the
+        old snapshot. With mode 'append' (used by the incremental loads) the rows are written to a new file
+        which is moved into the existing snapshot. An error is printed rather than raised, as most snapshots 
+        are a copy of a table which is already loaded, so the callers which cannot go on without the 
+        snapshot check the returned flag.
+
+            Parameters:
+                    df(Dataframe): The cleaned table
+                    table_name(String): The name of the table
+                    mode(String): 'overwrite' or 'append'
+
+            Returns:
+                    written(Bool): True if the snapshot was written, False if it failed
+        '''
+        try:
+            path = self.table_path(table_name)
+            partition_columns = PARTITION_COLUMNS.get(table_name)
+            temp_dir = tempfile.mkdtemp(prefix=f".{table_name}-", dir=self.snapshot_dir)
+            if partition_columns:
+                df.to_parquet(temp_dir, index=False, compression=self.compression, partition_cols=partition_columns,
+                              basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet")
+            else:
+                df.to_parquet(os.path.join(temp_dir, f"part-{uuid.uuid4().hex}.parquet"), index=False,
+                              compression=self.compression)
+
+            rows = len(df)
+            fingerprint = self.fingerprint(df)
+            if mode == 'append' and os.path.exists(path):
+                # Move each new file into the existing snapshot, a rename is atomic
+                for directory, _, files in os.walk(temp_dir):
+                    target_dir = os.path.join(path, os.path.relpath(directory, temp_dir))
+                    os.makedirs(target_dir, exist_ok=True)
+                    for file in files:
+                        os.replace(os.path.join(directory, file), os.path.join(target_dir, file))
+                shutil.rmtree(temp_dir)
+                entry = self.read_manifest().get(table_name, {})
+                rows += entry.get('rows', 0)
+                fingerprint = (fingerprint + int(entry.get('fingerprint', '0'), 16)) % 2 ** 64
+            else:
+                old_path = f"{temp_dir}.old"
+                if os.path.exists(path):
+                    os.rename(path, old_path)
+                os.rename(temp_dir, path)
+                shutil.rmtree(old_path, ignore_errors=True)
+
+            self.update_manifest(table_name, {
+                'rows': rows,
+                'schema': {str(column): str(dtype) for column, dtype in df.dtypes.items()},
+                'partition_columns': partition_columns or [],
+                'compression': self.compression,
+                'fingerprint': f"{fingerprint:016x}",
+                'written_at': time.strftime('%Y-%m-%dT%H:%M:%S%z')
+                })
+            print(f"Snapshot of '{table_name}' written ({rows} rows)")
+            return True
+        except Exception as error:
+            print(f"Error writing the snapshot of '{table_name}':", error)
+            return False
+
+    def fingerprint(self, df):
+        '''
+        The method 'fingerprint' hashes the content of a table. The hashes of the rows are added up (modulo 
+        2**64), so the order of the rows does not matter and the fingerprint of an appended snapshot is the 
+        sum of the fingerprints of its parts.
+
+            Parameters:
+                    df(Dataframe): The table
+
+            Returns:
+                    fingerprint(Int): The fingerprint of the table
+        '''
+        return int(pd.util.hash_pandas_object(df, index=False).sum())
+
+    def replace(self, source_name, table_name):
+        '''
+        The method 'replace' moves the snapshot of a table into the place of another one, e.g. a snapshot 
+        written chunk by chunk under a staging name once the whole table is loaded. The swap is the same as 
+        in 'write', and the manifest entry is moved with it.
+
+            Parameters:
+                    source_name(String): The name the snapshot was written under
+                    table_name(String): The name of the snapshot it replaces
+
+            Returns:
+                    None
+        '''
+        path = self.table_path(table_name)
+        old_path = os.path.join(self.snapshot_dir, f".{table_name}-{uuid.uuid4().hex}.old")
+        if os.path.exists(path):
+            os.rename(path, old_path)
+        os.rename(self.table_path(source_name), path)
+        shutil.rmtree(old_path, ignore_errors=True)
+        self.update_manifest(table_name, self.read_manifest().get(source_name))
+        self.update_manifest(source_name, None)
+        print(f"Snapshot of '{table_name}' replaced by '{source_name}'")
+
+    def read_table(self, table_name, columns=None):
+        '''
+        The method 'read_table' reads the snapshot of a table as an Arrow table. The files are memory mapped,
+        so the data is read from the page cache without being copied. The partition columns are read from
+        the directory names as text (a missing value is written as '__HIVE_DEFAULT_PARTITION__' and read
+        back as null) instead of inferred dictionary columns, which cannot hold nulls, and the columns are
+        put back in the order of the manifest.
+
+            Parameters:
+                    table_name(String): The name of the table
+                    columns(List): The columns to read, all by default
+
+            Returns:
+                    table(pyarrow.Table): The snapshot of the table
+        '''
+        partition_columns = PARTITION_COLUMNS.get(table_name)
+        partitioning = None
+        if partition_columns:
+            partitioning = ds.partitioning(pa.schema([(column, pa.string()) for column in partition_columns]), 
+                                           flavor='hive')
+        table = pq.read_table(self.table_path(table_name), columns=columns, memory_map=True, 
+                              partitioning=partitioning)
+        order = columns or list(self.read_manifest().get(table_name, {}).get('schema', {}))
+        if set(order) == set(table.column_names):
+            table = table.select(order)
+        return table
+
+    def read(self, table_name, columns=None):
+        '''
+        The method 'read' reads the snapshot of a table as a dataframe. The partition columns are cast back
+        to the dtypes recorded in the manifest, so the dataframe has the schema of the table which was
+        written.
+
+            Parameters:
+                    table_name(String): The name of the table
+                    columns(List): The columns to read, all by default
+
+            Returns:
+                    df(Dataframe): The snapshot of the table
+        '''
+        df = self.read_table(table_name, columns).to_pandas()
+        schema = self.read_manifest().get(table_name, {}).get('schema', {})
+        for column in PARTITION_COLUMNS.get(table_name, []):
+            if column in df.columns and column in schema:
+                df[column] = df[column].astype(schema[column])
+        return df
+
+    def read_manifest(self):
+        '''
+        The method 'read_manifest' returns the manifest of the snapshots.
+
+            Parameters:
+                    None
+
+            Returns:
+                    manifest(Dictionary): The entry of each table, with its rows, schema and time
+        '''
+        manifest_path = os.path.join(self.snapshot_dir, 'manifest.json')
+        if not os.path.exists(manifest_path):
+            return {}
+        with open(manifest_path, 'r') as file:
+            return json.load(file)
+
+    def update_manifest(self, table_name, entry):
+        '''
+        The method 'update_manifest' records the snapshot of a table in the manifest. The manifest is
+        written to a temporary file which then replaces the old one.
+
+            Parameters:
+                    table_name(String): The name of the table
+                    entry(Dictionary): The rows, schema and time of the snapshot, None removes the table
+
+            Returns:
+                    None
+        '''
+        with self.lock:
+            manifest = self.read_manifest()
+            if entry is None:
+                manifest.pop(table_name, None)
+            else:
+                manifest[table_name] = entry
+            fd, temp_path = tempfile.mkstemp(dir=self.snapshot_dir, suffix='.json')
+            with os.fdopen(fd, 'w') as file:
+                json.dump(manifest, file, indent=4)
+            os.replace(temp_path, os.path.join(self.snapshot_dir, 'manifest.json'))
@@ -0,0 +1,433 @@
+from data_cleaning import CARD_PROVIDER_RULES, LUHN_DOUBLED
+import numpy as np
+import pandas as pd
+
+# The date formats found in the source tables, see 'DATE_FORMATS' of 'data_cleaning.py'
+SOURCE_DATE_FORMATS = ['%Y-%m-%d', '%Y %B %d', '%B %Y %d', '%Y/%m/%d']
+
+COUNTRIES = {'GB': 'United Kingdom', 'DE': 'Germany', 'US': 'United States'}
+FIRST_NAMES = ['Sigfried', 'Guy', 'Harry', 'Darren', 'Garry', 'Maria', 'Anna', 'Lena', 'Chloe', 'Oliver']
+LAST_NAMES = ['Noack', 'Allen', 'Lawrence', 'Hussain', 'Stone', 'Schmidt', 'Smith', 'Johnson', 'Evans']
+CARD_PROVIDERS = {
+    'VISA 16 digit': 16,
+    'VISA 13 digit': 13,
+    'VISA 19 digit': 19,
+    'Mastercard': 16,
+    'American Express': 15,
+    'Discover': 16,
+    'JCB 16 digit': 16,
+    'JCB 15 digit': 15,
+    'Diners Club / Carte Blanche': 14,
+    'Maestro': 12
+    }
+STORE_TYPES = ['Local', 'Super Store', 'Mall Kiosk', 'Outlet']
+CONTINENTS = {'GB': 'Europe', 'DE': 'Europe', 'US': 'America'}
+CATEGORIES = ['toys-and-games', 'sports-and-leisure', 'pets', 'homeware', 'health-and-beauty', 'food-and-drink',
+              'diy']
+TIME_PERIODS = ['Morning', 'Midday', 'Evening', 'Late_Hours']
+
+class SyntheticDataGenerator():
+    '''
+    The class 'SyntheticDataGenerator' generates the source tables of the pipeline with the same columns and
+    the same dirty values as the real sources, so the extract, clean and upload steps can be benchmarked at
+    any scale without access to the sources. The values are drawn with vectorized NumPy operations, so
+    millions of rows are generated in seconds, and the same seed always gives the same tables.
+
+    The dirty values are those handled by 'DataCleaning': 'GGB' country codes, 'NULL' rows and junk rows of
+    random letters, phone numbers with '+44', brackets, hyphens and extensions, dates in the four source
+    formats, '?' in card numbers, letters in staff numbers, 'ee'-prefixed continents, prices without '£',
+    multipack ('3 x 200g'), 'oz', 'ml' and trailing-dot weights and junk months.
+
+    Attributes
+    ----------
+    seed(Int): The seed of the random generator
+    junk_fraction(Float): The fraction of rows which are junk or 'NULL' rows
+    rng(numpy.random.Generator): The random generator
+
+    Methods
+    -------
+    choice(self, values, rows)
+    uuids(self, rows)
+    digits(self, rows, lengths, matrix)
+    card_numbers(self, card_provider)
+    junk(self, rows, length)
+    dates(self, rows, start, end, formats)
+    dirty_rows(self, df, columns)
+    users(self, rows)
+    card_details(self, rows)
+    store_details(self, rows)
+    products(self, rows)
+    orders(self, rows, users, cards, stores, products, date_times)
+    date_times(self, rows)
+    tables(self, rows)
+    '''
+
+    def __init__(self, seed=0, junk_fraction=0.01):
+        self.seed = seed
+        self.junk_fraction = junk_fraction
+        self.rng = np.random.default_rng(seed)
+
+    def choice(self, values, rows):
+        '''
+        The method 'choice' draws values from a list.
+
+            Parameters:
+                    values(List): The values to draw from
+                    rows(Int): The number of values
+
+            Returns:
+                    values(numpy.ndarray): The values drawn
+        '''
+        return np.asarray(values, dtype=object)[self.rng.integers(0, len(values), rows)]
+
+    def uuids(self, rows):
+        '''
+        The method 'uuids' generates random UUID strings.
+
+            Parameters:
+                    rows(Int): The number of UUIDs
+
+            Returns:
+                    uuids(Series): The UUIDs in the canonical 8-4-4-4-12 form
+        '''
+        hex_digits = pd.Series(np.frombuffer(self.rng.bytes(16 * rows).hex().encode(), dtype='S32').astype(str))
+        return (hex_digits.str[:8] + '-' + hex_digits.str[8:12] + '-' + hex_digits.str[12:16] + '-'
+                + hex_digits.str[16:20] + '-' + hex_digits.str[20:])
+
+    def digits(self, rows, lengths, matrix=None):
+        '''
+        The method 'digits' generates random strings of digits.
+
+            Parameters:
+                    rows(Int): The number of strings
+                    lengths(numpy.ndarray): The length of each string, at most 19
+                    matrix(numpy.ndarray): The digits of each string (uint8, one row per string), random 
+                                           digits without a leading zero by default
+
+            Returns:
+                    digits(Series): The strings of digits
+        '''
+        if matrix is None:
+            matrix = self.rng.integers(0, 10, (rows, 19), dtype=np.uint8)
+            matrix[:, 0] = self.rng.integers(1, 10, rows) # No leading zero
+        matrix = matrix + ord('0')
+        digits = np.empty(rows, dtype=object)
+        for length in np.unique(lengths):
+            mask = lengths == length
+            digits[mask] = np.ascontiguousarray(matrix[mask, :length]).view(f'S{length}').ravel().astype(str)
+        return pd.Series(digits)
+
+    def card_numbers(self, card_provider):
+        '''
+        The method 'card_numbers' generates card numbers with the prefix and length of their provider (see 
+        'CARD_PROVIDER_RULES') and a valid Luhn check digit, except for 0.5% of them which are mistyped.
+
+            Parameters:
+                    card_provider(numpy.ndarray): The provider of each card
+
+            Returns:
+                    card_number(Series): The card numbers
+        '''
+        rows = len(card_provider)
+        lengths = pd.Series(card_provider).map(CARD_PROVIDERS).to_numpy()
+        matrix = self.rng.integers(0, 10, (rows, 19), dtype=np.uint8)
+        for provider, (prefixes, _) in CARD_PROVIDER_RULES.items():
+            prefix = prefixes[0].partition('-')[0]
+            matrix[card_provider == provider, :len(prefix)] = np.frombuffer(prefix.encode(), dtype=np.uint8) - ord('0')
+
+        # The check digit makes the Luhn sum of every number a multiple of 10
+        columns, last, row_numbers = np.arange(19), lengths - 1, np.arange(rows)
+        matrix[columns[None, :] >= last[:, None]] = 0
+        doubled = (columns & 1)[None, :] != (last & 1)[:, None]
+        total = np.where(doubled, LUHN_DOUBLED[matrix], matrix).sum(axis=1)
+        matrix[row_numbers, last] = (10 - total % 10) % 10
+        mistyped = self.rng.random(rows) < 0.005
+        matrix[row_numbers[mistyped], last[mistyped]] = (matrix[row_numbers[mistyped], last[mistyped]] + 1) % 10
+        return self.digits(rows, lengths, matrix)
+
+    def junk(self, rows, length=10):
+        '''
+        The method 'junk' generates random strings of capital letters and digits, like the junk rows of the
+        sources (e.g. 'I7G4DMDZOZ').
+
+            Parameters:
+                    rows(Int): The number of strings
+                    length(Int): The length of each string
+
+            Returns:
+                    junk(numpy.ndarray): The strings
+        '''
+        alphabet = np.frombuffer(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789', dtype=np.uint8)
+        matrix = alphabet[self.rng.integers(0, len(alphabet), (rows, length))]
+        return matrix.view(f'S{length}').ravel().astype(str).astype(object)
+
+    def dates(self, rows, start='1940-01-01', end='2022-12-31', formats=SOURCE_DATE_FORMATS):
+        '''
+        The method 'dates' generates random dates written in a random format from a list.
+
+            Parameters:
+                    rows(Int): The number of dates
+                    start(String): The earliest date
+                    end(String): The latest date
+                    formats(List): The formats to write the dates in
+
+            Returns:
+                    dates(Series): The formatted dates
+        '''
+        start, end = np.datetime64(start, 'D'), np.datetime64(end, 'D')
+        days = self.rng.integers(0, (end - start).astype(int), rows)
+        dates = pd.Series(pd.to_datetime(start + days.astype('timedelta64[D]')))
+        formatted = pd.Series(index=dates.index, dtype=object)
+        # Most dates use the first format, as in the sources
+        weights = np.full(len(formats), 0.15 / max(len(formats) - 1, 1))
+        weights[0] = 0.85 if len(formats) > 1 else 1.0
+        date_format = self.rng.choice(len(formats), rows, p=weights)
+        for number, form in enumerate(formats):
+            mask = date_format == number
+            formatted[mask] = dates[mask].dt.strftime(form)
+        return formatted
+
+    def dirty_rows(self, df, columns=None):
+        '''
+        The method 'dirty_rows' turns a fraction of the rows into 'NULL' rows and junk rows (every column
+        filled with random letters), as found in the sources.
+
+            Parameters:
+                    df(Dataframe): The generated table
+                    columns(List): The columns to dirty, all but 'index' by default
+
+            Returns:
+                    df(Dataframe): The table with the dirty rows
+        '''
+        columns = columns or [column for column in df.columns if column != 'index']
+        dirty = self.rng.random(len(df)) < self.junk_fraction
+        nulls = dirty & (self.rng.random(len(df)) < 0.3)
+        junk = dirty & ~nulls
+        df.loc[nulls, columns] = 'NULL'
+        for column in columns:
+            df.loc[junk, column] = self.junk(int(junk.sum()))
+        return df
+
+    def users(self, rows):
+        '''
+        The method 'users' generates the 'legacy_users' table.
+
+            Parameters:
+                    rows(Int): The number of rows
+
+            Returns:
+                    df_user(Dataframe): The users
+        '''
+        country_code = self.choice(list(COUNTRIES), rows)
+        phone_patterns = self.rng.integers(0, 5, rows)
+        local_number = self.digits(rows, np.full(rows, 10))
+        phone_number = np.select(
+            [phone_patterns == 0, phone_patterns == 1, phone_patterns == 2, phone_patterns == 3],
+            ['+44(0)' + local_number.str[:4] + ' ' + local_number.str[4:],
+             '(0' + local_number.str[:3] + ') ' + local_number.str[3:6] + ' ' + local_number.str[6:],
+             '+49-' + local_number.str[:3] + '-' + local_number.str[3:],
+             '001-' + local_number.str[:3] + '-' + local_number.str[3:6] + '-' + local_number.str[6:] + 'x'
+             + local_number.str[:3]],
+            '0' + local_number
+            )
+        df_user = pd.DataFrame({
+            'index': np.arange(rows),
+            'first_name': self.choice(FIRST_NAMES, rows),
+            'last_name': self.choice(LAST_NAMES, rows),
+            'date_of_birth': self.dates(rows, '1940-01-01', '2006-12-31'),
+            'company': self.choice(['Hendriks Kuhl GmbH', 'Allen-Stone', 'Lawrence Ltd'], rows),
+            'email_address': self.choice(['a@example.com', 'b@example.org'], rows),
+            'address': self.choice(['Studio 22a\nLynne Hill\nNew Cheryl', 'Heinz-Georg-Ring 8/1, 19609 Rosenheim'],
+                                   rows),
+            'country': pd.Series(country_code).map(COUNTRIES).to_numpy(),
+            'country_code': np.where(self.rng.random(rows) < 0.01, 'GGB', country_code).astype(object),
+            'phone_number': phone_number,
+            'join_date': self.dates(rows, '1992-01-01', '2022-12-31'),
+            'user_uuid': self.uuids(rows)
+            })
+        return self.dirty_rows(df_user)
+
+    def card_details(self, rows):
+        '''
+        The method 'card_details' generates the table of the card details PDF.
+
+            Parameters:
+                    rows(Int): The number of rows
+
+            Returns:
+                    df_card(Dataframe): The card details
+        '''
+        card_provider = self.choice(list(CARD_PROVIDERS), rows)
+        card_number = self.card_numbers(card_provider)
+        question_marks = self.rng.random(rows) < 0.01
+        card_number[question_marks] = '???' + card_number[question_marks]
+        month = pd.Series(self.rng.integers(1, 13, rows)).astype(str).str.zfill(2)
+        year = pd.Series(self.rng.integers(22, 32, rows)).astype(str)
+        df_card = pd.DataFrame({
+            'card_number': card_number,
+            'expiry_date': month + '/' + year,
+            'card_provider': card_provider,
+            'date_payment_confirmed': self.dates(rows, '1990-01-01', '2022-12-31', ['%Y-%m-%d'])
+            })
+        return self.dirty_rows(df_card)
+
+    def store_details(self, rows):
+        '''
+        The method 'store_details' generates the table returned by the store API, with the web portal as its
+        first store.
+
+            Parameters:
+                    rows(Int): The number of rows
+
+            Returns:
+                    df_stores(Dataframe): The stores
+        '''
+        country_code = self.choice(list(COUNTRIES), rows)
+        continent = pd.Series(country_code).map(CONTINENTS)
+        prefixed = self.rng.random(rows) < 0.05
+        continent[prefixed] = 'ee' + continent[prefixed]
+        staff_numbers = pd.Series(self.rng.integers(1, 100, rows)).astype(str)
+        lettered = self.rng.random(rows) < 0.01
+        staff_numbers[lettered] = staff_numbers[lettered].str[0] + 'n' + staff_numbers[lettered].str[1:]
+        store_code = pd.Series(self.choice(['HA', 'BL', 'LO', 'MU', 'NY'], rows)) + '-' \
+            + pd.Series(self.uuids(rows)).str[:8].str.upper()
+        df_stores = pd.DataFrame({
+            'index': np.arange(rows),
+            'address': self.choice(['Flat 72W\nSally isle\nEast Deantown\nE7B 8EB, High Wycombe',
+                                    'Heckerstraße 4/5\n50491 Säckingen, Landshut'], rows),
+            'longitude': np.round(self.rng.uniform(-180, 180, rows), 5).astype(str).astype(object),
+            'lat': np.full(rows, None, dtype=object),
+            'locality': self.choice(['High Wycombe', 'Landshut', 'Chapletown', 'Belper', 'Rutherglen'], rows),
+            'store_code': store_code,
+            'staff_numbers': staff_numbers,
+            'opening_date': self.dates(rows, '1990-01-01', '2022-12-31'),
+            'store_type': self.choice(STORE_TYPES, rows),
+            'latitude': np.round(self.rng.uniform(-90, 90, rows), 5).astype(str).astype(object),
+            'country_code': country_code,
+            'continent': continent
+            })
+        df_stores.loc[0] = [0, None, None, None, None, 'WEB-1388012W', '325', '2010-06-12', 'Web Portal', None,
+                            'GB', 'Europe']
+        return self.dirty_rows(df_stores)
+
+    def products(self, rows):
+        '''
+        The method 'products' generates 'products.csv' as read from S3.
+
+            Parameters:
+                    rows(Int): The number of rows
+
+            Returns:
+                    df_products(Dataframe): The products
+        '''
+        value = self.rng.integers(1, 1000, rows)
+        unit = self.choice(['g', 'kg', 'ml', 'oz'], rows)
+        weight = pd.Series(value).astype(str) + pd.Series(unit)
+        multipack = self.rng.random(rows) < 0.05
+        # The multipacks of the source are weighed in grams
+        weight[multipack] = pd.Series(self.rng.integers(2, 13, rows)).astype(str)[multipack] + ' x ' \
+            + pd.Series(value).astype(str)[multipack] + 'g'
+        trailing_dot = self.rng.random(rows) < 0.01
+        weight[trailing_dot] = weight[trailing_dot] + ' .'
+        price = pd.Series(np.round(self.rng.uniform(0.5, 1000, rows), 2)).map('{:.2f}'.format)
+        df_products = pd.DataFrame({
+            'Unnamed: 0': np.arange(rows),
+            'product_name': self.choice(['FurReal Dazzlin Dimples', 'Tommee Tippee Bottle', 'Fish Oil 60 Caps'], 
+                                        rows),
+            'product_price': '£' + price,
+            'weight': weight,
+            'category': self.choice(CATEGORIES, rows),
+            'EAN': self.digits(rows, np.full(rows, 13)),
+            'date_added': self.dates(rows, '2000-01-01', '2022-12-31'),
+            'uuid': self.uuids(rows),
+            'removed': self.choice(['Still_avaliable', 'Still_avaliable', 'Still_avaliable', 'Removed'], rows),
+            'product_code': pd.Series(self.choice(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'), rows))
+                            + pd.Series(self.rng.integers(0, 10, rows)).astype(str) + '-'
+                            + pd.Series(self.rng.integers(1000000, 9999999, rows)).astype(str)
+                            + pd.Series(self.choice(list('abcdefghijklmnopqrstuvwxyz'), rows))
+            })
+        return self.dirty_rows(df_products, ['product_name', 'product_price', 'weight', 'category', 'EAN',
+                                             'date_added', 'uuid', 'removed', 'product_code'])
+
+    def orders(self, rows, users=None, cards=None, stores=None, products=None, date_times=None):
+        '''
+        The method 'orders' generates the 'orders_table'. When the dimension tables are given, the keys of
+        the orders are drawn from them, so the orders can be joined to the dimensions.
+
+            Parameters:
+                    rows(Int): The number of rows
+                    users(Dataframe): The generated users
+                    cards(Dataframe): The generated card details
+                    stores(Dataframe): The generated stores
+                    products(Dataframe): The generated products
+                    date_times(Dataframe): The generated dates
+
+            Returns:
+                    df_orders(Dataframe): The orders
+        '''
+        def keys(df, column, generate):
+            if df is None:
+                return generate(rows)
+            return self.choice(df[column].to_numpy(), rows)
+
+        df_orders = pd.DataFrame({
+            'level_0': np.arange(rows),
+            'index': np.arange(rows),
+            'date_uuid': keys(date_times, 'date_uuid', self.uuids),
+            'first_name': None,
+            'last_name': None,
+            'user_uuid': keys(users, 'user_uuid', self.uuids),
+            'card_number': keys(cards, 'card_number', lambda rows: self.digits(rows, np.full(rows, 16))),
+            'store_code': keys(stores, 'store_code', lambda rows: self.junk(rows, 12)),
+            'product_code': keys(products, 'product_code', lambda rows: self.junk(rows, 11)),
+            '1': None,
+            'product_quantity': self.rng.integers(1, 14, rows)
+            })
+        return df_orders
+
+    def date_times(self, rows):
+        '''
+        The method 'date_times' generates the table of 'date_details.json'.
+
+            Parameters:
+                    rows(Int): The number of rows
+
+            Returns:
+                    df_events_data(Dataframe): The dates of the sales
+        '''
+        seconds = self.rng.integers(0, 24 * 60 * 60, rows)
+        timestamp = (pd.Series(seconds // 3600).astype(str).str.zfill(2) + ':'
+                     + pd.Series(seconds // 60 % 60).astype(str).str.zfill(2) + ':'
+                     + pd.Series(seconds % 60).astype(str).str.zfill(2))
+        df_events_data = pd.DataFrame({
+            'timestamp': timestamp,
+            'month': pd.Series(self.rng.integers(1, 13, rows)).astype(str),
+            'year': pd.Series(self.rng.integers(1992, 2023, rows)).astype(str),
+            'day': pd.Series(self.rng.integers(1, 29, rows)).astype(str),
+            'time_period': self.choice(TIME_PERIODS, rows),
+            'date_uuid': self.uuids(rows)
+            })
+        return self.dirty_rows(df_events_data)
+
+    def tables(self, rows):
+        '''
+        The method 'tables' generates every source table, with the orders drawing their keys from the
+        dimensions. The dimension tables are smaller than the orders, as in the sources.
+
+            Parameters:
+                    rows(Int): The number of orders
+
+            Returns:
+                    tables(Dictionary): The tables, keyed by the name of their 'clean_*' method
+        '''
+        dimension_rows = max(rows // 10, 10)
+        tables = {
+            'users': self.users(dimension_rows),
+            'card_details': self.card_details(dimension_rows),
+            'store_details': self.store_details(max(rows // 1000, 10)),
+            'products': self.products(max(rows // 100, 10)),
+            'date_times': self.date_times(rows)
+            }
+        tables['orders'] = self.orders(rows, tables['users'], tables['card_details'], tables['store_details'],
+                                       tables['products'], tables['date_times'])
+        return tables
@@ -0,0 +1,23 @@
+import os
+import pytest
+import sys
+
+# The modules of the pipeline are imported from the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic_data import SyntheticDataGenerator
+
+@pytest.fixture
+def s3_products(monkeypatch):
+    # A bucket of the in-process moto S3 mock holding a products CSV, skipped if moto is not installed
+    moto = pytest.importorskip('moto')
+    import boto3
+    for variable, value in {'AWS_ACCESS_KEY_ID': 'test', 'AWS_SECRET_ACCESS_KEY': 'test', 
+                            'AWS_DEFAULT_REGION': 'eu-west-1'}.items():
+        monkeypatch.setenv(variable, value)
+    monkeypatch.delenv('AWS_ENDPOINT_URL_S3', raising=False)
+    with moto.mock_aws():
+        s3 = boto3.client('s3')
+        s3.create_bucket(Bucket='products', CreateBucketConfiguration={'LocationConstraint': 'eu-west-1'})
+        s3.put_object(Bucket='products', Key='products.csv', Body=SyntheticDataGenerator(0).products(50).to_csv().encode())
+        yield 's3://products/products.csv'
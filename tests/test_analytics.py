@@ -0,0 +1,33 @@
+import os
+import sys
+
+# The modules of the pipeline are imported from the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analytics import AnalyticsEngine, SCENARIOS, results_equal
+from snapshot_store import SnapshotStore
+import json
+import pandas as pd
+import pytest
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return json.load(f)
+
+@pytest.fixture(scope='module')
+def snapshots(tmp_path_factory):
+    # The orders include a sale without a timestamp, a product and a store which are not in their tables
+    snapshots = SnapshotStore(str(tmp_path_factory.mktemp('snapshots')))
+    for table_name, table in load_fixture('analytics_tables.json').items():
+        df = pd.DataFrame(table['data'], columns=table['columns'])
+        if table_name == 'dim_date_times':
+            df['sale_timestamp'] = pd.to_datetime(df['sale_timestamp'], utc=True)
+        snapshots.write(df, table_name)
+    return snapshots
+
+@pytest.mark.parametrize('scenario', list(SCENARIOS))
+def test_scenario_returns_the_expected_rows(snapshots, scenario):
+    expected = load_fixture('analytics_expected.json')[scenario]
+    df = AnalyticsEngine(snapshots).run(scenario)
+    assert results_equal(df, pd.DataFrame(expected['data'], columns=expected['columns']))
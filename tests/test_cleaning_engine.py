@@ -0,0 +1,61 @@
+import os
+import sys
+
+# The modules of the pipeline are imported from the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_cleaning import DataCleaning
+import datetime
+import json
+import numpy as np
+import pandas as pd
+import pytest
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# The expected outputs are those of the clean_* methods before the rules, except for the later changes: the 
+# dates in every source format are parsed, the stores and products get typed columns ('staff_numbers', 
+# 'product_price', 'weight', 'still_available', 'weight_class') and the dates get the sale timestamp and its
+# calendar columns
+CLEAN_METHODS = {
+    'users': ['clean_user_data'],
+    'card_details': ['clean_card_data'],
+    'store_details': ['clean_store_data'],
+    'products': ['clean_products_data', 'convert_product_weights'],
+    'orders': ['clean_orders_data'],
+    'date_times': ['clean_event_data']
+    }
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return json.load(f)
+
+def frame(table):
+    return pd.DataFrame(table['data'], index=table['index'], columns=table['columns'])
+
+def value(x):
+    if isinstance(x, (pd.Timestamp, datetime.time)):
+        return x.isoformat()
+    if x is None or x is pd.NA or x is pd.NaT or (isinstance(x, float) and np.isnan(x)):
+        return None
+    return x.item() if isinstance(x, np.generic) else x
+
+def records(df):
+    return {'columns': list(df.columns), 'index': [int(label) for label in df.index],
+            'data': [[value(x) for x in row] for row in df.itertuples(index=False)]}
+
+@pytest.mark.parametrize('table_name', list(CLEAN_METHODS))
+def test_rules_reproduce_the_cleaned_tables(table_name):
+    df = frame(load_fixture('cleaning_inputs.json')[table_name])
+    df_input = df.copy()
+    data_cleaner = DataCleaning()
+    cleaned = df
+    for method in CLEAN_METHODS[table_name]:
+        cleaned = getattr(data_cleaner, method)(cleaned)
+    assert records(cleaned) == load_fixture('cleaning_expected.json')[table_name]
+    pd.testing.assert_frame_equal(df, df_input) # The input is not modified
+
+def test_clean_user_data_matches_the_golden_file():
+    # GGB country codes, '+44(0)' and bracketed phone numbers (the brackets are kept), hyphens, dots, spaces and
+    # extensions, and dates in each of 'DATE_FORMATS' or in none of them
+    df_user = frame(load_fixture('users_input.json'))
+    assert records(DataCleaning().clean_user_data(df_user)) == load_fixture('users_expected.json')
@@ -0,0 +1,67 @@
+from data_cleaning import DataCleaning, validate_card_numbers
+from synthetic_data import SyntheticDataGenerator
+import data_cleaning
+import pandas as pd
+import pytest
+
+@pytest.fixture(scope='module')
+def tables():
+    generator = SyntheticDataGenerator(0)
+    return {'clean_user_data': generator.users(4000), 'clean_card_data': generator.card_details(4000),
+            'clean_store_data': generator.store_details(4000), 'clean_products_data': generator.products(4000),
+            'clean_event_data': generator.date_times(4000)}
+
+@pytest.mark.parametrize('backend', ['pandas', 'pyarrow'])
+def test_sharded_cleaning_matches_the_serial_cleaning(tables, backend, monkeypatch):
+    monkeypatch.setattr(data_cleaning, 'MIN_SHARD_ROWS', 1000)
+    serial, sharded = DataCleaning(backend), DataCleaning(backend, workers=2)
+    try:
+        for clean_method, df in tables.items():
+            expected = getattr(serial, clean_method)(df.copy())
+            result = getattr(sharded, clean_method)(df.copy())
+            pd.testing.assert_frame_equal(result, expected, obj=clean_method)
+    finally:
+        sharded.close_workers()
+
+def test_cleaning_leaves_the_input_unchanged(tables):
+    # The benchmarks give every run the same table
+    data_cleaner = DataCleaning()
+    for clean_method, df in tables.items():
+        expected = df.copy()
+        getattr(data_cleaner, clean_method)(df)
+        pd.testing.assert_frame_equal(df, expected, obj=clean_method)
+
+# Published test card numbers, and numbers which fail each check
+CARD_NUMBERS = [
+    ('4111111111111111', 'VISA 16 digit', 'valid'),
+    ('4222222222222', 'VISA 13 digit', 'valid'),
+    ('5555555555554444', 'Mastercard', 'valid'),
+    ('2221000000000009', 'Mastercard', 'valid'),
+    ('378282246310005', 'American Express', 'valid'),
+    ('6011111111111117', 'Discover', 'valid'),
+    ('3530111333300000', 'JCB 16 digit', 'valid'),
+    ('30569309025904', 'Diners Club / Carte Blanche', 'valid'),
+    ('6759649826438453', 'Maestro', 'valid'),
+    ('060412345674', 'Maestro', 'prefix'), # No Maestro number starts with '0604'
+    ('5105105105105100', 'VISA 16 digit', 'prefix'),
+    ('4111111111111112', 'VISA 16 digit', 'luhn'),
+    ('411111111111', 'VISA 16 digit', 'length'),
+    ('41111111111111111111', 'VISA 19 digit', 'length'),
+    ('4111-1111-1111-1111', 'VISA 16 digit', 'not_digits'),
+    (None, 'VISA 16 digit', 'missing'),
+    ('4111111111111111', 'Unknown', 'unknown_provider')
+    ]
+
+def test_validate_card_numbers_gives_the_first_failing_reason():
+    card_number, card_provider, expected = (pd.Series(column) for column in zip(*CARD_NUMBERS))
+    valid, reasons = validate_card_numbers(card_number, card_provider)
+    assert reasons.astype(str).tolist() == expected.tolist()
+    assert valid.tolist() == (expected == 'valid').tolist()
+
+def test_convert_product_weights_leaves_the_input_unchanged():
+    df_products = pd.DataFrame({'weight': ['3 x 200g', '1.5kg', '400ml', '16oz', 'unknown']})
+    df_converted = DataCleaning().convert_product_weights(df_products)
+    assert df_products['weight'].tolist() == ['3 x 200g', '1.5kg', '400ml', '16oz', 'unknown']
+    assert df_converted['weight'].tolist()[:4] == [0.6, 1.5, 0.4, 0.454]
+    assert df_converted['weight_class'].tolist()[:4] == ['Light'] * 4
+    assert df_converted.loc[4, ['weight', 'weight_class']].isna().all()
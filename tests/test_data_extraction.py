@@ -0,0 +1,66 @@
+from benchmark import LocalHTTPServer
+from data_extraction import DataExtractor
+from extraction_cache import ExtractionCache
+import json
+import pandas as pd
+import pytest
+
+def store(number):
+    return {'index': number, 'address': f'{number} High Street', 'longitude': '-0.74934', 'lat': None,
+            'locality': 'High Wycombe', 'store_code': f'HI-{number:08d}', 'staff_numbers': '34',
+            'opening_date': '1996-10-25', 'store_type': 'Local', 'latitude': '51.62907', 'country_code': 'GB',
+            'continent': 'Europe'}
+
+def test_stores_are_retried_and_returned_in_store_order(tmp_path):
+    routes = {f'/store_details/{number}': json.dumps(store(number)).encode() for number in range(8)}
+    # The first store only succeeds on its third request, so it arrives after the others
+    routes['/store_details/0'] = [503, 429, routes['/store_details/0']]
+    routes['/store_details/5'] = [500] # Still failing once the retries are used up
+    server = LocalHTTPServer(routes).start()
+    try:
+        extractor = DataExtractor(ExtractionCache(str(tmp_path)))
+        retrieve = lambda: extractor.retrieve_stores_data(f"{server.url}/store_details", {}, 8, max_workers=4, 
+                                                          max_retries=3, backoff_factor=0)
+        df_stores = retrieve()
+        assert df_stores['index'].tolist() == list(range(8))
+        assert df_stores['store_code'].isna().tolist() == [number == 5 for number in range(8)]
+        assert df_stores['store_code'].dropna().tolist() == [f'HI-{number:08d}' for number in range(8) if number != 5]
+        assert server.requests['/store_details/0'] == 3
+        assert server.requests['/store_details/5'] == 4 # The first request and 3 retries
+
+        # The stores are not cached while one of them is missing, so they are all requested again
+        routes['/store_details/5'] = json.dumps(store(5)).encode()
+        assert retrieve()['store_code'].tolist() == [f'HI-{number:08d}' for number in range(8)]
+        assert server.requests['/store_details/1'] == 2
+
+        # Every store was retrieved, so the next call is answered from the cache
+        assert retrieve()['store_code'].tolist() == [f'HI-{number:08d}' for number in range(8)]
+        assert server.requests['/store_details/1'] == 2
+    finally:
+        server.stop()
+
+def test_pdf_pool_is_replaced_when_the_number_of_workers_changes(tmp_path):
+    extractor = DataExtractor(ExtractionCache(str(tmp_path)))
+    try:
+        pool = extractor.pdf_pool(2)
+        assert extractor.pdf_pool(2) is pool
+        resized = extractor.pdf_pool(3)
+        assert resized is not pool and extractor.pdf_workers == 3
+        with pytest.raises(RuntimeError): # The previous pool was shut down
+            pool.submit(int)
+    finally:
+        extractor.close_pdf_workers()
+
+def test_s3_chunks_and_ranged_parts_match_the_whole_file(tmp_path, s3_products):
+    extractor = DataExtractor(ExtractionCache(str(tmp_path)))
+    df_products = extractor.extract_from_s3(s3_products)
+    assert len(df_products) == 50
+
+    df_chunks = list(extractor.extract_from_s3_in_chunks(s3_products, chunksize=16))
+    assert [len(df_chunk) for df_chunk in df_chunks] == [16, 16, 16, 2]
+    pd.testing.assert_frame_equal(pd.concat(df_chunks), df_products)
+
+    # Parts of 1000 bytes, so the object is downloaded with several ranged requests
+    df_parts = pd.concat(extractor.extract_from_s3_in_chunks(s3_products, chunksize=16, parallel_parts=True, 
+                                                             part_size=1000))
+    pd.testing.assert_frame_equal(df_parts, df_products)
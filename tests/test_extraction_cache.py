@@ -0,0 +1,80 @@
+from benchmark import LocalHTTPServer
+from data_extraction import DataExtractor
+from extraction_cache import ExtractionCache
+from synthetic_data import SyntheticDataGenerator
+import collections
+import json
+import os
+import pandas as pd
+import pytest
+import tempfile
+
+def test_evict_removes_whole_entries_and_skips_temp_files(tmp_path):
+    cache = ExtractionCache(str(tmp_path), max_size=0)
+    pdf_path = cache.path('https://example.com/card_details.pdf', suffix='.pdf')
+    with open(pdf_path, 'wb') as file:
+        file.write(b'%PDF')
+    fd, temp_path = tempfile.mkstemp(dir=cache.temp_dir)
+    os.close(fd)
+    other_path = os.path.join(cache.cache_dir, 'notes.txt')
+    open(other_path, 'w').close()
+
+    # The downloaded file has no '.json' yet, so it is not a complete entry
+    cache.evict()
+    assert os.path.exists(pdf_path)
+
+    with open(pdf_path + '.json', 'w') as file:
+        file.write('{}')
+    cache.save_frame('s3://bucket/products.csv', 'etag', pd.DataFrame({'a': [1, 2]}))
+    assert not os.path.exists(pdf_path) and not os.path.exists(pdf_path + '.json')
+    assert cache.load_frame('s3://bucket/products.csv', 'etag') is None
+    assert os.path.exists(temp_path) and os.path.exists(other_path)
+
+@pytest.mark.parametrize('etag', [True, False])
+def test_cached_api_response_is_revalidated_without_a_download(tmp_path, etag):
+    routes = {'/date_details.json': json.dumps({'timestamp': {'0': '22:00:06'}, 'month': {'0': '9'}}).encode(),
+              '/card_details.pdf': b'%PDF-1.4'}
+    server = LocalHTTPServer(routes, etag=etag).start()
+    try:
+        extractor = DataExtractor(ExtractionCache(str(tmp_path)))
+        for _ in range(2):
+            df_events = extractor.retrieve_date_events_data(f"{server.url}/date_details.json", {})
+            path, _ = extractor.cache_file(f"{server.url}/card_details.pdf", suffix='.pdf')
+        assert df_events['month'].tolist() == ['9']
+        with open(path, 'rb') as file:
+            assert file.read() == b'%PDF-1.4'
+        # The second calls only revalidate: a HEAD request for the dates and a conditional GET answered 
+        # with 304 (If-None-Match, or If-Modified-Since without an ETag) for the file
+        assert server.requests == {'/date_details.json': 3, '/card_details.pdf': 2}
+        assert server.downloads == {'/date_details.json': 1, '/card_details.pdf': 1}
+
+        if etag: # A changed response gets a new ETag, so it is downloaded again
+            routes['/date_details.json'] = json.dumps({'timestamp': {'0': '22:00:06'}, 'month': {'0': '10'}}).encode()
+            df_events = extractor.retrieve_date_events_data(f"{server.url}/date_details.json", {})
+            assert df_events['month'].tolist() == ['10']
+            assert server.downloads['/date_details.json'] == 2
+    finally:
+        server.stop()
+
+def test_cached_s3_object_is_revalidated_without_a_download(tmp_path, s3_products, monkeypatch):
+    import boto3
+    # Count the S3 operations sent by the clients the extractor creates
+    operations = collections.Counter()
+    session = boto3.Session()
+    session.events.register('before-call.s3', lambda model, **kwargs: operations.update([model.name]))
+    monkeypatch.setattr(boto3, 'client', session.client)
+
+    extractor = DataExtractor(ExtractionCache(str(tmp_path)))
+    df_products = extractor.extract_from_s3(s3_products)
+    downloads = operations['GetObject']
+    assert downloads >= 1
+    pd.testing.assert_frame_equal(extractor.extract_from_s3(s3_products), df_products)
+    assert operations['GetObject'] == downloads # Only the ETag was read again, with a HEAD request
+    assert operations['HeadObject'] >= 2
+
+    # A new version of the object has a new ETag, so it is downloaded again
+    bucket_name, key = s3_products.split('/', 3)[2:]
+    boto3.client('s3').put_object(Bucket=bucket_name, Key=key, 
+                                  Body=SyntheticDataGenerator(1).products(20).to_csv().encode())
+    assert len(extractor.extract_from_s3(s3_products)) == 20
+    assert operations['GetObject'] > downloads
@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import instrument, metrics
+import pandas as pd
+import pytest
+import time
+
+class Loader():
+
+    @instrument('upload')
+    def upload(self, df):
+        return len(df)
+
+    @instrument('upload')
+    def upsert(self, df):
+        return self.upload(df)
+
+def test_only_the_outermost_call_is_recorded():
+    records = len(metrics.records)
+    Loader().upsert(pd.DataFrame({'a': [1, 2, 3]}))
+    assert [(record['method'], record['rows_out']) for record in metrics.records[records:]] == [('upsert', 3)]
+
+class ChunkedLoader():
+
+    @instrument('extract')
+    def read(self, chunks):
+        for number in range(chunks):
+            time.sleep(0.04)
+            yield pd.DataFrame({'a': [number]})
+
+    @instrument('clean')
+    def clean(self, df_chunks):
+        for df_chunk in df_chunks:
+            time.sleep(0.02)
+            yield df_chunk
+
+    @instrument('upload')
+    def upload(self, df_chunks):
+        rows = 0
+        for df_chunk in df_chunks:
+            time.sleep(0.01)
+            rows += len(df_chunk)
+        return rows
+
+def test_resident_memory_is_sampled_around_each_call():
+    records = len(metrics.records)
+    Loader().upload(pd.DataFrame({'a': range(1000)}))
+    record = metrics.records[records]
+    if record['rss_start_mb'] is None:
+        pytest.skip('/proc/self/statm is not available')
+    assert 0 < record['rss_start_mb'] and 0 < record['rss_end_mb'] <= record['process_peak_rss_mb']
+
+def test_chained_generators_record_only_their_own_time():
+    records = len(metrics.records)
+    loader = ChunkedLoader()
+    start = time.perf_counter()
+    assert loader.upload(loader.clean(loader.read(3))) == 3
+    wall_time = time.perf_counter() - start
+    wall_times = {record['method']: record['wall_time'] for record in metrics.records[records:]}
+    assert wall_times == {'read': pytest.approx(0.12, abs=0.03), 'clean': pytest.approx(0.06, abs=0.03),
+                          'upload': pytest.approx(0.03, abs=0.03)}
+    assert sum(wall_times.values()) == pytest.approx(wall_time, abs=0.01)
+
+def test_cprofile_stages_can_run_in_threads(tmp_path):
+    def stage(name):
+        with metrics.profile(name, 'cprofile', str(tmp_path)):
+            return sum(range(100000))
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(stage, [f"stage_{number}" for number in range(4)]))
+    assert sorted(path.name for path in tmp_path.iterdir()) == [f"stage_{number}.prof" for number in range(4)]
@@ -0,0 +1,43 @@
+from integrity_check import IntegrityChecker, QUARANTINE_TABLE
+from snapshot_store import SnapshotStore
+import pandas as pd
+import pytest
+
+def orders(indexes, store_codes):
+    return pd.DataFrame({'index': indexes, 'store_code': store_codes, 'product_quantity': 1})
+
+def test_quarantined_orders_are_released_once_their_keys_arrive(tmp_path):
+    snapshots = SnapshotStore(str(tmp_path))
+    checker = IntegrityChecker(snapshots, {'dim_store_details': pd.DataFrame({'store_code': ['A', 'B']})})
+    df_orders, df_quarantine = checker.split(orders([0, 1, 2], ['A', 'C', None]))
+    assert df_orders['index'].tolist() == [0, 2] # A missing key is not an orphan
+    assert df_quarantine['orphan_keys'].tolist() == ['store_code']
+    checker.save_quarantine(df_quarantine)
+
+    # The store 'C' arrives with the next load of the stores
+    checker = IntegrityChecker(snapshots, {'dim_store_details': pd.DataFrame({'store_code': ['A', 'B', 'C']})})
+    df_released, df_quarantine = checker.recheck()
+    assert df_released['index'].tolist() == [1]
+    assert df_quarantine.empty
+    checker.save_quarantine(df_quarantine)
+    assert snapshots.read(QUARANTINE_TABLE).empty
+
+def test_overwrite_replaces_the_quarantine(tmp_path):
+    snapshots = SnapshotStore(str(tmp_path))
+    checker = IntegrityChecker(snapshots, {'dim_store_details': pd.DataFrame({'store_code': ['A']})})
+    checker.quarantine(orders([0, 1], ['B', 'C']), 'overwrite')
+    checker.quarantine(orders([0, 1], ['B', 'C']), 'overwrite')
+    assert snapshots.read(QUARANTINE_TABLE)['index'].tolist() == [0, 1]
+    checker.quarantine(orders([2], ['D']), 'append')
+    assert sorted(snapshots.read(QUARANTINE_TABLE)['index']) == [0, 1, 2]
+
+def test_failed_quarantine_write_is_raised(tmp_path):
+    snapshots = SnapshotStore(str(tmp_path))
+    checker = IntegrityChecker(snapshots, {'dim_store_details': pd.DataFrame({'store_code': ['A']})})
+    checker.save_quarantine(checker.split(orders([0], ['B']))[1])
+
+    # A column of mixed types cannot be written to Parquet
+    df_quarantine = checker.split(orders([1, 2], ['C', 'D']))[1].assign(product_quantity=[1, 'one'])
+    with pytest.raises(RuntimeError):
+        checker.save_quarantine(df_quarantine)
+    assert snapshots.read(QUARANTINE_TABLE)['index'].tolist() == [0]
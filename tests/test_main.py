@@ -0,0 +1,88 @@
+from data_cleaning import DataCleaning
+from integrity_check import IntegrityChecker
+from snapshot_store import SnapshotStore
+from synthetic_data import SyntheticDataGenerator
+import main
+import pandas as pd
+import pytest
+
+class StateConnector():
+    # Stands in for the source and local databases: the loads and the high-water marks are recorded
+    def __init__(self, high_water_marks):
+        self.high_water_marks = dict(high_water_marks)
+        self.loaded = []
+
+    def init_source_engine(self, creds_file):
+        return None
+
+    def list_db_tables(self, engine):
+        return []
+
+    def read_high_water_mark(self, table_name, target_table=None):
+        return self.high_water_marks.get(table_name)
+
+    def save_high_water_mark(self, table_name, high_water_mark):
+        self.high_water_marks[table_name] = high_water_mark
+
+    def clear_high_water_mark(self, table_name):
+        self.high_water_marks.pop(table_name, None)
+
+    def upsert_to_db(self, df, table_name, key_columns):
+        self.loaded.append(df)
+        return len(df)
+
+class DeltaExtractor():
+    def __init__(self, df_orders):
+        self.df_orders = df_orders
+
+    def read_rds_table_delta(self, table_name, engine, high_water_mark):
+        return self.df_orders[self.df_orders['index'] > high_water_mark]
+
+def test_released_orders_rebuild_the_sales_rollup(tmp_path, monkeypatch):
+    df_orders = SyntheticDataGenerator(0).orders(6)
+    stores = pd.DataFrame({'store_code': df_orders['store_code'].drop(2)})
+    snapshots = SnapshotStore(str(tmp_path))
+    monkeypatch.setattr(main, 'snapshots', snapshots)
+    monkeypatch.setattr(main, 'integrity_checker', IntegrityChecker(snapshots, {'dim_store_details': stores}))
+    connector = StateConnector({'orders_table': 1, 'sales_rollup': 1})
+
+    # The order 2 has a store which is not loaded yet, so it is quarantined and the rollup keeps its mark
+    main.orders_data(connector, DeltaExtractor(df_orders[:4]), DataCleaning(), main.creds_file)
+    assert connector.loaded[-1]['index'].tolist() == [3]
+    assert connector.high_water_marks == {'orders_table': 3, 'sales_rollup': 1}
+
+    # Once its store arrives, the order 2 is loaded below the mark of the rollup, which is cleared
+    stores = pd.DataFrame({'store_code': df_orders['store_code']})
+    monkeypatch.setattr(main, 'integrity_checker', IntegrityChecker(snapshots, {'dim_store_details': stores}))
+    main.orders_data(connector, DeltaExtractor(df_orders), DataCleaning(), main.creds_file)
+    assert connector.loaded[-1]['index'].tolist() == [2, 4, 5]
+    assert connector.high_water_marks == {'orders_table': 5}
+
+def test_chunked_load_writes_the_snapshot_and_the_mark(tmp_path, monkeypatch):
+    df_orders = SyntheticDataGenerator(0).orders(7)
+    stores = pd.DataFrame({'store_code': df_orders['store_code'].drop(2)})
+    snapshots = SnapshotStore(str(tmp_path))
+    snapshots.write(pd.DataFrame({'index': [0]}), 'orders_table') # The snapshot of an earlier load
+    monkeypatch.setattr(main, 'snapshots', snapshots)
+    monkeypatch.setattr(main, 'integrity_checker', IntegrityChecker(snapshots, {'dim_store_details': stores}))
+    connector = StateConnector({})
+    connector.upload_chunks_to_db = lambda chunks, table_name: sum(len(chunk) for chunk in chunks)
+    extractor = DeltaExtractor(df_orders)
+    extractor.read_rds_table_in_chunks = lambda table_name, engine, chunksize: (
+        df_orders[start:start + chunksize] for start in range(0, len(df_orders), chunksize))
+
+    assert main.orders_data_in_chunks(connector, extractor, DataCleaning(), main.creds_file, chunksize=3) == 6
+    assert sorted(snapshots.read('orders_table')['index']) == [0, 1, 3, 4, 5, 6]
+    assert set(snapshots.read_manifest()) == {'orders_table', 'orders_table_quarantine'}
+    assert connector.high_water_marks == {'orders_table': 6}
+
+def test_failed_extraction_fails_the_stage(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'snapshots', SnapshotStore(str(tmp_path)))
+    monkeypatch.setattr(main, 'integrity_checker', IntegrityChecker(main.snapshots))
+    connector = StateConnector({'legacy_users': 1, 'orders_table': 1})
+    extractor = DeltaExtractor(None)
+    extractor.read_rds_table_delta = lambda table_name, engine, high_water_mark: None # The extractor prints errors
+    for job in (main.user_data, main.orders_data):
+        with pytest.raises(RuntimeError):
+            job(connector, extractor, DataCleaning(), main.creds_file)
+    assert connector.high_water_marks == {'legacy_users': 1, 'orders_table': 1}
@@ -0,0 +1,38 @@
+from pipeline_runner import JOB_TABLES, PipelineRunner
+from snapshot_store import SnapshotStore
+import main
+import pandas as pd
+
+class RecordingConnector():
+    # Stands in for the database: the schema scripts do nothing and the rollup refreshes are recorded
+    def __init__(self):
+        self.full_refreshes = []
+
+    def init_local_db_engine(self):
+        return None
+
+    def run_sql_script(self, path):
+        return None
+
+    def refresh_sales_rollup(self, full_refresh=False):
+        self.full_refreshes.append(full_refresh)
+        return 0
+
+def test_rollup_is_rebuilt_only_when_the_products_change(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'snapshots', SnapshotStore(str(tmp_path)))
+    for job in JOB_TABLES:
+        monkeypatch.setattr(main, job, lambda *args: 0)
+    products = pd.DataFrame({'product_code': ['A1', 'B2'], 'product_price': [1.5, 2.0]})
+    def product_data(*args):
+        main.snapshots.write(products, 'dim_products')
+        return len(products)
+    monkeypatch.setattr(main, 'product_data', product_data)
+
+    connector = RecordingConnector()
+    runner = PipelineRunner(connector, None, None)
+    runner.run(['sales_rollup']) # The first load of the products
+    runner.run(['sales_rollup']) # The same products are loaded again
+    products.loc[0, 'product_price'] = 1.75
+    runner.run(['sales_rollup']) # A price changed
+    assert connector.full_refreshes == [True, False, True]
+    assert runner.records['sales_rollup']['status'] == 'done'
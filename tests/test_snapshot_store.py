@@ -0,0 +1,22 @@
+from data_cleaning import DataCleaning
+from snapshot_store import SnapshotStore
+from synthetic_data import SyntheticDataGenerator
+import pandas as pd
+
+def test_partitioned_snapshot_keeps_its_schema(tmp_path):
+    # The junk rows of the dates are blanked, so the partition column 'year' has nulls
+    df = DataCleaning().clean_event_data(SyntheticDataGenerator(0).date_times(2000))
+    assert df['year'].isna().any()
+    snapshots = SnapshotStore(str(tmp_path))
+    snapshots.write(df, 'dim_date_times')
+
+    df_snapshot = snapshots.read('dim_date_times')
+    assert list(df_snapshot.columns) == list(df.columns)
+    assert df_snapshot.dtypes.equals(df.dtypes)
+    expected = df.sort_values('date_uuid').reset_index(drop=True)
+    df_snapshot = df_snapshot.sort_values('date_uuid').reset_index(drop=True)
+    # The missing times of the object column 'timestamp' come back as None instead of NaT
+    expected['timestamp'] = expected['timestamp'].astype(object).where(expected['timestamp'].notna(), None)
+    pd.testing.assert_frame_equal(df_snapshot, expected)
+
+    assert snapshots.read('dim_date_times', ['year', 'date_uuid']).columns.tolist() == ['year', 'date_uuid']